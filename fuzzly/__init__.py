@@ -4,12 +4,12 @@
 __version__: str = '0.0.4'
 
 
-from typing import List
+from typing import Any, Dict, List, Optional
 
 from .api.post import FetchMyPosts, FetchPost
 from .api.tag import FetchPostTags, FetchTag
 from .client import Client
-from .models.post import Post, PostId, PostSort
+from .models.post import Post, PostCursor, PostId, PostSort
 from .models.tag import Tag, TagGroups
 
 
@@ -21,8 +21,17 @@ class FuzzlyClient(Client) :
 
 
 	@Client.authenticated
-	async def my_posts(self: Client, sort: PostSort = PostSort.new, count: int = 64, page: int = 1, auth: str = None) -> List[Post] :
-		return await FetchMyPosts({ 'sort': sort.name, 'count': count, 'page': page }, auth=auth)
+	async def my_posts(self: Client, sort: PostSort = PostSort.new, count: int = 64, page: int = 1, cursor: Optional[PostCursor] = None, auth: str = None) -> List[Post] :
+		"""
+		retrieves a page of your own posts. when a cursor is provided, page is ignored and the page directly after the cursor is returned.
+		use PostCursor.from_post(sort, posts[-1]) to create the cursor for the next page.
+		"""
+		body: Dict[str, Any] = { 'sort': sort.name, 'count': count, 'page': page }
+
+		if cursor :
+			body['cursor'] = cursor
+
+		return await FetchMyPosts(body, auth=auth)
 
 
 	@Client.authenticated
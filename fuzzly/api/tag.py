@@ -2,10 +2,11 @@ from kh_common.gateway import Gateway
 
 from ..constants import TagHost
 from ..models.tag import Tag, TagGroups
+from ..tracing import TracedGateway
 
 
 # Usage: FetchTag(tag='tag')
-FetchTag: Gateway = Gateway(TagHost + '/v1/tag/{tag}', Tag, method='GET')
+FetchTag: Gateway = TracedGateway(TagHost + '/v1/tag/{tag}', Tag, method='GET')
 
 # Usage: FetchPostTags(post_id='abcd1234')
-FetchPostTags: Gateway = Gateway(TagHost + '/v1/tags/{post_id}', TagGroups, method='GET')
+FetchPostTags: Gateway = TracedGateway(TagHost + '/v1/tags/{post_id}', TagGroups, method='GET')
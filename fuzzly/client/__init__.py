@@ -9,6 +9,7 @@ from kh_common.gateway import Gateway
 
 from ..constants import AccountHost
 from ..models.auth import LoginResponse
+from ..tracing import TracedGateway
 
 
 class Client :
@@ -42,7 +43,7 @@ class Client :
 		:param _login: async function to perform bot authentication with. omit to default to `/v1/bot_login`. must accept `{ 'token': 'bot token string' }` as arg and return a `fuzzly.models.auth.LoginResponse` model.
 		"""
 
-		self._login: Gateway = _login or Gateway(AccountHost + '/v1/bot_login', LoginResponse, 'POST')
+		self._login: Gateway = _login or TracedGateway(AccountHost + '/v1/bot_login', LoginResponse, 'POST')
 		self._token: Optional[str] = token
 		self._auth: Optional[str] = None
 		self._expires: int = 0
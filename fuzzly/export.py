@@ -0,0 +1,60 @@
+from json import dumps
+from typing import AsyncIterable, BinaryIO, TextIO, Type
+
+from pydantic import BaseModel
+
+
+"""
+writers for the export streams provided by the internal database interface, such as DBI.export_users or DBI.export_posts.
+records are written as they arrive, so memory use is bounded by the stream's chunk size rather than the size of the export.
+avro output requires optional dependencies, which can be installed with `pip install fuzzly[export]`
+"""
+
+
+async def write_ndjson(records: AsyncIterable[BaseModel], fp: TextIO) -> int :
+	"""
+	writes each record as a single line of json
+	:param records: async iterable of models to write
+	:param fp: text file-like object to write to
+	:return: number of records written
+	"""
+	count: int = 0
+
+	async for record in records :
+		fp.write(record.json())
+		fp.write('\n')
+		count += 1
+
+	return count
+
+
+async def write_avro(records: AsyncIterable[BaseModel], model: Type[BaseModel], fp: BinaryIO, codec: str = 'deflate') -> int :
+	"""
+	writes every record into an avro object container file, with the schema generated from the given model
+	:param records: async iterable of instances of model
+	:param model: model type used to generate the file's schema
+	:param fp: binary file-like object to write to. it is not closed once writing completes
+	:param codec: avro block compression codec, null or deflate
+	:return: number of records written
+	"""
+	try :
+		from avro.datafile import DataFileWriter
+		from avro.schema import Schema
+		from avro.schema import parse as parse_avro_schema
+		from avrofastapi.schema import convert_schema
+		from avrofastapi.serialization import ABetterDatumWriter
+
+	except ImportError as e :
+		raise ImportError('write_avro requires the export extra, install it with `pip install fuzzly[export]`') from e
+
+	schema: Schema = parse_avro_schema(dumps(convert_schema(model)))
+	writer: DataFileWriter = DataFileWriter(fp, ABetterDatumWriter(), schema, codec=codec)
+	count: int = 0
+
+	async for record in records :
+		writer.append(record.dict())
+		count += 1
+
+	# DataFileWriter.close would close fp as well, so only flush the final block
+	writer.flush()
+	return count
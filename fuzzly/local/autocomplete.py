@@ -0,0 +1,161 @@
+from bisect import bisect_left, insort
+from heapq import nlargest
+from typing import TYPE_CHECKING, Dict, Iterable, List, Set, Tuple
+
+from ..models.tag import TagGroupPortable, TagSuggestion
+
+
+if TYPE_CHECKING :
+	from ..models.internal import _InternalClient
+
+
+# prefixes up to this length match too many tags to rank on every keystroke, so their results are kept
+CachedPrefixLength: int = 2
+# the number of results kept for each cached prefix, searches with a larger k are ranked on demand
+CachedPrefixResults: int = 32
+
+
+class TagIndex :
+	"""
+	in-memory prefix index over every tag name, used to suggest tags ranked by how many posts use them.
+	names are kept in a sorted list so that a prefix maps to a contiguous range found by binary search.
+	"""
+
+	def __init__(self: 'TagIndex') :
+		self._names: List[str] = []
+		# tag -> (group, deprecated, count)
+		self._tags: Dict[str, Tuple[TagGroupPortable, bool, int]] = { }
+		# prefix -> top names for short prefixes
+		self._top: Dict[str, List[str]] = { }
+
+
+	def __len__(self: 'TagIndex') -> int :
+		return len(self._names)
+
+
+	def __contains__(self: 'TagIndex', tag: str) -> bool :
+		return tag in self._tags
+
+
+	def update(self: 'TagIndex', tag: str, group: TagGroupPortable, deprecated: bool, count: int) -> None :
+		"""
+		adds the tag to the index, or updates it if it already exists
+		"""
+		if tag not in self._tags :
+			insort(self._names, tag)
+
+		elif self._tags[tag] == (group, deprecated, count) :
+			return
+
+		self._tags[tag] = (group, deprecated, count)
+		self._invalidate(tag)
+
+
+	def adjust(self: 'TagIndex', tag: str, delta: int) -> None :
+		"""
+		adds delta to the tag's count, if the tag is indexed
+		"""
+		if tag not in self._tags :
+			return
+
+		group, deprecated, count = self._tags[tag]
+		self._tags[tag] = (group, deprecated, count + delta)
+		self._invalidate(tag)
+
+
+	def remove(self: 'TagIndex', tag: str) -> None :
+		if tag not in self._tags :
+			return
+
+		del self._names[bisect_left(self._names, tag)]
+		del self._tags[tag]
+		self._invalidate(tag)
+
+
+	def apply(self: 'TagIndex', tags: Iterable[Tuple[str, TagGroupPortable, bool, int]]) -> int :
+		"""
+		brings the index in line with a full snapshot of (tag, group, deprecated, count) tuples, touching only the tags that changed.
+		tags missing from the snapshot are removed.
+
+		:return: the number of tags that were added, updated, or removed
+		"""
+		changed: int = 0
+		seen: Set[str] = set()
+
+		for tag, group, deprecated, count in tags :
+			seen.add(tag)
+
+			if self._tags.get(tag) != (group, deprecated, count) :
+				self.update(tag, group, deprecated, count)
+				changed += 1
+
+		for tag in self._tags.keys() - seen :
+			self.remove(tag)
+			changed += 1
+
+		return changed
+
+
+	async def refresh(self: 'TagIndex', client: '_InternalClient') -> int :
+		"""
+		loads a snapshot of every tag and its count, then applies it to the index
+
+		:return: the number of tags that were added, updated, or removed
+		"""
+		snapshot: List[Tuple[str, TagGroupPortable, bool]] = await client.tags_snapshot()
+		counts: Dict[str, int] = await client.tag_counts_many([tag for tag, _, _ in snapshot])
+		return self.apply((tag, group, deprecated, counts.get(tag) or 0) for tag, group, deprecated in snapshot)
+
+
+	def search(self: 'TagIndex', prefix: str, k: int = 10, include_deprecated: bool = False) -> List[TagSuggestion] :
+		"""
+		returns up to k tags starting with the given prefix, with the most used tags first
+		"""
+		prefix = prefix.lower()
+		names: List[str]
+
+		if len(prefix) <= CachedPrefixLength and k <= CachedPrefixResults and not include_deprecated :
+			if prefix not in self._top :
+				self._top[prefix] = self._rank(prefix, CachedPrefixResults, False)
+
+			names = self._top[prefix][:k]
+
+		else :
+			names = self._rank(prefix, k, include_deprecated)
+
+		return [
+			TagSuggestion(
+				tag=name,
+				group=self._tags[name][0],
+				deprecated=self._tags[name][1],
+				count=self._tags[name][2],
+			)
+			for name in names
+		]
+
+
+	def _range(self: 'TagIndex', prefix: str) -> Tuple[int, int] :
+		start: int = bisect_left(self._names, prefix)
+
+		if not prefix :
+			return start, len(self._names)
+
+		# the first string that sorts after every string starting with prefix
+		end: int = bisect_left(self._names, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+		return start, end
+
+
+	def _rank(self: 'TagIndex', prefix: str, k: int, include_deprecated: bool) -> List[str] :
+		start, end = self._range(prefix)
+		candidates: Iterable[str] = self._names[start:end]
+
+		if not include_deprecated :
+			candidates = filter(lambda x : not self._tags[x][1], candidates)
+
+		# nlargest is stable and candidates are already sorted, so ties are broken alphabetically
+		return nlargest(k, candidates, key=lambda x : self._tags[x][2])
+
+
+	def _invalidate(self: 'TagIndex', tag: str) -> None :
+		for length in range(min(len(tag), CachedPrefixLength) + 1) :
+			self._top.pop(tag[:length], None)
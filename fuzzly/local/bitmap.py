@@ -0,0 +1,223 @@
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+
+# chunks holding more than this many values are stored as bitsets, anything less is smaller as a sorted array
+ArrayLimit: int = 4096
+BitsetBytes: int = 8192
+
+Chunk = Union[array, bytearray]
+
+
+def _bitset(values: Iterable[int]) -> bytearray :
+	bitset: bytearray = bytearray(BitsetBytes)
+
+	for value in values :
+		bitset[value >> 3] |= 1 << (value & 7)
+
+	return bitset
+
+
+def _bits(bitset: bytearray) -> Iterator[int] :
+	for index, byte in enumerate(bitset) :
+		while byte :
+			low: int = byte & -byte
+			yield (index << 3) | (low.bit_length() - 1)
+			byte ^= low
+
+
+def _has(chunk: Chunk, value: int) -> bool :
+	if isinstance(chunk, bytearray) :
+		return bool(chunk[value >> 3] & (1 << (value & 7)))
+
+	index: int = bisect_left(chunk, value)
+	return index < len(chunk) and chunk[index] == value
+
+
+def _count(chunk: Chunk) -> int :
+	if isinstance(chunk, bytearray) :
+		return bin(int.from_bytes(chunk, 'little')).count('1')
+
+	return len(chunk)
+
+
+def _normalize(chunk: Chunk) -> Optional[Chunk] :
+	"""
+	stores the chunk in whichever form is smallest, or returns None if it's empty
+	"""
+	count: int = _count(chunk)
+
+	if not count :
+		return None
+
+	if isinstance(chunk, bytearray) and count <= ArrayLimit :
+		return array('H', _bits(chunk))
+
+	if isinstance(chunk, array) and count > ArrayLimit :
+		return _bitset(chunk)
+
+	return chunk
+
+
+def _combine(a: Chunk, b: Chunk, op: str) -> Optional[Chunk] :
+	if isinstance(a, bytearray) and isinstance(b, bytearray) :
+		x: int = int.from_bytes(a, 'little')
+		y: int = int.from_bytes(b, 'little')
+		z: int = x & y if op == 'and' else x | y if op == 'or' else x & ~y
+		return _normalize(bytearray(z.to_bytes(BitsetBytes, 'little')))
+
+	if op == 'and' :
+		# iterate whichever side is an array, probing the other side
+		small, large = (a, b) if isinstance(a, array) else (b, a)
+		return _normalize(array('H', (v for v in small if _has(large, v))))
+
+	if op == 'sub' :
+		if isinstance(a, array) :
+			return _normalize(array('H', (v for v in a if not _has(b, v))))
+
+		chunk: bytearray = bytearray(a)
+
+		for v in b :
+			chunk[v >> 3] &= ~(1 << (v & 7)) & 0xff
+
+		return _normalize(chunk)
+
+	if isinstance(a, bytearray) or isinstance(b, bytearray) :
+		chunk, other = (bytearray(a), b) if isinstance(a, bytearray) else (bytearray(b), a)
+
+		for v in other :
+			chunk[v >> 3] |= 1 << (v & 7)
+
+		return chunk
+
+	return _normalize(array('H', sorted(set(a) | set(b))))
+
+
+class Bitmap :
+	"""
+	compressed set of non-negative integers, in the style of roaring bitmaps. values are split into chunks by their high bits,
+	and each chunk is stored as a sorted array while sparse, or as a 65536 bit bitset once dense.
+	"""
+
+	__slots__ = ('_chunks',)
+
+
+	def __init__(self: 'Bitmap', values: Iterable[int] = ()) :
+		self._chunks: Dict[int, Chunk] = { }
+
+		for value in values :
+			self.add(value)
+
+
+	def add(self: 'Bitmap', value: int) -> None :
+		key, low = value >> 16, value & 0xffff
+		chunk: Optional[Chunk] = self._chunks.get(key)
+
+		if chunk is None :
+			self._chunks[key] = array('H', [low])
+
+		elif isinstance(chunk, bytearray) :
+			chunk[low >> 3] |= 1 << (low & 7)
+
+		else :
+			index: int = bisect_left(chunk, low)
+
+			if index == len(chunk) or chunk[index] != low :
+				chunk.insert(index, low)
+
+				if len(chunk) > ArrayLimit :
+					self._chunks[key] = _bitset(chunk)
+
+
+	def discard(self: 'Bitmap', value: int) -> None :
+		key, low = value >> 16, value & 0xffff
+		chunk: Optional[Chunk] = self._chunks.get(key)
+
+		if chunk is None or not _has(chunk, low) :
+			return
+
+		if isinstance(chunk, bytearray) :
+			chunk[low >> 3] &= ~(1 << (low & 7)) & 0xff
+
+			# only check whether the bitset can shrink when the byte empties, to keep removals cheap
+			if not chunk[low >> 3] :
+				chunk = _normalize(chunk)
+
+		else :
+			del chunk[bisect_left(chunk, low)]
+
+		if chunk :
+			self._chunks[key] = chunk
+
+		else :
+			del self._chunks[key]
+
+
+	def __contains__(self: 'Bitmap', value: int) -> bool :
+		chunk: Optional[Chunk] = self._chunks.get(value >> 16)
+		return chunk is not None and _has(chunk, value & 0xffff)
+
+
+	def __len__(self: 'Bitmap') -> int :
+		return sum(map(_count, self._chunks.values()))
+
+
+	def __bool__(self: 'Bitmap') -> bool :
+		return bool(self._chunks)
+
+
+	def __iter__(self: 'Bitmap') -> Iterator[int] :
+		for key in sorted(self._chunks) :
+			chunk: Chunk = self._chunks[key]
+			high: int = key << 16
+
+			for low in (_bits(chunk) if isinstance(chunk, bytearray) else chunk) :
+				yield high | low
+
+
+	def __eq__(self: 'Bitmap', other: object) -> bool :
+		return isinstance(other, Bitmap) and list(self) == list(other)
+
+
+	def copy(self: 'Bitmap') -> 'Bitmap' :
+		bitmap: Bitmap = Bitmap()
+		bitmap._chunks = { key: chunk[:] for key, chunk in self._chunks.items() }
+		return bitmap
+
+
+	def __and__(self: 'Bitmap', other: 'Bitmap') -> 'Bitmap' :
+		bitmap: Bitmap = Bitmap()
+
+		for key in self._chunks.keys() & other._chunks.keys() :
+			chunk: Optional[Chunk] = _combine(self._chunks[key], other._chunks[key], 'and')
+
+			if chunk :
+				bitmap._chunks[key] = chunk
+
+		return bitmap
+
+
+	def __or__(self: 'Bitmap', other: 'Bitmap') -> 'Bitmap' :
+		bitmap: Bitmap = self.copy()
+
+		for key, chunk in other._chunks.items() :
+			bitmap._chunks[key] = _combine(bitmap._chunks[key], chunk, 'or') if key in bitmap._chunks else chunk[:]
+
+		return bitmap
+
+
+	def __sub__(self: 'Bitmap', other: 'Bitmap') -> 'Bitmap' :
+		bitmap: Bitmap = Bitmap()
+
+		for key, chunk in self._chunks.items() :
+			if key in other._chunks :
+				chunk = _combine(chunk, other._chunks[key], 'sub')
+
+			else :
+				chunk = chunk[:]
+
+			if chunk :
+				bitmap._chunks[key] = chunk
+
+		return bitmap
@@ -0,0 +1,175 @@
+from asyncio import Task, ensure_future, shield
+from logging import Logger, getLogger
+from time import monotonic
+from typing import TYPE_CHECKING, Dict, FrozenSet, Hashable, Iterable, List, Optional, Set, Tuple, TypeVar
+
+
+if TYPE_CHECKING :
+	from ..models.internal import _InternalClient
+
+
+K = TypeVar('K', bound=Hashable)
+logger: Logger = getLogger(__name__)
+
+
+class TagImplications :
+	"""
+	precomputed transitive closure of tag inheritance. every tag is assigned a compact integer id and maps to the set of ids
+	of every tag it implies, directly or through other tags, so that expanding a post's tags never walks the graph.
+	"""
+
+	def __init__(self: 'TagImplications', TTL: float = 3600) :
+		"""
+		:param TTL: seconds after which ensure_fresh reloads the closure
+		"""
+		self.TTL: float = TTL
+		self._ids: Dict[str, int] = { }
+		self._names: List[str] = []
+		# tag id -> ids of every tag it implies, not including itself. tags that imply nothing are omitted
+		self._closure: Dict[int, FrozenSet[int]] = { }
+		self._loaded: Optional[float] = None
+		self._refreshing: Optional[Task] = None
+		self._failed: bool = False
+
+
+	def __len__(self: 'TagImplications') -> int :
+		return len(self._closure)
+
+
+	def _id(self: 'TagImplications', tag: str) -> int :
+		if tag not in self._ids :
+			self._ids[tag] = len(self._names)
+			self._names.append(tag)
+
+		return self._ids[tag]
+
+
+	def load(self: 'TagImplications', edges: Iterable[Tuple[str, str]]) -> None :
+		"""
+		replaces the closure with one computed from the given edges
+
+		:param edges: (tag, inherited tag) tuples, where applying tag to a post also applies the inherited tag
+		"""
+		self._ids = { }
+		self._names = []
+		graph: Dict[int, Set[int]] = { }
+
+		for tag, inherited in edges :
+			graph.setdefault(self._id(tag), set()).add(self._id(inherited))
+
+		closure: Dict[int, FrozenSet[int]] = { }
+
+		for start in graph :
+			reached: Set[int] = set()
+			stack: List[int] = list(graph[start])
+
+			while stack :
+				node: int = stack.pop()
+
+				if node in reached :
+					continue
+
+				reached.add(node)
+
+				# closures are complete once computed, so there's no need to walk past them
+				if node in closure :
+					reached |= closure[node]
+
+				elif node in graph :
+					stack.extend(graph[node])
+
+			reached.discard(start)
+			closure[start] = frozenset(reached)
+
+		self._closure = closure
+		self._loaded = monotonic()
+
+
+	async def refresh(self: 'TagImplications', client: '_InternalClient') -> None :
+		"""
+		loads every inheritance edge and recomputes the closure
+		"""
+		self.load(await client.tag_inheritance())
+
+
+	def _refreshed(self: 'TagImplications', task: Task) -> None :
+		if task.cancelled() :
+			return
+
+		e: Optional[BaseException] = task.exception()
+		self._failed = e is not None
+
+		if e :
+			logger.warning('failed to refresh tag implications, tags will be expanded with the previous closure until a refresh succeeds.', exc_info=e)
+
+
+	def warm(self: 'TagImplications', client: '_InternalClient') -> Task :
+		"""
+		starts loading the closure in the background, without waiting for it. should be called on startup, so that requests don't wait on the first load.
+		EX: app.on_event('startup')(lambda : tag_implications.warm(client))
+		"""
+		if self._refreshing is None or self._refreshing.done() :
+			self._refreshing = ensure_future(self.refresh(client))
+			self._refreshing.add_done_callback(self._refreshed)
+
+		return self._refreshing
+
+
+	async def ensure_fresh(self: 'TagImplications', client: '_InternalClient') -> None :
+		"""
+		loads the closure if it's never been loaded, waiting for it, or reloads it in the background once it's older than TTL.
+		concurrent calls share a single refresh, and a failed refresh is retried on the next call.
+		if loading fails, tags are expanded with the previous closure, or not at all if none has loaded, and later calls retry in the background rather than waiting
+		"""
+		if self._loaded is not None and monotonic() - self._loaded < self.TTL :
+			return
+
+		refreshing: Task = self.warm(client)
+
+		if self._loaded is None and not self._failed :
+			try :
+				# shielded so that a cancelled caller doesn't cancel the refresh for everyone else waiting on it
+				await shield(refreshing)
+
+			except Exception :
+				# already logged by _refreshed
+				pass
+
+
+	def implied(self: 'TagImplications', tag: str) -> Set[str] :
+		"""
+		returns every tag implied by the given tag, not including itself
+		"""
+		if tag not in self._ids :
+			return set()
+
+		return { self._names[i] for i in self._closure.get(self._ids[tag], ()) }
+
+
+	def expand(self: 'TagImplications', tags: Iterable[str]) -> Set[str] :
+		"""
+		returns the given tags along with every tag they imply
+		"""
+		expanded: Set[str] = set(tags)
+
+		if not self._closure :
+			return expanded
+
+		ids: Set[int] = set()
+
+		for tag in expanded :
+			if tag in self._ids :
+				ids |= self._closure.get(self._ids[tag], frozenset())
+
+		expanded.update(map(self._names.__getitem__, ids))
+		return expanded
+
+
+	def expand_many(self: 'TagImplications', tags: Dict[K, Iterable[str]]) -> Dict[K, Set[str]] :
+		"""
+		expands the tags of many posts at once, such as the output of InternalClient.tags_many
+		"""
+		return {
+			key: self.expand(tag_list)
+			for key, tag_list in tags.items()
+		}
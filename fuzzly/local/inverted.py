@@ -0,0 +1,145 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from ..models._shared import PostId
+from .bitmap import Bitmap
+from .implications import TagImplications
+
+
+class PostTagIndex :
+	"""
+	in-memory inverted index of tag -> bitmap of the posts with that tag, used to answer tag queries over posts that have already been fetched.
+	posts are assigned compact ids so that their bitmaps stay dense, and the ids of removed posts are reused.
+	once max_posts are indexed, the least recently updated posts are evicted to make room.
+	"""
+
+	def __init__(self: 'PostTagIndex', implications: Optional[TagImplications] = None, max_posts: int = 1000000) :
+		"""
+		:param implications: if provided, posts are indexed under every tag their tags imply as well
+		:param max_posts: maximum number of posts indexed at once
+		"""
+		assert max_posts > 0
+		self.max_posts: int = max_posts
+		self._implications: Optional[TagImplications] = implications
+		# post id -> doc id. recently updated posts are kept at the end
+		self._docs: 'OrderedDict[PostId, int]' = OrderedDict()
+		self._post_ids: List[Optional[PostId]] = []
+		self._free: List[int] = []
+		self._post_tags: Dict[int, Tuple[str, ...]] = { }
+		self._tags: Dict[str, Bitmap] = { }
+		self._all: Bitmap = Bitmap()
+
+
+	def __len__(self: 'PostTagIndex') -> int :
+		return len(self._docs)
+
+
+	def __contains__(self: 'PostTagIndex', post_id: PostId) -> bool :
+		return PostId(post_id) in self._docs
+
+
+	def count(self: 'PostTagIndex', tag: str) -> int :
+		return len(self._tags[tag]) if tag in self._tags else 0
+
+
+	def update(self: 'PostTagIndex', post_id: PostId, tags: Iterable[str]) -> None :
+		"""
+		indexes the post under the given tags, replacing any tags it was previously indexed under
+		"""
+		key: PostId = PostId(post_id)
+		tags: Set[str] = self._implications.expand(tags) if self._implications else set(tags)
+
+		if key in self._docs :
+			doc: int = self._docs[key]
+			self._docs.move_to_end(key)
+			previous: Set[str] = set(self._post_tags[doc])
+
+		else :
+			while len(self._docs) >= self.max_posts :
+				self.remove(next(iter(self._docs)))
+
+			if self._free :
+				doc: int = self._free.pop()
+				self._post_ids[doc] = key
+
+			else :
+				doc: int = len(self._post_ids)
+				self._post_ids.append(key)
+
+			self._docs[key] = doc
+			self._all.add(doc)
+			previous: Set[str] = set()
+
+		for tag in previous - tags :
+			self._discard(tag, doc)
+
+		for tag in tags - previous :
+			if tag not in self._tags :
+				self._tags[tag] = Bitmap()
+
+			self._tags[tag].add(doc)
+
+		self._post_tags[doc] = tuple(tags)
+
+
+	def update_many(self: 'PostTagIndex', tags: Dict[PostId, Iterable[str]]) -> None :
+		"""
+		indexes many posts at once, such as the output of InternalClient.tags_many
+		"""
+		for post_id, tag_list in tags.items() :
+			self.update(post_id, tag_list)
+
+
+	def remove(self: 'PostTagIndex', post_id: PostId) -> None :
+		key: PostId = PostId(post_id)
+
+		if key not in self._docs :
+			return
+
+		doc: int = self._docs.pop(key)
+
+		for tag in self._post_tags.pop(doc) :
+			self._discard(tag, doc)
+
+		self._post_ids[doc] = None
+		self._all.discard(doc)
+		self._free.append(doc)
+
+
+	def _discard(self: 'PostTagIndex', tag: str, doc: int) -> None :
+		self._tags[tag].discard(doc)
+
+		if not self._tags[tag] :
+			del self._tags[tag]
+
+
+	def query(self: 'PostTagIndex', tags: Iterable[str]) -> List[PostId] :
+		"""
+		returns every indexed post matching all of the given tags. uses the same syntax as blocked tags, so tags prefixed with '-' must not be present.
+		if only negated tags are given, they're applied against every indexed post.
+		"""
+		include: List[str] = []
+		exclude: List[str] = []
+
+		for tag in tags :
+			if tag.startswith('-') :
+				exclude.append(tag[1:])
+
+			else :
+				include.append(tag)
+
+		if any(tag not in self._tags for tag in include) :
+			return []
+
+		# intersect the smallest bitmaps first so that intermediate results shrink as fast as possible
+		bitmaps: List[Bitmap] = sorted((self._tags[tag] for tag in include), key=len)
+		result: Bitmap = bitmaps[0] if bitmaps else self._all
+
+		for bitmap in bitmaps[1:] :
+			result = result & bitmap
+
+		for tag in exclude :
+			if tag in self._tags :
+				result = result - self._tags[tag]
+
+		return [self._post_ids[doc] for doc in result]
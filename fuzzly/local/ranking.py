@@ -0,0 +1,121 @@
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import numpy
+from numpy import ndarray
+
+from ..models.post import PostId, PostSort
+
+
+if TYPE_CHECKING :
+	from ..models.internal import InternalPost, InternalScore
+
+
+# z score used for the wilson lower bound, 1.96 gives a 95% confidence interval
+WilsonZ: float = 1.96
+# how many seconds it takes for a post's hot score to decay by the same amount as a tenfold increase in votes
+HotDecay: float = 45000
+HotEpoch: float = datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp()
+
+
+def wilson(up: ndarray, down: ndarray, z: float = WilsonZ) -> ndarray :
+	"""
+	returns the lower bound of the wilson score confidence interval for the ratio of upvotes to total votes
+	"""
+	up = numpy.asarray(up, dtype=numpy.float64)
+	n: ndarray = up + numpy.asarray(down, dtype=numpy.float64)
+	safe_n: ndarray = numpy.maximum(n, 1)
+	p: ndarray = up / safe_n
+	z2: float = z * z
+
+	bound: ndarray = (p + z2 / (2 * safe_n) - z * numpy.sqrt((p * (1 - p) + z2 / (4 * safe_n)) / safe_n)) / (1 + z2 / safe_n)
+	return numpy.where(n > 0, bound, 0)
+
+
+def hot(up: ndarray, down: ndarray, created: ndarray, decay: float = HotDecay) -> ndarray :
+	"""
+	returns a score that grows logarithmically with net votes and linearly with age, so newer posts need fewer votes to rank the same as older ones
+
+	:param created: unix timestamps, in seconds, of when each post was created
+	"""
+	net: ndarray = numpy.asarray(up, dtype=numpy.float64) - numpy.asarray(down, dtype=numpy.float64)
+	order: ndarray = numpy.log10(numpy.maximum(numpy.abs(net), 1))
+	return numpy.sign(net) * order + (numpy.asarray(created, dtype=numpy.float64) - HotEpoch) / decay
+
+
+def controversial(up: ndarray, down: ndarray) -> ndarray :
+	"""
+	returns a score that is highest for posts with many votes that are evenly split between up and down
+	"""
+	up = numpy.asarray(up, dtype=numpy.float64)
+	down = numpy.asarray(down, dtype=numpy.float64)
+	high: ndarray = numpy.maximum(up, down)
+	balance: ndarray = numpy.minimum(up, down) / numpy.maximum(high, 1)
+	return numpy.where((up > 0) & (down > 0), (up + down) ** balance, 0)
+
+
+def sort_keys(posts: List['InternalPost'], scores: Dict[PostId, Optional['InternalScore']], sort: PostSort) -> ndarray :
+	"""
+	returns the key for every post in the given sort order, where posts with larger keys are ranked first
+	"""
+	up: ndarray = numpy.zeros(len(posts), dtype=numpy.float64)
+	down: ndarray = numpy.zeros(len(posts), dtype=numpy.float64)
+	created: ndarray = numpy.zeros(len(posts), dtype=numpy.float64)
+
+	for i, post in enumerate(posts) :
+		# posts without scores, such as drafts, are ranked as though they have no votes
+		score: Optional[InternalScore] = scores.get(PostId(post.post_id))
+
+		if score :
+			up[i] = score.up
+			down[i] = score.down
+
+		if post.created :
+			created[i] = (post.created if post.created.tzinfo else post.created.replace(tzinfo=timezone.utc)).timestamp()
+
+	if sort == PostSort.new :
+		return created
+
+	if sort == PostSort.old :
+		return -created
+
+	if sort == PostSort.top :
+		return up - down
+
+	if sort == PostSort.hot :
+		return hot(up, down, created)
+
+	if sort == PostSort.best :
+		return wilson(up, down)
+
+	if sort == PostSort.controversial :
+		return controversial(up, down)
+
+	raise NotImplementedError(f'{sort} is not a supported sort order.')
+
+
+def rank(posts: List['InternalPost'], scores: Dict[PostId, Optional['InternalScore']], sort: PostSort) -> List['InternalPost'] :
+	"""
+	sorts the candidate posts into the given sort order. ties are broken by post id, so rankings are stable between calls
+
+	:param posts: the candidate posts to be ranked
+	:param scores: the output of InternalClient.scores_many for the candidate posts
+	:return: the candidate posts, best ranked first
+	"""
+	if not posts :
+		return []
+
+	keys: ndarray = sort_keys(posts, scores, sort)
+	post_ids: ndarray = numpy.fromiter((post.post_id for post in posts), dtype=numpy.int64, count=len(posts))
+
+	# lexsort uses the last key as the primary key and sorts ascending, so both keys are negated
+	order: ndarray = numpy.lexsort((-post_ids, -keys))
+	return [posts[i] for i in order]
+
+
+def rank_page(posts: List['InternalPost'], scores: Dict[PostId, Optional['InternalScore']], sort: PostSort, count: int = 64, page: int = 1) -> List['InternalPost'] :
+	"""
+	same as rank, but only returns a single page of the ranked posts
+	"""
+	start: int = (page - 1) * count
+	return rank(posts, scores, sort)[start:start + count]
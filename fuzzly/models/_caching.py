@@ -0,0 +1,219 @@
+from asyncio import Task, ensure_future, get_event_loop, shield
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from functools import partial, wraps
+from inspect import BoundArguments, Signature, signature, unwrap
+from time import monotonic, time
+from typing import Any, Callable, Dict, Optional, Tuple, get_type_hints
+
+from aerospike import POLICY_EXISTS_CREATE, POLICY_GEN_EQ, TTL_DONT_UPDATE
+from aerospike.exception import RecordExistsError, RecordGenerationError, RecordNotFound
+from kh_common.caching.key_value_store import KeyValueStore
+from pydantic import BaseModel
+
+
+# attempts made by update_record before it gives up and drops the record
+UpdateRetries: int = 5
+
+
+def _update_record(kvs: KeyValueStore, key: str, modify: Callable[[Any], Any], retries: int) -> Optional[Any] :
+	record: Tuple[str, str, str] = (kvs._namespace, kvs._set, key)
+
+	for _ in range(retries) :
+		try :
+			_, meta, bins = KeyValueStore._client.get(record)
+
+		except RecordNotFound :
+			return None
+
+		data: Any = modify(bins['data'])
+
+		try :
+			KeyValueStore._client.put(
+				record,
+				{ 'data': data },
+				meta={ 'gen': meta['gen'], 'ttl': TTL_DONT_UPDATE },
+				policy={ 'gen': POLICY_GEN_EQ, 'max_retries': 3 },
+			)
+
+		except RecordGenerationError :
+			# someone else wrote the record since it was read, so apply the change again on top of theirs
+			continue
+
+		kvs._cache[key] = (time() + kvs._local_TTL, data)
+		return data
+
+	# too contended to patch, so drop it and let the next read rebuild it from the source
+	kvs._cache.pop(key, None)
+
+	try :
+		KeyValueStore._client.remove(record)
+
+	except RecordNotFound :
+		pass
+
+	return None
+
+
+def put_if_absent(kvs: KeyValueStore, key: str, data: Any, TTL: int = 0) -> bool :
+	"""
+	writes the record only if it doesn't exist yet, so that a fill computed from an older read can't overwrite a newer write.
+	blocks, so should be called from an executor.
+
+	:return: whether the record was written
+	"""
+	try :
+		KeyValueStore._client.put(
+			(kvs._namespace, kvs._set, key),
+			{ 'data': data },
+			meta={ 'ttl': TTL },
+			policy={ 'exists': POLICY_EXISTS_CREATE, 'max_retries': 3 },
+		)
+
+	except RecordExistsError :
+		return False
+
+	kvs._cache[key] = (time() + kvs._local_TTL, data)
+	return True
+
+
+async def update_record(kvs: KeyValueStore, key: str, modify: Callable[[Any], Any], retries: int = UpdateRetries) -> Optional[Any] :
+	"""
+	patches a stored record without losing concurrent writes. the record is read, passed to modify, and written back only if
+	its generation hasn't changed since it was read, otherwise the patch is retried against the newer record.
+	modify may be called more than once, and is called from a worker thread.
+
+	:param modify: receives the stored data and returns the data to store in its place
+	:return: the data written, or None if the record doesn't exist or was dropped after every attempt conflicted
+	"""
+	with ThreadPoolExecutor() as threadpool :
+		return await get_event_loop().run_in_executor(threadpool, partial(_update_record, kvs, key, modify, retries))
+
+
+class StaleWhileRevalidate :
+	"""
+	read-through cache over a kvs that also keeps an in-process copy of each value. once a copy is older than soft_TTL it's still served,
+	but refreshed in the background. once it's older than hard_TTL, callers wait for the refresh instead. concurrent refreshes of a key share a single fetch.
+	values are read from the kvs first, and only fetched from the wrapped function if the kvs doesn't have them. nothing is written back to the kvs.
+	every caller receives its own copy of the value, so mutating a result never changes what other callers are served.
+	ex:
+	@StaleWhileRevalidate(PostKVS, '{post_id}', soft_TTL=10, hard_TTL=120)
+	async def post(self, post_id: PostId) -> InternalPost : ...
+	"""
+
+	def __init__(self: 'StaleWhileRevalidate', kvs: KeyValueStore, key_format: str, soft_TTL: float = 10, hard_TTL: float = 120, local_size: int = 4096) :
+		"""
+		:param kvs: kvs that the upstream service populates
+		:param key_format: format string for the kvs key, filled by the wrapped function's arguments
+		:param soft_TTL: seconds after which a value is refreshed in the background
+		:param hard_TTL: seconds after which a value is no longer served
+		:param local_size: maximum number of values kept in process
+		"""
+		assert 0 <= soft_TTL <= hard_TTL
+		self.kvs: KeyValueStore = kvs
+		self.key_format: str = key_format
+		self.soft_TTL: float = soft_TTL
+		self.hard_TTL: float = hard_TTL
+		self.local_size: int = local_size
+		self._local: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+		self._inflight: Dict[str, Task] = { }
+		self._signature: Optional[Signature] = None
+		self._return_type: Optional[type] = None
+		self.hits: int = 0
+		self.stale: int = 0
+		self.misses: int = 0
+
+
+	def _key(self: 'StaleWhileRevalidate', args: Tuple[Any, ...], kwargs: Dict[str, Any], partial: bool = False) -> str :
+		bound: BoundArguments = self._signature.bind_partial(*args, **kwargs) if partial else self._signature.bind(*args, **kwargs)
+		bound.apply_defaults()
+		return self.key_format.format(**bound.arguments)
+
+
+	def _valid(self: 'StaleWhileRevalidate', data: Any) -> bool :
+		# only models can be checked reliably, other types are trusted as they're stored
+		if isinstance(self._return_type, type) and issubclass(self._return_type, BaseModel) :
+			return isinstance(data, self._return_type)
+
+		return data is not None
+
+
+	async def _load(self: 'StaleWhileRevalidate', key: str, func: Callable, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Any :
+		data: Any = None
+
+		try :
+			data = await self.kvs.get_async(key)
+
+		except RecordNotFound :
+			pass
+
+		if not self._valid(data) :
+			data = await func(*args, **kwargs)
+
+		self._local[key] = (monotonic(), data)
+		self._local.move_to_end(key)
+
+		while len(self._local) > self.local_size :
+			self._local.popitem(last=False)
+
+		return data
+
+
+	def _refresh(self: 'StaleWhileRevalidate', key: str, func: Callable, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Task :
+		if key in self._inflight :
+			return self._inflight[key]
+
+		task: Task = ensure_future(self._load(key, func, args, kwargs))
+		self._inflight[key] = task
+		task.add_done_callback(lambda _ : self._inflight.pop(key, None))
+		return task
+
+
+	def invalidate(self: 'StaleWhileRevalidate', *args: Any, **kwargs: Any) -> None :
+		"""
+		drops the in-process copies of the value for the given arguments, so the next call waits for a fresh read.
+		only the arguments used by key_format are required, EX: InternalClient.user_config.cache.invalidate(user_id=user_id)
+		"""
+		key: str = self._key(args, kwargs, partial=True)
+		self._local.pop(key, None)
+
+		# the kvs keeps a short lived copy of its own, which would otherwise be read straight back
+		local: Optional[Dict[str, Any]] = getattr(self.kvs, '_cache', None)
+
+		if local is not None :
+			local.pop(key, None)
+
+
+	def __call__(self: 'StaleWhileRevalidate', func: Callable) -> Callable :
+		self._signature = signature(func)
+
+		@wraps(func)
+		async def wrapper(*args: Any, **kwargs: Any) -> Any :
+			if self._return_type is None :
+				# resolved on first use, since string annotations may refer to types defined after the function
+				self._return_type = get_type_hints(unwrap(func)).get('return', object)
+
+			key: str = self._key(args, kwargs)
+			entry: Optional[Tuple[float, Any]] = self._local.get(key)
+
+			if entry :
+				age: float = monotonic() - entry[0]
+
+				if age < self.soft_TTL :
+					self.hits += 1
+					return deepcopy(entry[1])
+
+				if age < self.hard_TTL :
+					self.stale += 1
+					task: Task = self._refresh(key, func, args, kwargs)
+					# failed background refreshes are retried on the next call, the stale value is served until then
+					task.add_done_callback(lambda t : t.cancelled() or t.exception())
+					return deepcopy(entry[1])
+
+			self.misses += 1
+			# shielded so that a cancelled caller doesn't cancel the fetch for everyone else waiting on it
+			return deepcopy(await shield(self._refresh(key, func, args, kwargs)))
+
+		wrapper.cache = self
+		return wrapper
@@ -0,0 +1,120 @@
+from asyncio import Semaphore, gather
+from functools import wraps
+from inspect import signature
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, TypeVar
+
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class ChunkPolicy :
+	"""
+	splits oversized batches into chunks, runs the chunks concurrently, and merges their results.
+	the chunk size adapts to the measured latency of full chunks so that each chunk takes roughly target_latency seconds.
+
+	can be used directly through run, or as a decorator on async methods whose last parameter is the list of keys, EX:
+	@ChunkPolicy()
+	async def users_many(self, user_ids: List[int]) -> Dict[int, InternalUser] : ...
+	"""
+
+	def __init__(
+		self: 'ChunkPolicy',
+		chunk_size: int = 500,
+		min_size: int = 50,
+		max_size: int = 5000,
+		concurrency: int = 4,
+		target_latency: Optional[float] = 0.05,
+		smoothing: float = 0.2,
+	) :
+		"""
+		:param chunk_size: initial number of keys per chunk
+		:param min_size: chunk size never adapts below this
+		:param max_size: chunk size never adapts above this
+		:param concurrency: maximum number of chunks of a single call running at once
+		:param target_latency: seconds a full chunk should take, or None to keep chunk_size fixed
+		:param smoothing: weight given to each new latency measurement
+		"""
+		self.chunk_size: int = chunk_size
+		self.min_size: int = min_size
+		self.max_size: int = max_size
+		self.concurrency: int = concurrency
+		self.target_latency: Optional[float] = target_latency
+		self.smoothing: float = smoothing
+		self._key_latency: Optional[float] = None
+		self.calls: int = 0
+		self.chunks: int = 0
+
+
+	def _observe(self: 'ChunkPolicy', size: int, elapsed: float) -> None :
+		# small calls are dominated by fixed overhead, so only chunks near the limit say anything about per-key cost
+		if self.target_latency is None or not size or size * 2 < self.chunk_size :
+			return
+
+		key_latency: float = elapsed / size
+
+		if self._key_latency is None :
+			self._key_latency = key_latency
+
+		else :
+			self._key_latency += (key_latency - self._key_latency) * self.smoothing
+
+		if self._key_latency > 0 :
+			self.chunk_size = max(self.min_size, min(self.max_size, int(self.target_latency / self._key_latency)))
+
+
+	async def _timed(self: 'ChunkPolicy', func: Callable[[List[K]], Awaitable[Dict[K, V]]], chunk: List[K]) -> Dict[K, V] :
+		start: float = perf_counter()
+		result: Dict[K, V] = await func(chunk)
+		self._observe(len(chunk), perf_counter() - start)
+		return result
+
+
+	async def run(self: 'ChunkPolicy', keys: Iterable[K], func: Callable[[List[K]], Awaitable[Dict[K, V]]]) -> Dict[K, V] :
+		"""
+		calls func with the keys, split into chunks of at most chunk_size keys
+
+		:return: the merged results of every chunk
+		"""
+		keys: List[K] = list(keys)
+		size: int = self.chunk_size
+
+		if not keys :
+			return { }
+
+		self.calls += 1
+
+		if len(keys) <= size :
+			self.chunks += 1
+			return await self._timed(func, keys)
+
+		semaphore: Semaphore = Semaphore(self.concurrency)
+
+		async def run_chunk(chunk: List[K]) -> Dict[K, V] :
+			async with semaphore :
+				return await self._timed(func, chunk)
+
+		chunks: List[List[K]] = [keys[i:i + size] for i in range(0, len(keys), size)]
+		self.chunks += len(chunks)
+		results: Dict[K, V] = { }
+
+		for result in await gather(*map(run_chunk, chunks)) :
+			results.update(result)
+
+		return results
+
+
+	def __call__(self: 'ChunkPolicy', func: Callable[..., Awaitable[Dict[K, V]]]) -> Callable[..., Awaitable[Dict[K, V]]] :
+		keys_name: str = list(signature(func).parameters)[-1]
+
+		@wraps(func)
+		async def wrapper(*args: Any, **kwargs: Any) -> Dict[K, V] :
+			if keys_name in kwargs :
+				keys: Iterable[K] = kwargs.pop(keys_name)
+				return await self.run(keys, lambda chunk : func(*args, **kwargs, **{ keys_name: chunk }))
+
+			*leading, keys = args
+			return await self.run(keys, lambda chunk : func(*leading, chunk, **kwargs))
+
+		return wrapper
@@ -1,23 +1,62 @@
-from asyncio import Task, ensure_future
+from array import array
+from asyncio import CancelledError, Task, ensure_future, get_event_loop
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple
+from functools import partial
+from time import perf_counter
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, Iterable, List, Optional, Set, Tuple
+from uuid import uuid4
+from weakref import WeakKeyDictionary
 
+from aerospike.exception import RecordNotFound
 from kh_common.auth import KhUser
 from kh_common.caching import AerospikeCache
 from kh_common.caching.key_value_store import KeyValueStore
+from kh_common.config import credentials
+from kh_common.config.credentials import db
 from kh_common.exceptions.http_error import NotFound
 from kh_common.sql import SqlInterface
+from psycopg2 import InterfaceError, OperationalError
+from psycopg2 import connect as dbConnect
+from psycopg2.errors import DuplicatePreparedStatement, InvalidSqlStatementName
+from psycopg2.extensions import connection as Connection
+from psycopg2.extensions import cursor as Cursor
 from pydantic import BaseModel, validator
 
+from ..tracing import TracedKeyValueStore, tracer
+from ._chunking import ChunkPolicy
+from ._pool import ConnectionPool, PoolStats
 from ._shared import Badge, PostId, User, UserPortable, UserPrivacy, Verified, _post_id_converter
+from ._writebehind import WriteBehind
 from .post import PostId, Score
+from .tag import TagGroupPortable
 
 
-FollowKVS: KeyValueStore = KeyValueStore('kheina', 'following')
-ScoreCache: KeyValueStore = KeyValueStore('kheina', 'score')
-VoteCache: KeyValueStore = KeyValueStore('kheina', 'votes')
-CountKVS: KeyValueStore = KeyValueStore('kheina', 'tag_count',  local_TTL=60)
-UserKVS: KeyValueStore = KeyValueStore('kheina', 'users', local_TTL=60)
+FollowKVS: KeyValueStore = TracedKeyValueStore('kheina', 'following')
+FollowSetKVS: KeyValueStore = TracedKeyValueStore('kheina', 'follow_set')
+ScoreCache: KeyValueStore = TracedKeyValueStore('kheina', 'score')
+VoteCache: KeyValueStore = TracedKeyValueStore('kheina', 'votes')
+VoteMapKVS: KeyValueStore = TracedKeyValueStore('kheina', 'vote_map')
+CountKVS: KeyValueStore = TracedKeyValueStore('kheina', 'tag_count',  local_TTL=60)
+UserKVS: KeyValueStore = TracedKeyValueStore('kheina', 'users', local_TTL=60)
+
+# long id lists passed to the *_many queries are split into chunks according to these policies, which can be tuned per query
+ChunkPolicies: Dict[str, ChunkPolicy] = {
+	'following_many': ChunkPolicy(),
+	'scores_many': ChunkPolicy(),
+	'votes_many': ChunkPolicy(),
+	'tag_counts_many': ChunkPolicy(),
+	'tags_many': ChunkPolicy(),
+	'users_many': ChunkPolicy(chunk_size=200),
+}
+
+# cache fills from database results are queued here and written in batches. reads never wait on it, fills are dropped when it's full
+write_behind: WriteBehind = WriteBehind()
+
+PoolMinSize: int = 2
+PoolMaxSize: int = 16
+PoolAcquireTimeout: float = 5
 
 
 class InternalUser(BaseModel) :
@@ -80,6 +119,130 @@ class InternalScore(BaseModel) :
 	total: int
 
 
+class InternalPostScore(BaseModel) :
+	post_id: int
+	up: int
+	down: int
+	total: int
+
+
+class InternalPostTags(BaseModel) :
+	post_id: int
+	tags: List[str]
+
+
+class QueryStats(BaseModel) :
+	calls: int
+	errors: int
+	rows: int
+	total_time: float
+	mean_time: float
+	max_time: float
+
+
+class FollowSet :
+	"""
+	sorted array of every user id followed by a single user, so that any number of following checks can be answered locally.
+	the version changes every time the set is modified so that decoded copies can be reused until the stored set changes.
+	"""
+
+	def __init__(self: 'FollowSet', version: int, follows: Iterable[int] = ()) :
+		self.version: int = version
+		self.follows: array = array('Q', sorted(set(follows)))
+
+
+	@staticmethod
+	def from_bytes(version: int, data: bytes) -> 'FollowSet' :
+		follow_set: FollowSet = FollowSet(version)
+		follow_set.follows.frombytes(data)
+		return follow_set
+
+
+	def tobytes(self: 'FollowSet') -> bytes :
+		return self.follows.tobytes()
+
+
+	def __contains__(self: 'FollowSet', user_id: int) -> bool :
+		index: int = bisect_left(self.follows, user_id)
+		return index < len(self.follows) and self.follows[index] == user_id
+
+
+	def __len__(self: 'FollowSet') -> int :
+		return len(self.follows)
+
+
+	def add(self: 'FollowSet', user_id: int) -> None :
+		index: int = bisect_left(self.follows, user_id)
+
+		if index == len(self.follows) or self.follows[index] != user_id :
+			self.follows.insert(index, user_id)
+
+
+	def remove(self: 'FollowSet', user_id: int) -> None :
+		index: int = bisect_left(self.follows, user_id)
+
+		if index < len(self.follows) and self.follows[index] == user_id :
+			del self.follows[index]
+
+
+class VoteMap :
+	"""
+	sorted map of post id -> vote for a single user's votes, so that a page's votes can be resolved from a single lookup.
+	users with too many votes only have their votes on the newest posts stored, in which case complete is false and posts
+	missing from the map have an unknown vote rather than no vote.
+	"""
+
+	def __init__(self: 'VoteMap', version: int, complete: bool, votes: Iterable[Tuple[int, int]] = ()) :
+		self.version: int = version
+		self.complete: bool = complete
+		self.post_ids: array = array('Q')
+		self.votes: array = array('b')
+
+		for post_id, vote in sorted(votes) :
+			self.post_ids.append(post_id)
+			self.votes.append(vote)
+
+
+	@staticmethod
+	def from_bytes(version: int, complete: bool, post_ids: bytes, votes: bytes) -> 'VoteMap' :
+		vote_map: VoteMap = VoteMap(version, complete)
+		vote_map.post_ids.frombytes(post_ids)
+		vote_map.votes.frombytes(votes)
+		return vote_map
+
+
+	def __len__(self: 'VoteMap') -> int :
+		return len(self.post_ids)
+
+
+	def get(self: 'VoteMap', post_id: int) -> Optional[int] :
+		"""
+		:return: the user's vote on the post, or None if the vote isn't known
+		"""
+		index: int = bisect_left(self.post_ids, post_id)
+
+		if index < len(self.post_ids) and self.post_ids[index] == post_id :
+			return self.votes[index]
+
+		return 0 if self.complete else None
+
+
+	def set(self: 'VoteMap', post_id: int, vote: int) -> None :
+		index: int = bisect_left(self.post_ids, post_id)
+		exists: bool = index < len(self.post_ids) and self.post_ids[index] == post_id
+
+		if exists and vote :
+			self.votes[index] = vote
+
+		elif exists :
+			del self.post_ids[index]
+			del self.votes[index]
+
+		elif vote :
+			self.post_ids.insert(index, post_id)
+			self.votes.insert(index, vote)
+
+
 # this steals the idea of a map from kh_common.map.Map, probably use that when types are figured out in a generic way
 class BadgeMap(SqlInterface, dict) :
 
@@ -120,17 +283,144 @@ privacy_map: PrivacyMap = PrivacyMap()
 
 class DBI(SqlInterface) :
 
+	# statement names already prepared on each connection. prepared statements only live as long as the connection that prepared them
+	_prepared: 'WeakKeyDictionary[Connection, Set[str]]' = WeakKeyDictionary()
+
+	# statement name -> [calls, errors, rows, total seconds, max seconds]
+	_stats: Dict[str, List[float]] = { }
+
+
+	def __init__(self, *args: Any, **kwargs: Any) :
+		SqlInterface.__init__(self, *args, **kwargs)
+		self.pool: ConnectionPool = ConnectionPool(db, PoolMinSize, PoolMaxSize, PoolAcquireTimeout)
+		self.replica: Optional[ConnectionPool] = None
+
+		if getattr(credentials, 'db_replica', None) :
+			self.replica = ConnectionPool(credentials.db_replica, PoolMinSize, PoolMaxSize, PoolAcquireTimeout)
+
+
+	async def prepared_async(self, name: str, sql: str, params: tuple = (), fetch_one: bool = False, fetch_all: bool = False, replica: bool = False, maxretry: int = 2) -> Optional[List[Any]] :
+		"""
+		executes sql as the named prepared statement on a pooled connection, preparing it first if that connection hasn't yet.
+		sql must use postgres' positional $1, $2, ... parameters and name must uniquely identify sql.
+
+		:param replica: run on the read replica, if one is configured. only read-only statements that can tolerate replication lag should pass True
+		"""
+		pool: ConnectionPool = self.replica if replica and self.replica else self.pool
+		params = tuple(map(self._convert_item, params))
+		execute: str = f'EXECUTE {name} (' + ', '.join(['%s'] * len(params)) + ');' if params else f'EXECUTE {name};'
+		stats: List[float] = self._stats.setdefault(name, [0, 0, 0, 0., 0.])
+
+		with tracer.span(f'db.{name}', { 'replica': pool is self.replica }) as span :
+			for attempt in range(maxretry, 0, -1) :
+				with tracer.span('db.acquire') :
+					conn: Connection = await pool.acquire()
+
+				prepared: Set[str] = self._prepared.setdefault(conn, set())
+				discard: bool = False
+				start: float = perf_counter()
+
+				try :
+					if name not in prepared :
+						try :
+							await pool.execute(f'PREPARE {name} AS {sql}', conn=conn)
+
+						except DuplicatePreparedStatement :
+							pass
+
+						prepared.add(name)
+
+					try :
+						data: Optional[List[Any]] = await pool.execute(execute, params, fetch_one, fetch_all, conn=conn)
+
+					except InvalidSqlStatementName :
+						# the statement was deallocated out from under us, prepare it again
+						await pool.execute(f'PREPARE {name} AS {sql}', conn=conn)
+						data: Optional[List[Any]] = await pool.execute(execute, params, fetch_one, fetch_all, conn=conn)
+
+					if fetch_one :
+						stats[2] += data is not None
+
+					elif fetch_all :
+						stats[2] += len(data)
+						span.set(rows=len(data))
+
+					return data
+
+				except (OperationalError, InterfaceError) as e :
+					stats[1] += 1
+					discard = True
+
+					if attempt <= 1 :
+						self.logger.critical('failed to reconnect to db.', exc_info=e)
+						raise
+
+					self.logger.warning('connection to db was severed, attempting to reconnect.', exc_info=e)
+
+				except CancelledError :
+					stats[1] += 1
+					discard = True
+					raise
+
+				except Exception :
+					stats[1] += 1
+					raise
+
+				finally :
+					pool.release(conn, discard)
+					elapsed: float = perf_counter() - start
+					stats[0] += 1
+					stats[3] += elapsed
+					stats[4] = max(stats[4], elapsed)
+
+					if elapsed > self._long_query :
+						self.logger.warning(f'query {name} took longer than {self._long_query} seconds:\n{sql}')
+
+
+	def pool_stats(self) -> Dict[str, PoolStats] :
+		"""
+		returns the connection usage and acquire wait times of the primary pool and, if configured, the replica pool
+		"""
+		stats: Dict[str, PoolStats] = { 'primary': self.pool.stats() }
+
+		if self.replica :
+			stats['replica'] = self.replica.stats()
+
+		return stats
+
+
+	def query_stats(self) -> Dict[str, QueryStats] :
+		"""
+		returns the latency and row counts of every prepared statement executed by this process
+		"""
+		return {
+			name: QueryStats(
+				calls=calls,
+				errors=errors,
+				rows=rows,
+				total_time=total,
+				mean_time=total / calls if calls else 0,
+				max_time=max_time,
+			)
+			for name, (calls, errors, rows, total, max_time) in self._stats.items()
+		}
+
+
+	def reset_query_stats(self) -> None :
+		self._stats.clear()
+
+
 	@AerospikeCache('kheina', 'following', '{user_id}|{target}', _kvs=FollowKVS)
 	async def following(self, user_id: int, target: int) -> bool :
 		"""
 		returns true if the user specified by user_id is following the user specified by target
 		"""
 
-		data = await self.query_async("""
+		data = await self.prepared_async('following', """
 			SELECT count(1)
 			FROM kheina.public.following
-			WHERE following.user_id = %s
-				AND following.follows = %s;
+			WHERE following.user_id = $1
+				AND following.follows = $2;
 			""",
 			(user_id, target),
 			fetch_all=True,
@@ -142,16 +432,17 @@ class DBI(SqlInterface) :
 		return bool(data[0])
 
 
+	@ChunkPolicies['following_many']
 	async def following_many(self, user_id: int, targets: List[int]) -> Dict[int, bool] :
 		"""
 		returns a map of target user id -> following bool
 		"""
 
-		data: List[Tuple[int, int]] = await self.query_async("""
+		data: List[Tuple[int, int]] = await self.prepared_async('following_many', """
 			SELECT following.follows, count(1)
 			FROM kheina.public.following
-			WHERE following.user_id = %s
-				AND following.follows = any(%s)
+			WHERE following.user_id = $1
+				AND following.follows = any($2)
 			GROUP BY following.follows;
 			""",
 			(user_id, targets),
@@ -166,50 +457,79 @@ class DBI(SqlInterface) :
 		for target, following in data :
 			following: bool = bool(following)
 			return_value[target] = following
-			ensure_future(FollowKVS.put_async(f'{user_id}|{target}', following))
+			write_behind.put_nowait(FollowKVS, f'{user_id}|{target}', following)
 
 		return return_value
 
 
-	@AerospikeCache('kheina', 'score', '{post_id}', _kvs=ScoreCache)
+	async def following_set(self, user_id: int) -> List[int] :
+		"""
+		returns the user ids of every user followed by the user specified by user_id, in ascending order
+		"""
+
+		data: List[Tuple[int]] = await self.prepared_async('following_set', """
+			SELECT following.follows
+			FROM kheina.public.following
+			WHERE following.user_id = $1
+			ORDER BY following.follows;
+			""",
+			(user_id,),
+			fetch_all=True,
+		)
+
+		return [follows for follows, in data]
+
+
 	async def _get_score(self, post_id: PostId) -> Optional[InternalScore] :
-		data: List[int] = await self.query_async("""
+		try :
+			return await ScoreCache.get_async(post_id)
+
+		except RecordNotFound :
+			pass
+
+		data: List[int] = await self.prepared_async('get_score', """
 			SELECT
 				post_scores.upvotes,
 				post_scores.downvotes
 			FROM kheina.public.post_scores
-			WHERE post_scores.post_id = %s;
+			WHERE post_scores.post_id = $1;
 			""",
 			(post_id.int(),),
 			fetch_one=True,
+			replica=True,
 		)
 
 		if not data :
 			return None
 
-		return InternalScore(
+		score: InternalScore = InternalScore(
 			up=data[0],
 			down=data[1],
 			total=sum(data),
 		)
+		# the replica may lag behind the primary, so this must not replace a score the vote service has stored since
+		write_behind.put_nowait(ScoreCache, post_id, score, if_absent=True)
+		return score
 
 
+	@ChunkPolicies['scores_many']
 	async def scores_many(self, post_ids: List[PostId]) -> Dict[PostId, Optional[InternalScore]] :
 		scores: Dict[PostId, Optional[InternalScore]] = {
 			post_id: None
 			for post_id in post_ids
 		}
 
-		data: List[Tuple(int, int, int)] = await self.query_async("""
+		data: List[Tuple(int, int, int)] = await self.prepared_async('scores_many', """
 			SELECT
 				post_scores.post_id,
 				post_scores.upvotes,
 				post_scores.downvotes
 			FROM kheina.public.post_scores
-			WHERE post_scores.post_id = any(%s);
+			WHERE post_scores.post_id = any($1);
 			""",
 			(list(map(int, post_ids)),),
 			fetch_all=True,
+			replica=True,
 		)
 
 		if not data :
@@ -223,19 +543,19 @@ class DBI(SqlInterface) :
 				total=up + down,
 			)
 			scores[post_id] = score
-			ensure_future(ScoreCache.put_async(post_id, score))
+			write_behind.put_nowait(ScoreCache, post_id, score, if_absent=True)
 
 		return scores
 
 
 	@AerospikeCache('kheina', 'votes', '{user_id}|{post_id}', _kvs=VoteCache)
 	async def _get_vote(self, user_id: int, post_id: PostId) -> int :
-		data: Optional[Tuple[bool]] = await self.query_async("""
+		data: Optional[Tuple[bool]] = await self.prepared_async('get_vote', """
 			SELECT
 				upvote
 			FROM kheina.public.post_votes
-			WHERE post_votes.user_id = %s
-				AND post_votes.post_id = %s;
+			WHERE post_votes.user_id = $1
+				AND post_votes.post_id = $2;
 			""",
 			(user_id, post_id.int()),
 			fetch_one=True,
@@ -247,18 +567,19 @@ class DBI(SqlInterface) :
 		return 1 if data[0] else -1
 
 
+	@ChunkPolicies['votes_many']
 	async def votes_many(self, user_id: int, post_ids: List[PostId]) -> Dict[PostId, int] :
 		votes: Dict[PostId, int] = {
 			post_id: 0
 			for post_id in post_ids
 		}
-		data: List[Tuple[int, int]] = await self.query_async("""
+		data: List[Tuple[int, int]] = await self.prepared_async('votes_many', """
 			SELECT
 				post_votes.post_id,
 				post_votes.upvote
 			FROM kheina.public.post_votes
-			WHERE post_votes.user_id = %s
-				AND post_votes.post_id = any(%s);
+			WHERE post_votes.user_id = $1
+				AND post_votes.post_id = any($2);
 			""",
 			(user_id, list(map(int, post_ids))),
 			fetch_all=True,
@@ -271,11 +592,34 @@ class DBI(SqlInterface) :
 			post_id: PostId = PostId(post_id)
 			vote: int = 1 if upvote else -1
 			votes[post_id] = vote
-			ensure_future(VoteCache.put_async(f'{user_id}|{post_id}', vote))
+			write_behind.put_nowait(VoteCache, f'{user_id}|{post_id}', vote)
 
 		return votes
 
 
+	async def votes_map(self, user_id: int, limit: int) -> List[Tuple[int, int]] :
+		"""
+		returns up to limit of the user's votes as (post id, vote) tuples, preferring votes on the newest posts
+		"""
+
+		data: List[Tuple[int, bool]] = await self.prepared_async('votes_map', """
+			SELECT
+				post_votes.post_id,
+				post_votes.upvote
+			FROM kheina.public.post_votes
+				INNER JOIN kheina.public.posts
+					ON posts.post_id = post_votes.post_id
+			WHERE post_votes.user_id = $1
+			ORDER BY posts.created_on DESC
+			LIMIT $2;
+			""",
+			(user_id, limit),
+			fetch_all=True,
+		)
+
+		return [(post_id, 1 if upvote else -1) for post_id, upvote in data]
+
+
 	async def getScore(self, user: KhUser, post_id: PostId) -> Optional[Score] :
 		score: Task[Optional[InternalScore]] = ensure_future(self._get_score(post_id))
 		vote: Task[int] = ensure_future(self._get_vote(user.user_id, post_id))
@@ -293,28 +637,114 @@ class DBI(SqlInterface) :
 		)
 
 
-	@AerospikeCache('kheina', 'tag_count', '{tag}', _kvs=CountKVS)
 	async def tagCount(self, tag: str) -> int :
-		data = await self.query_async("""
-			SELECT COUNT(1)
+		try :
+			return await CountKVS.get_async(tag)
+
+		except RecordNotFound :
+			return (await self.tag_counts_many([tag]))[tag]
+
+
+	@ChunkPolicies['tag_counts_many']
+	async def tag_counts_many(self, tags: List[str]) -> Dict[str, int] :
+		"""
+		returns a map of tag -> number of public posts with that tag
+		"""
+		counts: Dict[str, int] = {
+			tag: 0
+			for tag in tags
+		}
+
+		data: List[Tuple[str, int]] = await self.prepared_async('tag_counts_many', """
+			SELECT tags.tag, COUNT(1)
 			FROM kheina.public.tags
 				INNER JOIN kheina.public.tag_post
 					ON tags.tag_id = tag_post.tag_id
 				INNER JOIN kheina.public.posts
 					ON tag_post.post_id = posts.post_id
 						AND posts.privacy_id = privacy_to_id('public')
-			WHERE tags.tag = %s;
+			WHERE tags.tag = any($1)
+			GROUP BY tags.tag;
 			""",
-			(tag,),
-			fetch_one=True,
+			(tags,),
+			fetch_all=True,
+			replica=True,
 		)
 
-		if not data :
-			return 0
+		for tag, count in data :
+			counts[tag] = count
 
-		return data[0]
+		for tag, count in counts.items() :
+			# counts are adjusted in place as tags change, so a count from this read must not replace one that's been stored since
+			write_behind.put_nowait(CountKVS, tag, count, if_absent=True)
 
+		return counts
 
+
+	async def reconcile_tag_counts(self) -> int :
+		"""
+		recounts every tag and overwrites the cached counts. counts are otherwise only adjusted incrementally, so this should be run periodically to correct any drift
+
+		:return: the number of tags reconciled
+		"""
+		data: List[Tuple[str, int]] = await self.prepared_async('reconcile_tag_counts', """
+			SELECT tags.tag, COUNT(posts.post_id)
+			FROM kheina.public.tags
+				LEFT JOIN kheina.public.tag_post
+					ON tags.tag_id = tag_post.tag_id
+				LEFT JOIN kheina.public.posts
+					ON tag_post.post_id = posts.post_id
+						AND posts.privacy_id = privacy_to_id('public')
+			GROUP BY tags.tag;
+			""",
+			fetch_all=True,
+		)
+
+		for tag, count in data :
+			# this isn't on a read path and every count needs to be written, so it waits for room rather than dropping counts
+			await write_behind.put(CountKVS, tag, count)
+
+		await write_behind.drain()
+		return len(data)
+
+
+	async def tags_snapshot(self) -> List[Tuple[str, TagGroupPortable, bool]] :
+		"""
+		returns every tag as a (tag, group, deprecated) tuple
+		"""
+		data: List[Tuple[str, str, bool]] = await self.prepared_async('tags_snapshot', """
+			SELECT tags.tag, tag_classes.class, tags.deprecated
+			FROM kheina.public.tags
+				INNER JOIN kheina.public.tag_classes
+					ON tag_classes.class_id = tags.class_id;
+			""",
+			fetch_all=True,
+			replica=True,
+		)
+
+		return [(tag, TagGroupPortable(group), deprecated) for tag, group, deprecated in data]
+
+
+	async def tag_inheritance(self) -> List[Tuple[str, str]] :
+		"""
+		returns every inheritance edge as a (parent, child) tuple, where applying the parent tag to a post also applies the child
+		"""
+		data: List[Tuple[str, str]] = await self.prepared_async('tag_inheritance', """
+			SELECT parent.tag, child.tag
+			FROM kheina.public.tag_inheritance
+				INNER JOIN kheina.public.tags AS parent
+					ON parent.tag_id = tag_inheritance.parent
+				INNER JOIN kheina.public.tags AS child
+					ON child.tag_id = tag_inheritance.child;
+			""",
+			fetch_all=True,
+			replica=True,
+		)
+
+		return list(map(tuple, data))
+
+
+	@ChunkPolicies['tags_many']
 	async def tags_many(self, post_ids: List[PostId]) -> Dict[PostId, List[str]] :
 		# TODO: it may be worth doing a more complex query here for the tag classes
 		# so that the response data can be cached for future use
@@ -322,17 +752,18 @@ class DBI(SqlInterface) :
 			post_id: []
 			for post_id in post_ids
 		}
-		data: List[Tuple[int, List[str]]] = await self.query_async("""
+		data: List[Tuple[int, List[str]]] = await self.prepared_async('tags_many', """
 			SELECT tag_post.post_id, array_agg(tags.tag)
 			FROM kheina.public.tag_post
 				INNER JOIN kheina.public.tags
 					ON tags.tag_id = tag_post.tag_id
 						AND tags.deprecated = false
-			WHERE tag_post.post_id = any(%s)
+			WHERE tag_post.post_id = any($1)
 			GROUP BY tag_post.post_id;
 			""",
 			(list(map(int, post_ids)),),
 			fetch_all=True,
+			replica=True,
 		)
 
 		for post_id, tag_list in data :
@@ -342,14 +773,15 @@ class DBI(SqlInterface) :
 
 
 	async def _handle_to_user_id(self, handle: str) -> int :
-		data = await self.query_async("""
+		data = await self.prepared_async('handle_to_user_id', """
 			SELECT
 				users.user_id
 			FROM kheina.public.users
-			WHERE lower(users.handle) = lower(%s);
+			WHERE lower(users.handle) = lower($1);
 			""",
 			(handle.lower(),),
 			fetch_one=True,
+			replica=True,
 		)
 
 		if not data :
@@ -358,9 +790,37 @@ class DBI(SqlInterface) :
 		return data[0]
 
 
+	def _internal_user(self, datum: tuple) -> InternalUser :
+		verified: Optional[Verified] = None
+
+		if datum[9] :
+			verified = Verified.admin
+
+		elif datum[10] :
+			verified = Verified.mod
+
+		elif datum[11] :
+			verified = Verified.artist
+
+		return InternalUser(
+			user_id = datum[0],
+			name = datum[1],
+			handle = datum[2],
+			privacy = privacy_map[datum[3]],
+			icon = datum[4],
+			website = datum[5],
+			created = datum[6],
+			description = datum[7],
+			banner = datum[8],
+			verified = verified,
+			badges = list(map(badge_map.__getitem__, filter(None, datum[12]))),
+		)
+
+
+	@ChunkPolicies['users_many']
 	async def users_many(self, user_ids: List[int]) -> Dict[int, InternalUser] :
 
-		data: List[tuple] = await self.query_async("""
+		data: List[tuple] = await self.prepared_async('users_many', """
 			SELECT
 				users.user_id,
 				users.display_name,
@@ -378,12 +838,13 @@ class DBI(SqlInterface) :
 			FROM kheina.public.users
 				LEFT JOIN kheina.public.user_badge
 					ON user_badge.user_id = users.user_id
-			WHERE users.user_id = any(%s)
+			WHERE users.user_id = any($1)
 			GROUP BY
 				users.user_id;
 			""",
 			(user_ids,),
 			fetch_all=True,
+			replica=True,
 		)
 
 		if not data :
@@ -391,31 +852,272 @@ class DBI(SqlInterface) :
 
 		users: Dict[int, InternalUser] = { }
 		for datum in data :
-			verified: Optional[Verified] = None
-
-			if datum[9] :
-				verified = Verified.admin
-
-			elif datum[10] :
-				verified = Verified.mod
-
-			elif datum[11] :
-				verified = Verified.artist
-
-			user: InternalUser = InternalUser(
-				user_id = datum[0],
-				name = datum[1],
-				handle = datum[2],
-				privacy = privacy_map[datum[3]],
-				icon = datum[4],
-				website = datum[5],
-				created = datum[6],
-				description = datum[7],
-				banner = datum[8],
-				verified = verified,
-				badges = list(map(badge_map.__getitem__, filter(None, datum[12]))),
-			)
+			user: InternalUser = self._internal_user(datum)
 			users[datum[0]] = user
-			ensure_future(UserKVS.put_async(str(datum[0]), user))
+			write_behind.put_nowait(UserKVS, str(datum[0]), user, if_absent=True)
 
 		return users
+
+
+	async def hydrate_many(self, user_ids: List[int], scored_ids: List[PostId], post_ids: List[PostId]) -> Tuple[Dict[int, InternalUser], Dict[PostId, Optional[InternalScore]], Dict[PostId, List[str]]] :
+		"""
+		fetches the results of users_many, scores_many, and tags_many together in a single round trip, caching users and scores the same way
+
+		:return: tuple of (user id -> user, post id -> score, post id -> tags)
+		"""
+		scores: Dict[PostId, Optional[InternalScore]] = {
+			post_id: None
+			for post_id in scored_ids
+		}
+		tags: Dict[PostId, List[str]] = {
+			post_id: []
+			for post_id in post_ids
+		}
+
+		data: Tuple[Optional[list], Optional[list], Optional[list]] = await self.prepared_async('hydrate_many', """
+			WITH scores AS (
+				SELECT
+					post_scores.post_id,
+					post_scores.upvotes,
+					post_scores.downvotes
+				FROM kheina.public.post_scores
+				WHERE post_scores.post_id = any($2)
+			),
+			tags AS (
+				SELECT tag_post.post_id, array_agg(tags.tag) AS tags
+				FROM kheina.public.tag_post
+					INNER JOIN kheina.public.tags
+						ON tags.tag_id = tag_post.tag_id
+							AND tags.deprecated = false
+				WHERE tag_post.post_id = any($3)
+				GROUP BY tag_post.post_id
+			),
+			users AS (
+				SELECT
+					users.user_id,
+					users.display_name,
+					users.handle,
+					users.privacy_id,
+					users.icon,
+					users.website,
+					users.created_on,
+					users.description,
+					users.banner,
+					users.admin,
+					users.mod,
+					users.verified,
+					array_agg(user_badge.badge_id) AS badges
+				FROM kheina.public.users
+					LEFT JOIN kheina.public.user_badge
+						ON user_badge.user_id = users.user_id
+				WHERE users.user_id = any($1)
+				GROUP BY
+					users.user_id
+			)
+			SELECT
+				(SELECT json_agg(json_build_array(
+					users.user_id,
+					users.display_name,
+					users.handle,
+					users.privacy_id,
+					users.icon,
+					users.website,
+					users.created_on,
+					users.description,
+					users.banner,
+					users.admin,
+					users.mod,
+					users.verified,
+					users.badges
+				)) FROM users),
+				(SELECT json_agg(json_build_array(scores.post_id, scores.upvotes, scores.downvotes)) FROM scores),
+				(SELECT json_agg(json_build_array(tags.post_id, tags.tags)) FROM tags);
+			""",
+			(user_ids, list(map(int, scored_ids)), list(map(int, post_ids))),
+			fetch_one=True,
+			replica=True,
+		)
+
+		users: Dict[int, InternalUser] = { }
+
+		# json_agg returns null rather than an empty array when there are no rows
+		for datum in data[0] or [] :
+			user: InternalUser = self._internal_user(datum)
+			users[datum[0]] = user
+			write_behind.put_nowait(UserKVS, str(datum[0]), user, if_absent=True)
+
+		for post_id, up, down in data[1] or [] :
+			post_id: PostId = PostId(post_id)
+			score: InternalScore = InternalScore(
+				up=up,
+				down=down,
+				total=up + down,
+			)
+			scores[post_id] = score
+			write_behind.put_nowait(ScoreCache, post_id, score, if_absent=True)
+
+		for post_id, tag_list in data[2] or [] :
+			tags[PostId(post_id)] = list(filter(None, tag_list))
+
+		return users, scores, tags
+
+
+	async def _stream(self, sql: str, params: tuple = (), chunk_size: int = 1000) -> AsyncIterator[List[tuple]] :
+		"""
+		runs the query through a server-side cursor on its own read only connection, yielding chunk_size rows at a time.
+		a separate connection is required since the shared connection rolls back after every query, which would close the cursor.
+		"""
+
+		loop = get_event_loop()
+
+		with ThreadPoolExecutor(max_workers=1) as threadpool :
+			conn: Connection = await loop.run_in_executor(threadpool, partial(dbConnect, **db))
+
+			try :
+				conn.set_session(readonly=True)
+				cur: Cursor = conn.cursor(name=f'export_{uuid4().hex}')
+				cur.itersize = chunk_size
+				await loop.run_in_executor(threadpool, cur.execute, sql, params)
+
+				while True :
+					data: List[tuple] = await loop.run_in_executor(threadpool, cur.fetchmany, chunk_size)
+
+					if not data :
+						break
+
+					yield data
+
+			finally :
+				conn.close()
+
+
+	async def export_users(self, chunk_size: int = 1000) -> AsyncIterator[InternalUser] :
+		"""
+		streams every user in ascending user id order, holding at most chunk_size rows in memory at once
+		"""
+
+		async for data in self._stream("""
+			SELECT
+				users.user_id,
+				users.display_name,
+				users.handle,
+				users.privacy_id,
+				users.icon,
+				users.website,
+				users.created_on,
+				users.description,
+				users.banner,
+				users.admin,
+				users.mod,
+				users.verified,
+				array_agg(user_badge.badge_id)
+			FROM kheina.public.users
+				LEFT JOIN kheina.public.user_badge
+					ON user_badge.user_id = users.user_id
+			GROUP BY
+				users.user_id
+			ORDER BY users.user_id;
+			""",
+			chunk_size=chunk_size,
+		) :
+			for datum in data :
+				yield self._internal_user(datum)
+
+
+	async def export_posts(self, chunk_size: int = 1000) -> AsyncIterator['InternalPost'] :
+		"""
+		streams every post in ascending post id order, holding at most chunk_size rows in memory at once
+		"""
+
+		# InternalPost is defined alongside the client, which itself depends on this module
+		from .internal import InternalPost
+
+		async for data in self._stream("""
+			SELECT
+				posts.post_id,
+				posts.title,
+				posts.description,
+				posts.uploader,
+				ratings.rating,
+				posts.parent,
+				privacy.type,
+				posts.created_on,
+				posts.updated_on,
+				posts.filename,
+				media_type.file_type,
+				media_type.mime_type,
+				posts.width,
+				posts.height
+			FROM kheina.public.posts
+				INNER JOIN kheina.public.ratings
+					ON ratings.rating_id = posts.rating
+				INNER JOIN kheina.public.privacy
+					ON privacy.privacy_id = posts.privacy_id
+				LEFT JOIN kheina.public.media_type
+					ON media_type.media_type_id = posts.media_type_id
+			ORDER BY posts.post_id;
+			""",
+			chunk_size=chunk_size,
+		) :
+			for datum in data :
+				yield InternalPost(
+					post_id = datum[0],
+					title = datum[1],
+					description = datum[2],
+					user_id = datum[3],
+					rating = datum[4],
+					parent = datum[5],
+					privacy = datum[6],
+					created = datum[7],
+					updated = datum[8],
+					filename = datum[9],
+					media_type = { 'file_type': datum[10], 'mime_type': datum[11] } if datum[10] else None,
+					size = { 'width': datum[12], 'height': datum[13] } if datum[12] else None,
+				)
+
+
+	async def export_scores(self, chunk_size: int = 1000) -> AsyncIterator[InternalPostScore] :
+		"""
+		streams the score of every scored post in ascending post id order
+		"""
+
+		async for data in self._stream("""
+			SELECT
+				post_scores.post_id,
+				post_scores.upvotes,
+				post_scores.downvotes
+			FROM kheina.public.post_scores
+			ORDER BY post_scores.post_id;
+			""",
+			chunk_size=chunk_size,
+		) :
+			for post_id, up, down in data :
+				yield InternalPostScore(
+					post_id=post_id,
+					up=up,
+					down=down,
+					total=up + down,
+				)
+
+
+	async def export_tags(self, chunk_size: int = 1000) -> AsyncIterator[InternalPostTags] :
+		"""
+		streams the non-deprecated tags of every tagged post in ascending post id order
+		"""
+
+		async for data in self._stream("""
+			SELECT tag_post.post_id, array_agg(tags.tag)
+			FROM kheina.public.tag_post
+				INNER JOIN kheina.public.tags
+					ON tags.tag_id = tag_post.tag_id
+						AND tags.deprecated = false
+			GROUP BY tag_post.post_id
+			ORDER BY tag_post.post_id;
+			""",
+			chunk_size=chunk_size,
+		) :
+			for post_id, tag_list in data :
+				yield InternalPostTags(
+					post_id=post_id,
+					tags=list(filter(None, tag_list)),
+				)
@@ -0,0 +1,266 @@
+from asyncio import CancelledError, Future, Semaphore, Task, TimeoutError, ensure_future, get_event_loop, wait_for
+from collections import deque
+from time import perf_counter
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from psycopg2 import InterfaceError, OperationalError
+from psycopg2 import connect as dbConnect
+from psycopg2.extensions import POLL_OK, POLL_READ, POLL_WRITE
+from psycopg2.extensions import connection as Connection
+from psycopg2.extensions import cursor as Cursor
+from pydantic import BaseModel
+
+
+class PoolStats(BaseModel) :
+	size: int
+	idle: int
+	in_use: int
+	waiting: int
+	acquired: int
+	timeouts: int
+	mean_wait: float
+	max_wait: float
+
+
+class PoolTimeout(TimeoutError) :
+	pass
+
+
+async def _wait(conn: Connection) -> None :
+	"""
+	drives an asynchronous psycopg2 connection until its current operation completes, yielding to the event loop whenever it would block
+	"""
+	loop = get_event_loop()
+
+	while True :
+		state: int = conn.poll()
+
+		if state == POLL_OK :
+			return
+
+		future: Future = loop.create_future()
+		done = lambda : future.done() or future.set_result(None)
+		fd: int = conn.fileno()
+
+		if state == POLL_READ :
+			loop.add_reader(fd, done)
+
+			try :
+				await future
+
+			finally :
+				loop.remove_reader(fd)
+
+		elif state == POLL_WRITE :
+			loop.add_writer(fd, done)
+
+			try :
+				await future
+
+			finally :
+				loop.remove_writer(fd)
+
+		else :
+			raise OperationalError(f'unexpected poll state: {state}')
+
+
+class ConnectionPool :
+	"""
+	pool of asynchronous psycopg2 connections. at most max_size connections are ever open or in use at once,
+	and callers wait up to acquire_timeout seconds for one to free up before PoolTimeout is raised.
+	the pool is opened in the background on first use, and connections beyond min_size are closed once they've been idle for idle_timeout seconds.
+	connections run in autocommit mode, as required by psycopg2's asynchronous support.
+	"""
+
+	def __init__(self: 'ConnectionPool', dsn: Dict[str, Any], min_size: int = 1, max_size: int = 10, acquire_timeout: float = 5, idle_timeout: float = 300) :
+		"""
+		:param dsn: connection kwargs, as passed to psycopg2.connect
+		:param min_size: number of connections kept open once the pool has warmed up
+		:param max_size: maximum number of connections, and therefore concurrent queries, at once
+		:param acquire_timeout: seconds to wait for a free connection
+		:param idle_timeout: seconds a connection beyond min_size may sit idle before it's closed
+		"""
+		self.dsn: Dict[str, Any] = dsn
+		self.min_size: int = min_size
+		self.max_size: int = max_size
+		self.acquire_timeout: float = acquire_timeout
+		self.idle_timeout: float = idle_timeout
+		# (connection, time released). connections are reused from the right, so the longest idle are on the left
+		self._idle: Deque[Tuple[Connection, float]] = deque()
+		self._semaphore: Optional[Semaphore] = None
+		self._opened: bool = False
+		self._size: int = 0
+		self._waiting: int = 0
+		self._acquired: int = 0
+		self._timeouts: int = 0
+		self._total_wait: float = 0
+		self._max_wait: float = 0
+
+
+	async def _connect(self: 'ConnectionPool') -> Connection :
+		conn: Connection = dbConnect(async_=1, **self.dsn)
+
+		try :
+			await _wait(conn)
+
+		except (Exception, CancelledError) :
+			conn.close()
+			raise
+
+		return conn
+
+
+	def _trim(self: 'ConnectionPool') -> None :
+		expired: float = perf_counter() - self.idle_timeout
+
+		while self._idle and self._size > self.min_size and self._idle[0][1] < expired :
+			self._idle.popleft()[0].close()
+			self._size -= 1
+
+
+	async def acquire(self: 'ConnectionPool') -> Connection :
+		if self._semaphore is None :
+			# created lazily so that it belongs to the running loop
+			self._semaphore = Semaphore(self.max_size)
+
+		if not self._opened :
+			self._opened = True
+			opening: Task = ensure_future(self.open())
+			# the pool still works if warming up fails, connections are just opened as they're needed instead
+			opening.add_done_callback(lambda t : t.cancelled() or t.exception())
+
+		start: float = perf_counter()
+		self._waiting += 1
+
+		try :
+			await wait_for(self._semaphore.acquire(), self.acquire_timeout)
+
+		except TimeoutError :
+			self._timeouts += 1
+			raise PoolTimeout(f'failed to acquire a database connection within {self.acquire_timeout} seconds.')
+
+		finally :
+			self._waiting -= 1
+
+		elapsed: float = perf_counter() - start
+		self._acquired += 1
+		self._total_wait += elapsed
+		self._max_wait = max(self._max_wait, elapsed)
+
+		self._trim()
+
+		while self._idle :
+			conn: Connection = self._idle.pop()[0]
+
+			if not conn.closed :
+				return conn
+
+			self._size -= 1
+
+		# counted before connecting so that the pool isn't warmed up past min_size meanwhile
+		self._size += 1
+
+		try :
+			conn: Connection = await self._connect()
+
+		except (Exception, CancelledError) :
+			self._size -= 1
+			self._semaphore.release()
+			raise
+
+		return conn
+
+
+	def release(self: 'ConnectionPool', conn: Connection, discard: bool = False) -> None :
+		"""
+		returns the connection to the pool. discard closes it instead, such as after a connection error
+		"""
+		if discard or conn.closed :
+			if not conn.closed :
+				conn.close()
+
+			self._size -= 1
+
+		else :
+			self._idle.append((conn, perf_counter()))
+			self._trim()
+
+		self._semaphore.release()
+
+
+	async def execute(self: 'ConnectionPool', sql: str, params: Optional[Tuple[Any, ...]] = None, fetch_one: bool = False, fetch_all: bool = False, conn: Optional[Connection] = None) -> Optional[List[Any]] :
+		"""
+		runs a single query, on the given connection or on one acquired from the pool.
+		broken connections are discarded rather than returned to the pool.
+		"""
+		if conn is not None :
+			return await self._execute(conn, sql, params, fetch_one, fetch_all)
+
+		conn = await self.acquire()
+		discard: bool = False
+
+		try :
+			return await self._execute(conn, sql, params, fetch_one, fetch_all)
+
+		except (OperationalError, InterfaceError, CancelledError) :
+			# a cancelled query leaves the connection busy, so it can't be reused either
+			discard = True
+			raise
+
+		finally :
+			self.release(conn, discard)
+
+
+	async def _execute(self: 'ConnectionPool', conn: Connection, sql: str, params: Optional[Tuple[Any, ...]], fetch_one: bool, fetch_all: bool) -> Optional[List[Any]] :
+		cur: Cursor = conn.cursor()
+
+		try :
+			cur.execute(sql, params)
+			await _wait(conn)
+
+			if fetch_one :
+				return cur.fetchone()
+
+			elif fetch_all :
+				return cur.fetchall()
+
+		finally :
+			cur.close()
+
+
+	async def open(self: 'ConnectionPool') -> None :
+		"""
+		opens connections until min_size are open. called in the background on first use, but can be awaited on startup to warm the pool up front
+		"""
+		self._opened = True
+
+		while self._size < min(self.min_size, self.max_size) :
+			self._size += 1
+
+			try :
+				conn: Connection = await self._connect()
+
+			except (Exception, CancelledError) :
+				self._size -= 1
+				raise
+
+			self._idle.appendleft((conn, perf_counter()))
+
+
+	def close(self: 'ConnectionPool') -> None :
+		while self._idle :
+			self._idle.pop()[0].close()
+			self._size -= 1
+
+
+	def stats(self: 'ConnectionPool') -> PoolStats :
+		return PoolStats(
+			size=self._size,
+			idle=len(self._idle),
+			in_use=self._size - len(self._idle),
+			waiting=self._waiting,
+			acquired=self._acquired,
+			timeouts=self._timeouts,
+			mean_wait=self._total_wait / self._acquired if self._acquired else 0,
+			max_wait=self._max_wait,
+		)
@@ -0,0 +1,149 @@
+from asyncio import Event, Task, ensure_future, get_event_loop, sleep
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from ._caching import put_if_absent
+
+
+if TYPE_CHECKING :
+	from kh_common.caching.key_value_store import KeyValueStore
+
+
+class WriteBehindStats(BaseModel) :
+	depth: int
+	queued: int
+	coalesced: int
+	written: int
+	failed: int
+	dropped: int
+	flushes: int
+
+
+class WriteBehind :
+	"""
+	queues kvs writes and flushes them in batches from a single background task, rather than sending each write on its own.
+	a write to a key that's already queued replaces the queued value. once max_size writes are queued, put waits for room while put_nowait drops the write.
+	writes queued with if_absent are skipped if the key already exists by the time they're written, so that they never overwrite a newer value.
+	kvs stores have no bulk write, so each batch is written in a single executor call instead.
+	"""
+
+	def __init__(self: 'WriteBehind', batch_size: int = 256, interval: float = 0.05, max_size: int = 10000) :
+		"""
+		:param batch_size: maximum writes per batch. a batch is written immediately once this many writes are queued
+		:param interval: seconds to wait for more writes before writing a partial batch
+		:param max_size: maximum number of writes queued at once
+		"""
+		self.batch_size: int = batch_size
+		self.interval: float = interval
+		self.max_size: int = max_size
+		self._pending: 'OrderedDict[Tuple[int, str], Tuple[KeyValueStore, str, Any, int, bool]]' = OrderedDict()
+		self._task: Optional[Task] = None
+		self._room: Optional[Event] = None
+		self._draining: bool = False
+		self._queued: int = 0
+		self._coalesced: int = 0
+		self._written: int = 0
+		self._failed: int = 0
+		self._dropped: int = 0
+		self._flushes: int = 0
+
+
+	def put_nowait(self: 'WriteBehind', kvs: 'KeyValueStore', key: str, data: Any, TTL: int = 0, if_absent: bool = False) -> bool :
+		"""
+		queues the write without waiting
+
+		:return: False if the queue was full and the write was dropped
+		"""
+		index: Tuple[int, str] = (id(kvs), key)
+
+		if index in self._pending :
+			self._coalesced += 1
+
+		elif len(self._pending) >= self.max_size :
+			self._dropped += 1
+			return False
+
+		else :
+			self._queued += 1
+
+		self._pending[index] = (kvs, key, data, TTL, if_absent)
+
+		if not self._task or self._task.done() :
+			self._task = ensure_future(self._run())
+
+		return True
+
+
+	async def put(self: 'WriteBehind', kvs: 'KeyValueStore', key: str, data: Any, TTL: int = 0, if_absent: bool = False) -> None :
+		"""
+		queues the write, waiting for room if the queue is full
+		"""
+		while len(self._pending) >= self.max_size and (id(kvs), key) not in self._pending :
+			if self._room is None :
+				self._room = Event()
+
+			self._room.clear()
+			await self._room.wait()
+
+		self.put_nowait(kvs, key, data, TTL, if_absent)
+
+
+	def _write(self: 'WriteBehind', batch: List[Tuple['KeyValueStore', str, Any, int, bool]]) -> None :
+		for kvs, key, data, TTL, if_absent in batch :
+			try :
+				if if_absent :
+					put_if_absent(kvs, key, data, TTL)
+
+				else :
+					kvs.put(key, data, TTL)
+
+				self._written += 1
+
+			except Exception :
+				# a failed fill only costs a cache miss later, so it isn't retried
+				self._failed += 1
+
+
+	async def _run(self: 'WriteBehind') -> None :
+		while self._pending :
+			if len(self._pending) < self.batch_size and not self._draining :
+				await sleep(self.interval)
+
+			batch: List[Tuple[KeyValueStore, str, Any, int, bool]] = []
+
+			while self._pending and len(batch) < self.batch_size :
+				batch.append(self._pending.popitem(last=False)[1])
+
+			if self._room :
+				self._room.set()
+
+			self._flushes += 1
+			await get_event_loop().run_in_executor(None, self._write, batch)
+
+
+	async def drain(self: 'WriteBehind') -> None :
+		"""
+		writes everything queued without waiting for full batches. should be awaited on shutdown so that queued writes aren't lost
+		"""
+		self._draining = True
+
+		try :
+			while self._task and not self._task.done() :
+				await self._task
+
+		finally :
+			self._draining = False
+
+
+	def stats(self: 'WriteBehind') -> WriteBehindStats :
+		return WriteBehindStats(
+			depth=len(self._pending),
+			queued=self._queued,
+			coalesced=self._coalesced,
+			written=self._written,
+			failed=self._failed,
+			dropped=self._dropped,
+			flushes=self._flushes,
+		)
@@ -1,33 +1,84 @@
-from asyncio import Task, ensure_future
-from collections import defaultdict
-from datetime import datetime
-from typing import Any, Callable, Coroutine, Dict, Iterable, List, Optional, Set, Tuple
-
+from asyncio import AbstractEventLoop, Future, Task, TimeoutError, TimerHandle, ensure_future, gather, get_event_loop, wait_for
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from enum import Enum, unique
+from hashlib import blake2b
+from json import dumps
+from time import time
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
+
+from aerospike import POLICY_EXISTS_UPDATE
+from aerospike.exception import RecordNotFound
+from aiohttp import ClientResponseError
 from kh_common.auth import KhUser
-from kh_common.caching import AerospikeCache, ArgsCache
+from kh_common.caching import AerospikeCache
 from kh_common.caching.key_value_store import KeyValueStore
+from kh_common.exceptions.http_error import BadRequest, NotFound, ServiceUnavailable
 from kh_common.gateway import Gateway
 from kh_common.utilities import flatten
 from pydantic import BaseModel
 
 from ..client import Client
 from ..constants import ConfigHost, PostHost, TagHost, UserHost
-from ._database import DBI, FollowKVS, InternalScore, InternalUser, ScoreCache, UserKVS, VoteCache
+from ..local.implications import TagImplications
+from ..local.inverted import PostTagIndex
+from ..tracing import TracedGateway, TracedKeyValueStore, tracer
+from ._caching import StaleWhileRevalidate, update_record
+from ._chunking import ChunkPolicy
+from ._database import DBI, CountKVS, FollowSet, FollowSetKVS, InternalScore, InternalUser, ScoreCache, UserKVS, VoteCache, VoteMap, VoteMapKVS, write_behind
 from ._shared import PostId, PostSize, User, UserPortable
 from .config import UserConfig
-from .post import MediaType, Post, PostId, PostSize, PostSort, Privacy, Rating, Score
+from .post import MediaType, Post, PostBatch, PostCursor, PostId, PostProjection, PostSize, PostSort, Privacy, Rating, Score
 from .tag import Tag, TagGroupPortable, TagGroups
 from .user import UserPortable
 
 
 # each internal endpoint will have it's own exported kvs so that they can be overwritten or imported by users
-UserConfigKVS: KeyValueStore = KeyValueStore('kheina', 'configs')
-TagKVS: KeyValueStore = KeyValueStore('kheina', 'tags')
-PostKVS: KeyValueStore = KeyValueStore('kheina', 'posts')
+UserConfigKVS: KeyValueStore = TracedKeyValueStore('kheina', 'configs')
+# compiled block trees are stored alongside the user configs they were compiled from
+BlockTreeKeyFormat: str = 'block_tree.{user_id}'
+# incremented whenever a user's config is invalidated, so that every process knows to drop its local copy
+BlockGenerationKeyFormat: str = 'block_generation.{user_id}'
+BlockTreeLocalSize: int = 4096
+FollowSetLocalSize: int = 4096
+VoteMapLocalSize: int = 4096
+# at most this many votes are stored for a single user, anything past it falls back to per-vote lookups
+VoteMapLimit: int = 10000
+TagKVS: KeyValueStore = TracedKeyValueStore('kheina', 'tags')
+PostKVS: KeyValueStore = TracedKeyValueStore('kheina', 'posts')
+UserPostsKVS: KeyValueStore = TracedKeyValueStore('kheina', 'user_posts')
+
+# user posts sorted by new are cached as a single list of the user's newest posts which is patched as posts are uploaded or edited.
+# this many pages of the default page size are kept, any pages outside of it are cached against the list's version
+UserPostsHeadPages: int = 3
+UserPostsPageSize: int = 64
+# other sort orders change as posts are voted on, so they can only expire
+UserPostsTTL: int = 300
+
+# when at least this share of a batch's uploaders, scores, and tags are missing from the cache, they're fetched in a single combined query
+HydrateMissRatio: float = 0.5
+
+# long key lists are split into chunks before being read from any kvs. each store has its own policy, since record sizes differ by orders of magnitude between them
+# NOTE: reads from a single kvs are serialized by the kvs itself, so chunks of the same store don't run in parallel
+KVSChunkPolicies: Dict[str, ChunkPolicy] = {
+	'posts': ChunkPolicy(chunk_size=1000, min_size=100, max_size=10000),
+	'score': ChunkPolicy(chunk_size=1000, min_size=100, max_size=10000),
+	'tag_count': ChunkPolicy(chunk_size=1000, min_size=100, max_size=10000),
+	'tags': ChunkPolicy(chunk_size=1000, min_size=100, max_size=10000),
+	'users': ChunkPolicy(chunk_size=1000, min_size=100, max_size=10000),
+	'votes': ChunkPolicy(chunk_size=1000, min_size=100, max_size=10000),
+}
 
 # internal functions sometimes need to interact with the db, this is done through this interface
 DB: DBI = DBI()
 
+# tags implied by a post's tags are taken into account when blocking. loaded on first use and refreshed once stale, but should be warmed on startup
+tag_implications: TagImplications = TagImplications()
+
+# set to a PostTagIndex to have the tags of every public post that's populated indexed for local tag queries
+post_tag_index: Optional[PostTagIndex] = None
+
 
 class _InternalClient(Client) :
 	"""
@@ -35,13 +86,16 @@ class _InternalClient(Client) :
 	Those are set up within this client so that the main client in the root does not break without internal auth/kvs access
 	"""
 
-	_user_config: Gateway = Gateway(ConfigHost + '/i1/user/{user_id}', UserConfig, method='GET')
-	_post_tags: Gateway = Gateway(TagHost + '/i1/tags/{post_id}', TagGroups, method='GET')
+	_user_config: Gateway = TracedGateway(ConfigHost + '/i1/user/{user_id}', UserConfig, method='GET')
+	_post_tags: Gateway = TracedGateway(TagHost + '/i1/tags/{post_id}', TagGroups, method='GET')
 	_user_posts: Gateway  # this will be assigned later
+	_posts: Gateway  # this will be assigned later
 	_post: Gateway  # this will be assigned later
 	_user: Gateway  # this will be assigned later
 	_tag: Gateway  # this will be assigned later
 
+	posts_many: Callable[[List[PostId]], Coroutine[Any, Any, Dict[PostId, 'InternalPost']]]
+
 	following_many: Callable[[KhUser, List[int]], Coroutine[Any, Any, Dict[int, bool]]]
 	users_many: Callable[[List[int]], Coroutine[Any, Any, Dict[int, InternalUser]]]
 
@@ -49,40 +103,194 @@ class _InternalClient(Client) :
 	scores_many: Callable[[List[PostId]], Coroutine[Any, Any, Dict[PostId, Optional[InternalScore]]]]
 
 	tags_many: Callable[[List[PostId]], Coroutine[Any, Any, Dict[PostId, List[str]]]]
+	hydrate_many: Callable[[List[int], List[PostId], List[PostId]], Coroutine[Any, Any, Tuple[Dict[int, InternalUser], Dict[PostId, Optional[InternalScore]], Dict[PostId, List[str]]]]]
+	tag_counts_many: Callable[[List[str]], Coroutine[Any, Any, Dict[str, int]]]
+
+	tag: Callable[[str], Coroutine[Any, Any, 'InternalTag']]
+	internal_tags_many: Callable[[List[str]], Coroutine[Any, Any, Dict[str, 'InternalTag']]]
+	tags_hydrate_many: Callable[[KhUser, List[str]], Coroutine[Any, Any, List[Tag]]]
 
 
 	def __hash__(self: '_InternalClient') -> int :
 		return 0
 
 
-	@AerospikeCache('kheina', 'configs', 'user.{user_id}', read_only=True, _kvs=UserConfigKVS)
+	@StaleWhileRevalidate(UserConfigKVS, 'user.{user_id}', soft_TTL=5, hard_TTL=60)
 	@Client.authenticated
 	async def user_config(self: Client, user_id: int, auth: str = None) -> UserConfig :
 		return await _InternalClient._user_config(user_id=user_id, auth=auth)
 
 
-	@AerospikeCache('kheina', 'users', '{user_id}', read_only=True, _kvs=UserKVS)
+	@StaleWhileRevalidate(UserKVS, '{user_id}', soft_TTL=30, hard_TTL=300)
 	@Client.authenticated
 	async def user(self: Client, user_id: int, auth: str = None) -> 'InternalUser' :
 		return await _InternalClient._user(user_id=user_id, auth=auth)
 
 
-	@AerospikeCache('kheina', 'tags', 'post.{post_id}', read_only=True, _kvs=TagKVS)
+	@StaleWhileRevalidate(TagKVS, 'post.{post_id}', soft_TTL=10, hard_TTL=120)
 	@Client.authenticated
 	async def post_tags(self: Client, post_id: PostId, auth: str = None) -> TagGroups :
 		return await _InternalClient._post_tags(post_id=post_id, auth=auth)
 
 
-	@AerospikeCache('kheina', 'posts', '{post_id}', read_only=True, _kvs=PostKVS)
+	@StaleWhileRevalidate(PostKVS, '{post_id}', soft_TTL=10, hard_TTL=120)
 	@Client.authenticated
 	async def post(self: Client, post_id: PostId, auth: str = None) -> 'InternalPost' :
 		return await _InternalClient._post(post_id=post_id, auth=auth)
 
 
-	# not cached (should be?)
 	@Client.authenticated
-	async def user_posts(self: Client, user_id: int, sort: PostSort = PostSort.new, count: int = 64, page: int = 1, auth: str = None) -> 'InternalPost' :
-		return await _InternalClient._user_posts({ 'sort': sort.name, 'count': count, 'page': page }, user_id=user_id, auth=auth)
+	async def user_posts(self: Client, user_id: int, sort: PostSort = PostSort.new, count: int = 64, page: int = 1, cursor: Optional[PostCursor] = None, auth: str = None) -> List['InternalPost'] :
+		"""
+		retrieves a page of the user's posts. when a cursor is provided, page is ignored and the page directly after the cursor is returned.
+		"""
+		key: str = f'{user_id}.{sort.name}.{count}.{cursor or page}'
+		body: Dict[str, Any] = { 'sort': sort.name, 'count': count, 'page': page }
+		cursor_key: Tuple[int, int]
+		cursor_owned: bool = False
+
+		if cursor :
+			body['cursor'] = cursor
+			cursor_sort, sort_key, cursor_id = cursor.decode()
+			cursor_key = (sort_key, cursor_id.int())
+
+			if cursor_sort != sort :
+				raise BadRequest('the provided cursor was created for a different sort order than the one requested.')
+
+		if sort == PostSort.new :
+			head: InternalUserPosts = await self._user_posts_head(user_id, auth)
+			start: Optional[int] = (page - 1) * count
+
+			if cursor :
+				# the page starts at the first post that sorts after the cursor, by its key and then its id.
+				# if every post within the head sorts before it, the page has to be fetched, unless the head holds every post
+				start = len(head.post_list) if head.complete else None
+
+				for index, post in enumerate(head.post_list) :
+					cursor_owned = cursor_owned or post.post_id == cursor_key[1]
+
+					if (_created_key(post), post.post_id) < cursor_key :
+						start = index
+						break
+
+			if cursor and not cursor_owned :
+				await self._user_posts_check_cursor(user_id, cursor_id, auth)
+
+			if start is not None and (head.complete or start + count <= len(head.post_list)) :
+				return head.post_list[start:start + count]
+
+			# pages outside of the head are only valid until the head changes
+			key += f'.{head.version}'
+
+		elif cursor :
+			await self._user_posts_check_cursor(user_id, cursor_id, auth)
+
+		try :
+			return await UserPostsKVS.get_async(key)
+
+		except RecordNotFound :
+			pass
+
+		posts: List[InternalPost] = await _InternalClient._user_posts(body, user_id=user_id, auth=auth)
+		write_behind.put_nowait(UserPostsKVS, key, posts, UserPostsTTL)
+
+		return posts
+
+
+	async def _user_posts_check_cursor(self: '_InternalClient', user_id: int, post_id: PostId, auth: str) -> None :
+		iposts: Dict[PostId, InternalPost] = await self.posts_many([post_id], auth=auth)
+
+		# the post may have been deleted since the cursor was created, in which case its key still positions the page
+		if post_id in iposts and iposts[post_id].user_id != user_id :
+			raise BadRequest('the provided cursor belongs to a different user than the one requested.')
+
+
+	async def _user_posts_head(self: '_InternalClient', user_id: int, auth: str) -> 'InternalUserPosts' :
+		try :
+			return await UserPostsKVS.get_async(f'{user_id}.{PostSort.new.name}')
+
+		except RecordNotFound :
+			return await self._user_posts_build_head(user_id, auth)
+
+
+	async def _user_posts_build_head(self: '_InternalClient', user_id: int, auth: str) -> 'InternalUserPosts' :
+		pages: List[List[InternalPost]] = await gather(*(
+			_InternalClient._user_posts({ 'sort': PostSort.new.name, 'count': UserPostsPageSize, 'page': page }, user_id=user_id, auth=auth)
+			for page in range(1, UserPostsHeadPages + 1)
+		))
+
+		head: InternalUserPosts = InternalUserPosts(version=int(time() * 1000))
+
+		for page in pages :
+			head.post_list += page
+
+			# a short page means we've reached the end of the user's posts
+			if len(page) < UserPostsPageSize :
+				head.complete = True
+				break
+
+		write_behind.put_nowait(UserPostsKVS, f'{user_id}.{PostSort.new.name}', head)
+
+		return head
+
+
+	@Client.authenticated
+	async def user_posts_precompute(self: Client, user_id: int, sorts: Iterable[PostSort] = (PostSort.new, PostSort.top, PostSort.hot), auth: str = None) -> None :
+		"""
+		populates the cache for the first few pages of the user's posts in each of the given sort orders.
+		should be run for users whose profiles are frequently viewed, such as after they upload.
+		"""
+		for sort in sorts :
+			if sort == PostSort.new :
+				await self._user_posts_build_head(user_id, auth)
+				continue
+
+			for page in range(1, UserPostsHeadPages + 1) :
+				posts: List[InternalPost] = await _InternalClient._user_posts({ 'sort': sort.name, 'count': UserPostsPageSize, 'page': page }, user_id=user_id, auth=auth)
+				await UserPostsKVS.put_async(f'{user_id}.{sort.name}.{UserPostsPageSize}.{page}', posts, UserPostsTTL)
+
+				if len(posts) < UserPostsPageSize :
+					break
+
+
+	async def user_posts_update(self: '_InternalClient', ipost: 'InternalPost') -> None :
+		"""
+		patches the uploader's cached posts sorted by new after the given post is uploaded or edited.
+		any cached pages outside of the patched list are invalidated.
+		"""
+		def modify(head: InternalUserPosts) -> InternalUserPosts :
+			post_list: List[InternalPost] = [post for post in head.post_list if post.post_id != ipost.post_id]
+
+			if ipost.privacy in UserPostsPrivacy :
+				index: int = 0
+
+				if ipost.created :
+					while index < len(post_list) and post_list[index].created and post_list[index].created > ipost.created :
+						index += 1
+
+				if index < len(post_list) or head.complete :
+					post_list.insert(index, ipost)
+
+			capacity: int = UserPostsHeadPages * UserPostsPageSize
+			head.complete = head.complete and len(post_list) <= capacity
+			head.post_list = post_list[:capacity]
+			head.version = max(head.version + 1, int(time() * 1000))
+			return head
+
+		# if nothing is cached there's nothing to patch, the next read will rebuild the list.
+		# concurrent patches are applied on top of each other, if the list is too contended to patch it's dropped instead
+		await update_record(UserPostsKVS, f'{ipost.user_id}.{PostSort.new.name}', modify)
+
+
+	async def user_posts_invalidate(self: '_InternalClient', user_id: int) -> None :
+		"""
+		drops the user's cached posts sorted by new, such as after a post is deleted
+		"""
+		try :
+			await UserPostsKVS.remove_async(f'{user_id}.{PostSort.new.name}')
+
+		except RecordNotFound :
+			pass
 
 
 	# this function routes directly to the db, so auth is unnecessary
@@ -91,6 +299,16 @@ class _InternalClient(Client) :
 		return await DB._handle_to_user_id(handle)
 
 
+	# this function routes directly to the db, so auth is unnecessary
+	async def tags_snapshot(self: Client) -> List[Tuple[str, TagGroupPortable, bool]] :
+		return await DB.tags_snapshot()
+
+
+	# this function routes directly to the db, so auth is unnecessary
+	async def tag_inheritance(self: Client) -> List[Tuple[str, str]] :
+		return await DB.tag_inheritance()
+
+
 class BlockTree :
 
 	def dict(self: 'BlockTree') :
@@ -108,6 +326,22 @@ class BlockTree :
 		return result
 
 
+	@staticmethod
+	def from_dict(data: Dict[str, Any]) -> 'BlockTree' :
+		"""
+		rebuilds a compiled tree from the output of BlockTree.dict
+		"""
+		tree: BlockTree = BlockTree()
+
+		if data.get('match') :
+			tree.match = { k: BlockTree.from_dict(v) for k, v in data['match'].items() }
+
+		if data.get('nomatch') :
+			tree.nomatch = { k: BlockTree.from_dict(v) for k, v in data['nomatch'].items() }
+
+		return tree
+
+
 	def __init__(self: 'BlockTree') :
 		self.tags: Set[str] = None
 		self.match: Dict[str, BlockTree] = None
@@ -170,48 +404,261 @@ class BlockTree :
 		return False
 
 
+# user id -> decoded follow set. recently used sets are kept at the end
+_follow_sets: OrderedDict = OrderedDict()
+
+
+@tracer.traced()
+async def fetch_follow_set(user_id: int) -> FollowSet :
+	"""
+	returns the set of every user followed by the given user. the set is loaded from the db once, then shared between workers through the kvs
+	"""
+	key: str = str(user_id)
+	follow_set: FollowSet
+
+	try :
+		data: Dict[str, Any] = await FollowSetKVS.get_async(key)
+
+	except RecordNotFound :
+		follow_set = FollowSet(int(time() * 1000), await DB.following_set(user_id))
+		write_behind.put_nowait(FollowSetKVS, key, { 'version': follow_set.version, 'follows': follow_set.tobytes() })
+
+	else :
+		# decoding the set is the expensive part, so only do it when the stored set has changed
+		if user_id in _follow_sets and _follow_sets[user_id].version == data['version'] :
+			_follow_sets.move_to_end(user_id)
+			return _follow_sets[user_id]
+
+		follow_set = FollowSet.from_bytes(data['version'], data['follows'])
+
+	_follow_sets[user_id] = follow_set
+
+	while len(_follow_sets) > FollowSetLocalSize :
+		_follow_sets.popitem(last=False)
+
+	return follow_set
+
+
+async def update_follow_set(user_id: int, target: int, following: bool) -> None :
+	"""
+	adds or removes target from the user's stored follow set. should be called by whichever service writes follows.
+	if the set isn't stored, it will be loaded from the db the next time it's needed, so nothing is done.
+	concurrent updates are applied on top of each other, if the set is too contended to update it's dropped instead.
+	"""
+	follow_set: Optional[FollowSet] = None
+
+	def modify(data: Dict[str, Any]) -> Dict[str, Any] :
+		nonlocal follow_set
+		follow_set = FollowSet.from_bytes(max(data['version'] + 1, int(time() * 1000)), data['follows'])
+
+		if following :
+			follow_set.add(target)
+
+		else :
+			follow_set.remove(target)
+
+		return { 'version': follow_set.version, 'follows': follow_set.tobytes() }
+
+	if await update_record(FollowSetKVS, str(user_id), modify) :
+		_follow_sets[user_id] = follow_set
+
+	else :
+		_follow_sets.pop(user_id, None)
+
+
+# user id -> decoded vote map. recently used maps are kept at the end
+_vote_maps: OrderedDict = OrderedDict()
+
+
+@tracer.traced()
+async def fetch_vote_map(user_id: int) -> VoteMap :
+	"""
+	returns the map of the given user's votes. the map is loaded from the db once, then shared between workers through the kvs
+	"""
+	key: str = str(user_id)
+	vote_map: VoteMap
+
+	try :
+		data: Dict[str, Any] = await VoteMapKVS.get_async(key)
+
+	except RecordNotFound :
+		votes: List[Tuple[int, int]] = await DB.votes_map(user_id, VoteMapLimit + 1)
+		vote_map = VoteMap(int(time() * 1000), len(votes) <= VoteMapLimit, votes[:VoteMapLimit])
+		write_behind.put_nowait(VoteMapKVS, key, _vote_map_record(vote_map))
+
+	else :
+		# decoding the map is the expensive part, so only do it when the stored map has changed
+		if user_id in _vote_maps and _vote_maps[user_id].version == data['version'] :
+			_vote_maps.move_to_end(user_id)
+			return _vote_maps[user_id]
+
+		vote_map = VoteMap.from_bytes(data['version'], data['complete'], data['post_ids'], data['votes'])
+
+	_vote_maps[user_id] = vote_map
+
+	while len(_vote_maps) > VoteMapLocalSize :
+		_vote_maps.popitem(last=False)
+
+	return vote_map
+
+
+def _vote_map_record(vote_map: VoteMap) -> Dict[str, Any] :
+	return {
+		'version': vote_map.version,
+		'complete': vote_map.complete,
+		'post_ids': vote_map.post_ids.tobytes(),
+		'votes': vote_map.votes.tobytes(),
+	}
+
+
+async def update_vote_map(user_id: int, post_id: PostId, vote: int) -> None :
+	"""
+	sets the user's vote on the post within their stored vote map, a vote of 0 removes it. should be called by whichever service writes votes.
+	if the map isn't stored, it will be loaded from the db the next time it's needed, so nothing is done.
+	concurrent updates are applied on top of each other, if the map is too contended to update it's dropped instead.
+	"""
+	vote_map: Optional[VoteMap] = None
+
+	def modify(data: Dict[str, Any]) -> Dict[str, Any] :
+		nonlocal vote_map
+		vote_map = VoteMap.from_bytes(max(data['version'] + 1, int(time() * 1000)), data['complete'], data['post_ids'], data['votes'])
+		vote_map.set(PostId(post_id).int(), vote)
+		return _vote_map_record(vote_map)
+
+	if await update_record(VoteMapKVS, str(user_id), modify) :
+		_vote_maps[user_id] = vote_map
+
+	else :
+		_vote_maps.pop(user_id, None)
+
+
 # this has to be defined here because the type needs to be used in DBI
 async def _following(self: 'InternalUser', user: KhUser) -> bool :
-	follow_task: Task[bool] = ensure_future(DB.following(user.user_id, self.user_id))
-
 	if not await user.authenticated(raise_error=False) :
 		return None
 
-	return await follow_task
+	return self.user_id in await fetch_follow_set(user.user_id)
 
 InternalUser._following = _following
 
 
 # this has to be defined here because of the response model
-_InternalClient._user: Gateway = Gateway(UserHost + '/i1/user/{user_id}', InternalUser, method='GET')
+_InternalClient._user: Gateway = TracedGateway(UserHost + '/i1/user/{user_id}', InternalUser, method='GET')
 
 
-@ArgsCache(30)
-async def fetch_block_tree(client: _InternalClient, user: KhUser) -> Tuple[BlockTree, UserConfig] :
-	tree: BlockTree = BlockTree()
+def block_version(user_config: UserConfig) -> str :
+	"""
+	returns a version string that changes exactly when the blocking settings within the user config change
+	"""
+	return blake2b(dumps([user_config.blocked_tags, user_config.blocked_users]).encode(), digest_size=16).hexdigest()
+
 
+# user id -> (generation, version, compiled tree). recently used trees are kept at the end
+_block_trees: OrderedDict = OrderedDict()
+
+
+def _block_generation(user_id: int) -> int :
+	# read straight from the kvs client, since the kvs's own local copy would hide invalidations made by other processes
+	try :
+		_, _, bins = KeyValueStore._client.get((UserConfigKVS._namespace, UserConfigKVS._set, BlockGenerationKeyFormat.format(user_id=user_id)))
+		return bins['data']
+
+	except RecordNotFound :
+		return 0
+
+
+@tracer.traced()
+async def fetch_block_tree(client: _InternalClient, user: KhUser) -> Tuple[BlockTree, UserConfig] :
 	if not user.token :
 		# TODO: create and return a default config
-		return tree, UserConfig()
+		return BlockTree(), UserConfig()
+
+	# blocked tags are matched against every tag a post's tags imply, so they have to be loaded before the tree is used
+	await tag_implications.ensure_fresh(client)
+
+	with ThreadPoolExecutor() as threadpool :
+		generation: int = await get_event_loop().run_in_executor(threadpool, _block_generation, user.user_id)
+
+	entry: Optional[Tuple[int, str, BlockTree]] = _block_trees.get(user.user_id)
+
+	if not entry or entry[0] != generation :
+		# the config may have been invalidated since this process cached it, so it's read again rather than served from the local copy
+		_InternalClient.user_config.cache.invalidate(user_id=user.user_id)
 
 	# TODO: return underlying UserConfig here, once internal tokens are implemented
 	user_config: UserConfig = await client.user_config(user.user_id)
-	tree.populate(user_config.blocked_tags or [])
+	version: str = block_version(user_config)
+
+	if entry and entry[0] == generation and entry[1] == version :
+		_block_trees.move_to_end(user.user_id)
+		return entry[2], user_config
+
+	tree: BlockTree = await _compiled_block_tree(user.user_id, version, user_config)
+	_block_trees[user.user_id] = (generation, version, tree)
+
+	while len(_block_trees) > BlockTreeLocalSize :
+		_block_trees.popitem(last=False)
+
 	return tree, user_config
 
 
-async def is_post_blocked(client: _InternalClient, user: KhUser, uploader: str, uploader_id: int, tags: Iterable[str]) -> bool :
-	block_tree, user_config = await fetch_block_tree(client, user)
+async def _compiled_block_tree(user_id: int, version: str, user_config: UserConfig) -> BlockTree :
+	key: str = BlockTreeKeyFormat.format(user_id=user_id)
+
+	try :
+		data: Dict[str, Any] = await UserConfigKVS.get_async(key)
+
+		# if the config has been updated since the tree was compiled, the tree is stale and needs to be rebuilt
+		if data['version'] == version :
+			return BlockTree.from_dict(data['tree'])
+
+	except RecordNotFound :
+		pass
+
+	tree: BlockTree = BlockTree()
+	tree.populate(user_config.blocked_tags or [])
+	write_behind.put_nowait(UserConfigKVS, key, { 'version': version, 'tree': tree.dict() })
 
+	return tree
+
+
+async def invalidate_block_tree(user_id: int) -> None :
+	"""
+	drops the user's compiled block tree and their config in every process. should be called by whichever service updates user configs,
+	once the updated config is stored, so that the new blocking settings apply to the next request any process serves, rather than once the config's soft TTL passes.
+	each process checks the user's block generation in the kvs before using its local copy of their config, so invalidations are seen without any messaging between processes.
+	"""
+	_InternalClient.user_config.cache.invalidate(user_id=user_id)
+	_block_trees.pop(user_id, None)
+
+	def bump() -> None :
+		KeyValueStore._client.increment((UserConfigKVS._namespace, UserConfigKVS._set, BlockGenerationKeyFormat.format(user_id=user_id)), 'data', 1)
+
+	with ThreadPoolExecutor() as threadpool :
+		await get_event_loop().run_in_executor(threadpool, bump)
+
+	try :
+		await UserConfigKVS.remove_async(BlockTreeKeyFormat.format(user_id=user_id))
+
+	except RecordNotFound :
+		pass
+
+
+def post_blocked(block_tree: BlockTree, user_config: UserConfig, uploader: str, uploader_id: int, tags: Iterable[str]) -> bool :
 	if user_config.blocked_users and uploader_id in user_config.blocked_users :
 		return True
 
-	tags: Set[str] = set(tags)
+	tags: Set[str] = tag_implications.expand(tags)
 	tags.add('@' + uploader)  # TODO: user ids need to be added here instead of just handle, once changeable handles are added
 
 	return block_tree.blocked(tags)
 
 
+async def is_post_blocked(client: _InternalClient, user: KhUser, uploader: str, uploader_id: int, tags: Iterable[str]) -> bool :
+	block_tree, user_config = await fetch_block_tree(client, user)
+	return post_blocked(block_tree, user_config, uploader, uploader_id, tags)
+
+
 class InternalPost(BaseModel) :
 	post_id: int
 	title: Optional[str]
@@ -232,30 +679,10 @@ class InternalPost(BaseModel) :
 		return await iuser.portable(user)
 
 
-	async def post(self: 'InternalPost', client: _InternalClient, user: KhUser) -> Post :
-		post_id: PostId = PostId(self.post_id)
-		uploader_task: Task[UserPortable] = ensure_future(self.user_portable(client, user))
-		tags: TagGroups = ensure_future(client.post_tags(post_id))
-		score: Task[Score] = ensure_future(DB.getScore(user, post_id))
-		uploader: UserPortable = await uploader_task
-		blocked: bool = await is_post_blocked(client, user, uploader.handle, self.user_id, await tags)
-
-		return Post(
-			post_id=post_id,
-			title=self.title,
-			description=self.description,
-			user=uploader,
-			score=await score,
-			rating=self.rating,
-			parent=self.parent,
-			privacy=self.privacy,
-			created=self.created,
-			updated=self.updated,
-			filename=self.filename,
-			media_type=self.media_type,
-			size=self.size,
-			blocked=blocked,
-		)
+	async def post(self: 'InternalPost', client: _InternalClient, user: KhUser, timeout: Optional[float] = None, fields: Optional[Iterable[str]] = None) -> Post :
+		with tracer.span('InternalPost.post', { 'post_id': self.post_id }) :
+			# concurrent calls are gathered by the hydrator and populated together, see PostHydrator
+			return await post_hydrator.post(client, user, self, timeout, fields)
 
 
 	async def authorized(self: 'InternalPost', client: _InternalClient, user: KhUser) -> bool :
@@ -284,32 +711,74 @@ class InternalPost(BaseModel) :
 		return False
 
 
+# posts with these privacies are listed on the user's profile
+UserPostsPrivacy: Set[Privacy] = { Privacy.public }
+
+
+class InternalUserPosts(BaseModel) :
+	version: int = 0
+	complete: bool = False
+	post_list: List[InternalPost] = []
+
+
+def _created_key(ipost: InternalPost) -> int :
+	# the key that PostCursor encodes for posts sorted by new
+	if not ipost.created :
+		return 0
+
+	created: datetime = ipost.created if ipost.created.tzinfo else ipost.created.replace(tzinfo=timezone.utc)
+	return int(created.timestamp() * 1000000)
+
+
 # this has to be defined here because of the response model
-_InternalClient._post: Gateway = Gateway(PostHost + '/i1/post/{post_id}', InternalPost, method='GET')
-_InternalClient._user_posts: Gateway = Gateway(PostHost + '/i1/user/{user_id}', List[InternalPost], method='POST')
+_InternalClient._post: Gateway = TracedGateway(PostHost + '/i1/post/{post_id}', InternalPost, method='GET')
+_InternalClient._user_posts: Gateway = TracedGateway(PostHost + '/i1/user/{user_id}', List[InternalPost], method='POST')
+_InternalClient._posts: Gateway = TracedGateway(PostHost + '/i1/posts', List[InternalPost], method='POST')
 
-async def following_many(self: _InternalClient, user: KhUser, targets: List[int]) -> Dict[int, bool] :
+
+@tracer.traced()
+@Client.authenticated
+async def posts_many(self: _InternalClient, post_ids: List[PostId], auth: str = None) -> Dict[PostId, InternalPost] :
 	"""
-	returns a dictionary of target user id -> bool indicating if user follows target
+	returns a dictionary of post_id -> InternalPost, in the order requested. posts that don't exist are left out
 	"""
-	following_map: Dict[str, int] = dict(map(lambda x : (f'{user.user_id}|{x}', x), targets))
-	following: Dict[int, Optional[bool]] = {
-		# remember we need to convert the dict key from the string needed for aerospike back to an int
-		following_map[key]: following
-		for key, following in
-		(await FollowKVS.get_many_async(following_map.keys())).items()
+	ids: List[PostId] = list(dict.fromkeys(map(PostId, post_ids)))
+	iposts: Dict[PostId, Optional[InternalPost]] = await KVSChunkPolicies['posts'].run(ids, PostKVS.get_many_async)
+	missing: List[PostId] = [post_id for post_id in ids if type(iposts.get(post_id)) != InternalPost]
+
+	if missing :
+		# every miss is fetched by a single request, rather than a request per post
+		for ipost in await _InternalClient._posts({ 'post_ids': missing }, auth=auth) :
+			post_id: PostId = PostId(ipost.post_id)
+			iposts[post_id] = ipost
+			write_behind.put_nowait(PostKVS, post_id, ipost)
+
+	# kvs hits come back ahead of misses, so the requested order is restored here
+	return {
+		post_id: iposts[post_id]
+		for post_id in ids
+		if type(iposts.get(post_id)) == InternalPost
 	}
 
-	sql_user_ids: List[int] = [target for target, f in following.items() if f is None]
+_InternalClient.posts_many = posts_many
 
-	if sql_user_ids :
-		following.update(await DB.following_many(user.user_id, sql_user_ids))
 
-	return following
+@tracer.traced()
+async def following_many(self: _InternalClient, user: KhUser, targets: List[int]) -> Dict[int, bool] :
+	"""
+	returns a dictionary of target user id -> bool indicating if user follows target
+	"""
+	follow_set: FollowSet = await fetch_follow_set(user.user_id)
+
+	return {
+		target: target in follow_set
+		for target in targets
+	}
 
 _InternalClient.following_many = following_many
 
 
+@tracer.traced()
 async def users_many(self: _InternalClient, user_ids: List[int]) -> Dict[int, InternalUser] :
 	"""
 	returns a dictionary of user_id -> populated User objects
@@ -317,7 +786,7 @@ async def users_many(self: _InternalClient, user_ids: List[int]) -> Dict[int, In
 	users: Dict[int, Optional[InternalUser]] = {
 		int(user_id): iuser
 		for user_id, iuser in 
-		(await UserKVS.get_many_async(list(map(str, user_ids)))).items()
+		(await KVSChunkPolicies['users'].run(list(map(str, user_ids)), UserKVS.get_many_async)).items()
 	}
 
 	sql_user_ids: List[int] = [user_id for user_id, user in users.items() if user is None or type(user) == bytearray]
@@ -330,13 +799,31 @@ async def users_many(self: _InternalClient, user_ids: List[int]) -> Dict[int, In
 _InternalClient.users_many = users_many
 
 
+@tracer.traced()
 async def votes_many(self: _InternalClient, user: KhUser, post_ids: List[PostId]) -> Dict[PostId, int] :
-	votes_map: Dict[str, PostId] = dict(map(lambda x : (f'{user.user_id}|{x}', x), post_ids))
-	votes: Dict[PostId, Optional[int]] = {
-		votes_map[key]: vote
+	vote_map: VoteMap = await fetch_vote_map(user.user_id)
+	votes: Dict[PostId, Optional[int]] = { }
+	unknown: List[PostId] = []
+
+	for post_id in post_ids :
+		vote: Optional[int] = vote_map.get(PostId(post_id).int())
+
+		if vote is None :
+			unknown.append(post_id)
+
+		else :
+			votes[post_id] = vote
+
+	if not unknown :
+		return votes
+
+	# the map only holds the user's votes on the newest posts, so older posts are looked up individually
+	votes_keys: Dict[str, PostId] = dict(map(lambda x : (f'{user.user_id}|{x}', x), unknown))
+	votes.update({
+		votes_keys[key]: vote
 		for key, vote in
-		(await VoteCache.get_many_async(votes_map.keys())).items()
-	}
+		(await KVSChunkPolicies['votes'].run(votes_keys.keys(), VoteCache.get_many_async)).items()
+	})
 
 	sql_post_ids: List[PostId] = [PostId(post_id) for post_id, vote in votes.items() if vote is None]
 
@@ -348,8 +835,9 @@ async def votes_many(self: _InternalClient, user: KhUser, post_ids: List[PostId]
 _InternalClient.votes_many = votes_many
 
 
+@tracer.traced()
 async def scores_many(self: _InternalClient, post_ids: List[PostId]) -> Dict[PostId, Optional[InternalScore]] :
-	scores: Dict[PostId, Optional[InternalScore]] = await ScoreCache.get_many_async(post_ids)
+	scores: Dict[PostId, Optional[InternalScore]] = await KVSChunkPolicies['score'].run(post_ids, ScoreCache.get_many_async)
 
 	sql_post_ids: List[PostId] = [PostId(post_id) for post_id, score in scores.items() if score is None or type(score) == bytearray]
 
@@ -361,13 +849,24 @@ async def scores_many(self: _InternalClient, post_ids: List[PostId]) -> Dict[Pos
 _InternalClient.scores_many = scores_many
 
 
-async def tags_many(self: _InternalClient, post_ids: List[PostId]) -> Dict[PostId, List[str]] :
-	tags: Dict[PostId, Optional[List[str]]] = {
-		post_id: flatten(tag_groups) if tag_groups and type(tag_groups) != bytearray else None
-		for post_id, tag_groups in
-		(await TagKVS.get_many_async(post_ids)).items()
+async def _cached_tags_many(post_ids: List[PostId]) -> Dict[PostId, Optional[List[str]]] :
+	"""
+	reads the tag groups that the tag service caches for each post, under the same keys as _InternalClient.post_tags
+
+	:return: post id -> flattened tags, or None if the post's tags aren't cached
+	"""
+	keys: Dict[str, PostId] = { f'post.{post_id}': post_id for post_id in post_ids }
+	return {
+		keys[key]: list(flatten(tag_groups)) if tag_groups is not None and type(tag_groups) != bytearray else None
+		for key, tag_groups in
+		(await KVSChunkPolicies['tags'].run(keys.keys(), TagKVS.get_many_async)).items()
 	}
 
+
+@tracer.traced()
+async def tags_many(self: _InternalClient, post_ids: List[PostId]) -> Dict[PostId, List[str]] :
+	tags: Dict[PostId, Optional[List[str]]] = await _cached_tags_many(post_ids)
+
 	sql_post_ids: List[PostId] = [PostId(post_id) for post_id, tag_list in tags.items() if tag_list is None]
 
 	if sql_post_ids :
@@ -378,6 +877,103 @@ async def tags_many(self: _InternalClient, post_ids: List[PostId]) -> Dict[PostI
 _InternalClient.tags_many = tags_many
 
 
+@tracer.traced()
+async def hydrate_many(self: _InternalClient, user_ids: List[int], scored_ids: List[PostId], post_ids: List[PostId]) -> Tuple[Dict[int, InternalUser], Dict[PostId, Optional[InternalScore]], Dict[PostId, List[str]]] :
+	"""
+	equivalent to calling users_many, scores_many, and tags_many together. when the share of cache misses reaches HydrateMissRatio,
+	such as on a cold page, every miss is fetched from the database in a single round trip instead of one per kind
+
+	:return: tuple of (user id -> user, post id -> score, post id -> tags)
+	"""
+	cached_users, scores, tags = await gather(
+		KVSChunkPolicies['users'].run(list(map(str, user_ids)), UserKVS.get_many_async),
+		KVSChunkPolicies['score'].run(scored_ids, ScoreCache.get_many_async),
+		_cached_tags_many(post_ids),
+	)
+
+	users: Dict[int, Optional[InternalUser]] = {
+		int(user_id): iuser if type(iuser) != bytearray else None
+		for user_id, iuser in cached_users.items()
+	}
+
+	sql_user_ids: List[int] = [user_id for user_id, user in users.items() if user is None]
+	sql_scored_ids: List[PostId] = [PostId(post_id) for post_id, score in scores.items() if score is None or type(score) == bytearray]
+	sql_post_ids: List[PostId] = [PostId(post_id) for post_id, tag_list in tags.items() if tag_list is None]
+
+	misses: int = len(sql_user_ids) + len(sql_scored_ids) + len(sql_post_ids)
+	total: int = len(users) + len(scores) + len(tags)
+
+	if misses and misses / total >= HydrateMissRatio :
+		db_users, db_scores, db_tags = await DB.hydrate_many(sql_user_ids, sql_scored_ids, sql_post_ids)
+		users.update(db_users)
+		scores.update(db_scores)
+		tags.update(db_tags)
+
+	elif misses :
+		# too few misses to be worth the combined query, so only the kinds that missed are queried, concurrently
+		queries: List[Tuple[dict, Coroutine]] = []
+
+		if sql_user_ids :
+			queries.append((users, DB.users_many(sql_user_ids)))
+
+		if sql_scored_ids :
+			queries.append((scores, DB.scores_many(sql_scored_ids)))
+
+		if sql_post_ids :
+			queries.append((tags, DB.tags_many(sql_post_ids)))
+
+		for (results, _), db_results in zip(queries, await gather(*(query for _, query in queries))) :
+			results.update(db_results)
+
+	return users, scores, tags
+
+_InternalClient.hydrate_many = hydrate_many
+
+
+@tracer.traced()
+async def tag_counts_many(self: _InternalClient, tags: List[str]) -> Dict[str, int] :
+	"""
+	returns a dictionary of tag -> number of public posts with that tag
+	"""
+	counts: Dict[str, Optional[int]] = await KVSChunkPolicies['tag_count'].run(tags, CountKVS.get_many_async)
+
+	sql_tags: List[str] = [tag for tag, count in counts.items() if count is None]
+
+	if sql_tags :
+		counts.update(await DB.tag_counts_many(sql_tags))
+
+	return counts
+
+_InternalClient.tag_counts_many = tag_counts_many
+
+
+async def adjust_tag_counts(tags: Iterable[str], delta: int) -> None :
+	"""
+	atomically adds delta to the cached count of each tag. should be called by whichever service writes tags whenever
+	tags are added to or removed from a public post, or a tagged post becomes or stops being public.
+	tags without a cached count are skipped, since they will be counted in full the next time they're needed.
+	counts read from the db are only stored if no count is stored yet, so they never overwrite an adjustment.
+	NOTE: only this worker's local copy of each count is dropped, other workers continue to serve theirs for up to CountKVS's local TTL.
+	"""
+	policy: Dict[str, Any] = {
+		'exists': POLICY_EXISTS_UPDATE,
+		'max_retries': 3,
+	}
+
+	def increment(tag: str) -> None :
+		try :
+			KeyValueStore._client.increment((CountKVS._namespace, CountKVS._set, tag), 'data', delta, policy=policy)
+
+		except RecordNotFound :
+			pass
+
+		CountKVS._cache.pop(tag, None)
+
+	with ThreadPoolExecutor() as threadpool :
+		loop: AbstractEventLoop = get_event_loop()
+		await gather(*(loop.run_in_executor(threadpool, increment, tag) for tag in set(tags)))
+
+
 class InternalPosts(BaseModel) :
 	post_list: List[InternalPost] = []
 
@@ -387,33 +983,18 @@ class InternalPosts(BaseModel) :
 
 	async def uploaders(self: 'InternalPosts', client: _InternalClient, user: KhUser) -> Dict[int, UserPortable] :
 		"""
-		returns populated user objects for every uploader id provided
+		returns populated user objects for every uploader id provided. uploaders that don't exist are left out
 
 		:return: dict in the form user id -> populated User object
 		"""
-		uploader_ids: List[int] = list(set(map(lambda x : x.user_id, self.post_list)))
-		users_task: Task[Dict[int, InternalUser]] = ensure_future(client.users_many(uploader_ids))
-		following: Dict[int, Optional[bool]]
+		try :
+			rows: List[HydratedPost] = await post_hydrator._rows(client, user, self.post_list, None, PostProjection(['user']), omit_failed=True)
 
-		if await user.authenticated(False) :
-			following = await client.following_many(user, uploader_ids)
+		except NotFound :
+			# _rows still raises when every post failed, which here means none of the uploaders exist
+			return { }
 
-		else :
-			following = defaultdict(lambda : None)
-
-		iusers: Dict[int, InternalUser] = await users_task
-
-		return {
-			user_id: UserPortable(
-				name=iuser.name,
-				handle=iuser.handle,
-				privacy=iuser.privacy,
-				icon=iuser.icon,
-				verified=iuser.verified,
-				following=following[user_id],
-			)
-			for user_id, iuser in iusers.items()
-		}
+		return { row.ipost.user_id: row.uploader for row in rows }
 
 
 	async def scores(self: 'InternalPosts', client: _InternalClient, user: KhUser) -> Dict[PostId, Optional[Score]] :
@@ -422,77 +1003,441 @@ class InternalPosts(BaseModel) :
 
 		:return: dict in the form post id -> populated Score object
 		"""
-		scores: Dict[PostId, Optional[Score]] = { }
-		post_ids: List[PostId] = []
+		rows: List[HydratedPost] = await post_hydrator._rows(client, user, self.post_list, None, PostProjection(['score']))
+		return { PostId(row.ipost.post_id): row.score for row in rows }
 
-		for post in self.post_list :
-			post_id: PostId = PostId(post.post_id)
 
-			# only grab posts that can actually have scores
-			if post.privacy not in { Privacy.draft, Privacy.unpublished } :
-				post_ids.append(post_id)
+	async def posts(self: 'InternalPosts', client: _InternalClient, user: KhUser, timeout: Optional[float] = None, fields: Optional[Iterable[str]] = None) -> List[Post] :
+		"""
+		returns a list of external post objects populated with user and other information
 
-			# but put all of them in the dict
-			scores[post_id] = None
+		:param timeout: seconds after which optional parts of the posts are abandoned, see HydrationStages
+		:param fields: when provided, only these fields are populated, and lookups for the rest are skipped, see PostProjection
+		"""
+		return await post_hydrator.hydrate(client, user, self.post_list, timeout, fields)
 
-		iscores_task: Task[Dict[PostId, Optional[InternalScore]]] = ensure_future(client.scores_many(post_ids))
-		user_votes: Dict[PostId, int]
 
-		if await user.authenticated(False) :
-			user_votes = await client.votes_many(user, post_ids)
+	async def batch(self: 'InternalPosts', client: _InternalClient, user: KhUser, timeout: Optional[float] = None, fields: Optional[Iterable[str]] = None) -> PostBatch :
+		"""
+		same as posts, but returns a columnar PostBatch that shares uploaders between posts and only builds Post models as they're accessed.
+		better suited to large pages and exports
+
+		:param timeout: seconds after which optional parts of the posts are abandoned, see HydrationStages
+		:param fields: when provided, only these fields are populated, and lookups for the rest are skipped, see PostProjection
+		"""
+		return await post_hydrator.hydrate_batch(client, user, self.post_list, timeout, fields)
+
+
+# posts with these privacies can't be voted on, so they never have scores
+UnscoredPrivacy: Set[Privacy] = { Privacy.draft, Privacy.unpublished }
+
+
+@unique
+class StagePriority(Enum) :
+	required: str = 'required'
+	optional: str = 'optional'
+
+
+# priority of each stage of post hydration. required stages are always waited for, while optional stages are abandoned once
+# the request's deadline passes, and the affected posts are returned with partial set.
+#   uploader: posts can't be built without their uploader, so once abandoned they fail with ServiceUnavailable instead
+#   blocking: the post's tags and the viewer's block tree, posts are treated as blocked without them
+#   score: scores and the viewer's votes, score is None without them
+#   following: whether the viewer follows the uploader, following is None without it
+HydrationStages: Dict[str, StagePriority] = {
+	'uploader': StagePriority.required,
+	'blocking': StagePriority.required,
+	'score': StagePriority.optional,
+	'following': StagePriority.optional,
+}
+
+
+async def _stage(stage: str, coro: Awaitable[Any], deadline: Optional[float]) -> Optional[Any] :
+	"""
+	awaits the stage, or if it's optional, only until the deadline
+
+	:return: the stage's result, or None if it was abandoned
+	"""
+	with tracer.span(f'hydrate.{stage}') as span :
+		if deadline is None or HydrationStages[stage] == StagePriority.required :
+			return await coro
+
+		try :
+			return await wait_for(coro, max(deadline - get_event_loop().time(), 0))
+
+		except TimeoutError :
+			span.set(abandoned=True)
+			return None
+
+
+def _requested(projection: Optional[PostProjection], field: str) -> bool :
+	return projection is None or field in projection
+
+
+def _needs(projections: Iterable[Optional[PostProjection]], field: str) -> bool :
+	return any(_requested(projection, field) for projection in projections)
+
+
+class HydratedPost(NamedTuple) :
+	"""
+	the populated parts of a single post, before they're built into a Post or added to a PostBatch.
+	parts outside of the post's projection may not have been populated
+	"""
+	ipost: InternalPost
+	uploader: Optional[UserPortable]
+	score: Optional[Score]
+	blocked: bool
+	partial: bool
+	projection: Optional[PostProjection] = None
+
+
+	def post(self: 'HydratedPost') -> Post :
+		if self.projection :
+			return self.projection.build({
+				'post_id': PostId(self.ipost.post_id),
+				'title': self.ipost.title,
+				'description': self.ipost.description,
+				'user': self.uploader,
+				'score': self.score,
+				'rating': self.ipost.rating,
+				'parent': PostId(self.ipost.parent) if self.ipost.parent is not None else None,
+				'privacy': self.ipost.privacy,
+				'created': self.ipost.created,
+				'updated': self.ipost.updated,
+				'filename': self.ipost.filename,
+				'media_type': self.ipost.media_type,
+				'size': self.ipost.size,
+				'blocked': self.blocked,
+				'partial': self.partial,
+			})
+
+		return Post(
+			post_id=PostId(self.ipost.post_id),
+			title=self.ipost.title,
+			description=self.ipost.description,
+			user=self.uploader,
+			score=self.score,
+			rating=self.ipost.rating,
+			parent=self.ipost.parent,
+			privacy=self.ipost.privacy,
+			created=self.ipost.created,
+			updated=self.ipost.updated,
+			filename=self.ipost.filename,
+			media_type=self.ipost.media_type,
+			size=self.ipost.size,
+			blocked=self.blocked,
+			partial=self.partial,
+		)
+
+
+	def append_to(self: 'HydratedPost', batch: PostBatch) -> None :
+		if self.uploader and self.ipost.user_id not in batch.users :
+			batch.add_user(self.ipost.user_id, self.uploader)
+
+		batch.append(
+			post_id=self.ipost.post_id,
+			title=self.ipost.title,
+			description=self.ipost.description,
+			user_id=self.ipost.user_id,
+			score=self.score,
+			rating=self.ipost.rating,
+			parent=self.ipost.parent,
+			privacy=self.ipost.privacy,
+			created=self.ipost.created,
+			updated=self.ipost.updated,
+			filename=self.ipost.filename,
+			media_type=self.ipost.media_type,
+			size=self.ipost.size,
+			blocked=self.blocked,
+			partial=self.partial,
+		)
+
+
+def _index_tags(iposts: Dict[int, InternalPost], tags: Optional[Dict[PostId, List[str]]]) -> None :
+	# only public posts are indexed, since local tag queries aren't filtered by privacy. posts that are no longer public are removed
+	for post_id, tag_list in (tags or { }).items() :
+		if iposts[post_id.int()].privacy == Privacy.public :
+			post_tag_index.update(post_id, tag_list)
 
 		else :
-			user_votes = defaultdict(lambda : 0)
-
-		iscores: Dict[PostId, Optional[InternalScore]] = await iscores_task
-
-		for post_id, iscore in iscores.items() :
-			# the score may still be None, technically
-			if iscore :
-				scores[post_id] = Score(
-					up=iscore.up,
-					down=iscore.down,
-					total=iscore.total,
-					user_vote=user_votes[post_id],
-				)
+			post_tag_index.remove(post_id)
 
-		return scores
 
+class PostHydrator :
+	"""
+	Gathers concurrent InternalPost.post calls over a short window and populates them as a single batch.
+	Uploaders, scores, and tags are fetched once for every post in the batch, while follows, votes, and blocking are fetched once per viewer.
+	Lookups are skipped entirely when none of the posts that depend on them request the fields they populate, see PostProjection.
+	"""
 
-	async def posts(self: 'InternalPosts', client: _InternalClient, user: KhUser) -> List[Post] :
+	def __init__(self: 'PostHydrator', window: float = 0.002, max_batch: int = 256) :
 		"""
-		returns a list of external post objects populated with user and other information
+		:param window: how long, in seconds, to wait for more posts after the first post of a batch arrives
+		:param max_batch: the batch is populated immediately once this many posts are waiting
+		"""
+		self.window: float = window
+		self.max_batch: int = max_batch
+		self._queue: List[Tuple[_InternalClient, KhUser, InternalPost, Future, Optional[float], Optional[PostProjection]]] = []
+		self._timer: Optional[TimerHandle] = None
+		self._tasks: Set[Task] = set()
+
+
+	async def post(self: 'PostHydrator', client: _InternalClient, user: KhUser, ipost: InternalPost, timeout: Optional[float] = None, fields: Optional[Iterable[str]] = None) -> Post :
+		"""
+		queues the post to be populated with the next batch and waits for the result
+
+		:param timeout: seconds after which optional stages are abandoned, see HydrationStages
+		:param fields: when provided, only these fields are populated and set on the post, see PostProjection
+		:return: the populated external post object for ipost
+		"""
+		projection: Optional[PostProjection] = PostProjection(fields) if fields is not None else None
+		loop = get_event_loop()
+		future: Future = loop.create_future()
+		self._queue.append((client, user, ipost, future, loop.time() + timeout if timeout is not None else None, projection))
+
+		if len(self._queue) >= self.max_batch :
+			self._flush()
+
+		elif not self._timer :
+			self._timer = loop.call_later(self.window, self._flush)
+
+		return (await future).post()
+
+
+	async def _rows(self: 'PostHydrator', client: _InternalClient, user: KhUser, iposts: List[InternalPost], timeout: Optional[float], projection: Optional[PostProjection], omit_failed: bool = False) -> List[HydratedPost] :
 		"""
+		:param omit_failed: leave posts that failed out of the result rather than raising their error. the error is still raised if every post failed
+		"""
+		loop = get_event_loop()
+		requests: List[Tuple[KhUser, InternalPost, Future, Optional[PostProjection]]] = [(user, ipost, loop.create_future(), projection) for ipost in iposts]
+		await self._hydrate(client, requests, loop.time() + timeout if timeout is not None else None)
+		failed: List[BaseException] = [future.exception() for _, _, future, _ in requests if future.exception()]
+
+		if failed and (not omit_failed or len(failed) == len(requests)) :
+			raise failed[0]
+
+		return [future.result() for _, _, future, _ in requests if not future.exception()]
+
+
+	async def hydrate(self: 'PostHydrator', client: _InternalClient, user: KhUser, iposts: List[InternalPost], timeout: Optional[float] = None, fields: Optional[Iterable[str]] = None) -> List[Post] :
+		"""
+		populates the posts immediately as their own batch, rather than waiting for the window
 
-		uploaders_task: Task[Dict[int, UserPortable]] = ensure_future(self.uploaders(client, user))
-		scores_task: Task[Dict[PostId, Optional[Score]]] = ensure_future(self.scores(client, user))
-
-		tags: Dict[PostId, List[str]] = await client.tags_many(list(map(lambda x : PostId(x.post_id), self.post_list)))
-		uploaders: Dict[int, UserPortable] = await uploaders_task
-		scores: Dict[PostId, Optional[Score]] = await scores_task
-
-		posts: List[Post] = []
-		for post in self.post_list :
-			post_id: PostId = PostId(post.post_id)
-			posts.append(Post(
-				post_id=post_id,
-				title=post.title,
-				description=post.description,
-				user=uploaders[post.user_id],
-				score=scores[post_id],
-				rating=post.rating,
-				parent=post.parent,
-				privacy=post.privacy,
-				created=post.created,
-				updated=post.updated,
-				filename=post.filename,
-				media_type=post.media_type,
-				size=post.size,
-				# only the first call retrieves blocked info, all the rest should be cached and not actually await
-				blocked=await is_post_blocked(client, user, uploaders[post.user_id].handle, post.user_id, tags[post_id]),
+		:param timeout: seconds after which optional stages are abandoned, see HydrationStages
+		:param fields: when provided, only these fields are populated and set on the posts, see PostProjection
+		:return: the populated external post objects, in the same order as iposts. without a timeout, any post that fails, such as when its uploader doesn't exist,
+			raises its error. with a timeout, posts that fail, such as when their uploader couldn't be retrieved in time, are omitted instead, unless every post failed
+		"""
+		projection: Optional[PostProjection] = PostProjection(fields) if fields is not None else None
+		return [row.post() for row in await self._rows(client, user, iposts, timeout, projection, omit_failed=timeout is not None)]
+
+
+	async def hydrate_batch(self: 'PostHydrator', client: _InternalClient, user: KhUser, iposts: List[InternalPost], timeout: Optional[float] = None, fields: Optional[Iterable[str]] = None) -> PostBatch :
+		"""
+		same as hydrate, but returns the posts as a columnar PostBatch, which only builds Post models as they're accessed
+
+		:param timeout: seconds after which optional stages are abandoned, see HydrationStages
+		:param fields: when provided, only these fields are populated and set on the posts, see PostProjection
+		"""
+		projection: Optional[PostProjection] = PostProjection(fields) if fields is not None else None
+		batch: PostBatch = PostBatch(projection)
+
+		for row in await self._rows(client, user, iposts, timeout, projection, omit_failed=timeout is not None) :
+			row.append_to(batch)
+
+		return batch
+
+
+	def _flush(self: 'PostHydrator') -> None :
+		if self._timer :
+			self._timer.cancel()
+			self._timer = None
+
+		queue, self._queue = self._queue, []
+		batches: Dict[_InternalClient, List[Tuple[KhUser, InternalPost, Future, Optional[PostProjection]]]] = defaultdict(list)
+		deadlines: Dict[_InternalClient, Optional[float]] = { }
+
+		# auth is provided by the client, so batches can't be shared between clients
+		for client, user, ipost, future, deadline, projection in queue :
+			batches[client].append((user, ipost, future, projection))
+
+			# the batch works to its most urgent deadline
+			if deadline is not None :
+				deadlines[client] = min(deadline, deadlines.get(client) or deadline)
+
+		for client, requests in batches.items() :
+			# keep a reference to the task so that it isn't garbage collected before it completes
+			task: Task = ensure_future(self._hydrate(client, requests, deadlines.get(client)))
+			self._tasks.add(task)
+			task.add_done_callback(self._tasks.discard)
+
+
+	async def _hydrate(self: 'PostHydrator', client: _InternalClient, requests: List[Tuple[KhUser, InternalPost, Future, Optional[PostProjection]]], deadline: Optional[float] = None) -> None :
+		with tracer.span('hydrate.batch', { 'posts': len(requests) }) :
+			iposts: Dict[int, InternalPost] = { ipost.post_id: ipost for _, ipost, _, _ in requests }
+			projections: List[Optional[PostProjection]] = [projection for _, _, _, projection in requests]
+			uploader_ids: List[int] = []
+			post_ids: List[PostId] = []
+			scored_ids: List[PostId] = []
+
+			# kinds that no post in the batch needs are left empty, which skips their lookups
+			if _needs(projections, 'user') or _needs(projections, 'blocked') :
+				uploader_ids = list(set(map(lambda x : x.user_id, iposts.values())))
+
+			if _needs(projections, 'blocked') :
+				post_ids = list(map(PostId, iposts.keys()))
+
+			if _needs(projections, 'score') :
+				scored_ids = [
+					PostId(ipost.post_id)
+					for ipost in iposts.values()
+					# only grab posts that can actually have scores
+					if ipost.privacy not in UnscoredPrivacy
+				]
+
+			shared: Task
+
+			if deadline is None :
+				shared = ensure_future(client.hydrate_many(uploader_ids, scored_ids, post_ids))
+
+			else :
+				# the combined query can't be partially abandoned, so each kind is fetched separately when there's a deadline to meet
+				shared = ensure_future(gather(
+					_stage('uploader', client.users_many(uploader_ids), deadline),
+					_stage('score', client.scores_many(scored_ids), deadline),
+					_stage('blocking', client.tags_many(post_ids), deadline),
+				))
+
+			# every viewer awaits the shared stages, but if all of them fail first it would otherwise never be retrieved
+			shared.add_done_callback(lambda t : t.cancelled() or t.exception())
+			viewers: Dict[KhUser, List[Tuple[InternalPost, Future, Optional[PostProjection]]]] = defaultdict(list)
+
+			for user, ipost, future, projection in requests :
+				viewers[user].append((ipost, future, projection))
+
+			# viewer stages don't depend on the shared stages, so they all run at once
+			await gather(*(
+				self._hydrate_viewer(client, user, viewer_requests, shared, deadline)
+				for user, viewer_requests in viewers.items()
 			))
-		
-		return posts
+
+			if post_tag_index is not None and post_ids and shared.done() and not shared.cancelled() and not shared.exception() :
+				_index_tags(iposts, shared.result()[2])
+
+
+	@tracer.traced('hydrate.viewer')
+	async def _hydrate_viewer(
+		self: 'PostHydrator',
+		client: _InternalClient,
+		user: KhUser,
+		requests: List[Tuple[InternalPost, Future, Optional[PostProjection]]],
+		shared: Awaitable[Tuple[Optional[Dict[int, InternalUser]], Optional[Dict[PostId, Optional[InternalScore]]], Optional[Dict[PostId, List[str]]]]],
+		deadline: Optional[float] = None,
+	) -> None :
+		try :
+			projections: List[Optional[PostProjection]] = [projection for _, _, projection in requests]
+			authenticated: bool = await user.authenticated(False)
+			stages: Dict[str, Awaitable[Any]] = { }
+
+			if authenticated and _needs(projections, 'user.following') :
+				stages['following'] = _stage('following', client.following_many(user, list(set(map(lambda x : x[0].user_id, requests)))), deadline)
+
+			if authenticated and _needs(projections, 'score.user_vote') :
+				stages['votes'] = _stage('score', client.votes_many(user, [PostId(ipost.post_id) for ipost, _, _ in requests if ipost.privacy not in UnscoredPrivacy]), deadline)
+
+			if _needs(projections, 'blocked') :
+				stages['blocking'] = _stage('blocking', fetch_block_tree(client, user), deadline)
+
+			results: Dict[str, Any] = dict(zip(stages.keys(), await gather(*stages.values())))
+			following: Optional[Dict[int, Optional[bool]]] = results.get('following', defaultdict(lambda : None))
+			user_votes: Optional[Dict[PostId, int]] = results.get('votes', defaultdict(lambda : 0))
+			block: Optional[Tuple[BlockTree, UserConfig]] = results.get('blocking')
+
+			iusers, iscores, tags = await shared
+			# abandoned once the deadline passed, so uploaders can't be told apart from ones that don't exist
+			uploaders_partial: bool = iusers is None
+			iusers = iusers or { }
+
+			# these stages were abandoned, so every post they affect is partial
+			following_partial: bool = following is None
+			score_partial: bool = iscores is None or user_votes is None
+			blocking_partial: bool = tags is None or block is None
+
+			following = following if following is not None else defaultdict(lambda : None)
+			iscores = iscores if not score_partial else { }
+			uploaders: Dict[int, UserPortable] = { }
+
+			for ipost, future, projection in requests :
+				post_id: PostId = PostId(ipost.post_id)
+				uploader: Optional[UserPortable] = None
+
+				if _requested(projection, 'user') or _requested(projection, 'blocked') :
+					if iusers.get(ipost.user_id) is None :
+						# the caller may have been cancelled while waiting on the batch
+						if not future.done() :
+							future.set_exception(ServiceUnavailable('uploader could not be retrieved.') if uploaders_partial else NotFound('uploader does not exist.'))
+
+						continue
+
+					# every post by the same uploader shares a single user object
+					uploader = uploaders.get(ipost.user_id)
+
+					if uploader is None :
+						iuser: InternalUser = iusers[ipost.user_id]
+						uploader = uploaders[ipost.user_id] = UserPortable(
+							name=iuser.name,
+							handle=iuser.handle,
+							privacy=iuser.privacy,
+							icon=iuser.icon,
+							verified=iuser.verified,
+							following=following[ipost.user_id],
+						)
+
+				iscore: Optional[InternalScore] = iscores.get(post_id)
+				# without tags or a block tree there's no way to know, so err on the side of hiding the post
+				blocked: bool = True
+
+				if _requested(projection, 'blocked') and not blocking_partial :
+					blocked = post_blocked(*block, uploader.handle, ipost.user_id, tags[post_id])
+
+				row: HydratedPost = HydratedPost(
+					ipost,
+					uploader,
+					Score(
+						up=iscore.up,
+						down=iscore.down,
+						total=iscore.total,
+						user_vote=user_votes[post_id],
+					) if iscore else None,
+					blocked,
+					# only stages that populate the requested fields can make the post partial
+					(following_partial and _requested(projection, 'user.following'))
+						or (blocking_partial and _requested(projection, 'blocked'))
+						or (score_partial and _requested(projection, 'score') and ipost.privacy not in UnscoredPrivacy),
+					projection,
+				)
+
+				# the caller may have been cancelled while waiting on the batch
+				if not future.done() :
+					future.set_result(row)
+
+		except Exception as e :
+			for _, future, _ in requests :
+				if not future.done() :
+					future.set_exception(e)
+
+
+post_hydrator: PostHydrator = PostHydrator()
+
+
+async def drain() -> None :
+	"""
+	waits for hydration batches in progress, then writes every queued cache fill. should be awaited on shutdown so that queued fills aren't lost
+	"""
+	if post_hydrator._tasks :
+		await gather(*post_hydrator._tasks, return_exceptions=True)
+
+	await write_behind.drain()
 
 
 class InternalTag(BaseModel) :
@@ -514,7 +1459,7 @@ class InternalTag(BaseModel) :
 
 	async def tag(self: 'InternalTag', client: _InternalClient, user: KhUser) -> Tag :
 		owner: Task[Optional[UserPortable]] = ensure_future(self.user_portable(client, user))
-		tag_count: Task[int] = ensure_future(DB.tagCount(self.name))
+		counts: Dict[str, int] = await client.tag_counts_many([self.name])
 
 		return Tag(
 			tag=self.name,
@@ -523,9 +1468,132 @@ class InternalTag(BaseModel) :
 			deprecated=self.deprecated,
 			inherited_tags=self.inherited_tags,
 			description=self.description,
-			count=await tag_count,
+			count=counts[self.name],
 		)
 
 
 # this has to be defined here because of the response model
-_InternalClient._tag: Gateway = Gateway(TagHost + '/i1/tag/{tag}', InternalTag, method='GET')
+_InternalClient._tag: Gateway = TracedGateway(TagHost + '/i1/tag/{tag}', InternalTag, method='GET')
+
+
+async def tag(self: _InternalClient, tag: str) -> InternalTag :
+	"""
+	returns the InternalTag for the given tag, read through the same cache as internal_tags_many
+	"""
+	itags: Dict[str, InternalTag] = await self.internal_tags_many([tag])
+
+	if tag not in itags :
+		raise NotFound('the provided tag does not exist.')
+
+	return itags[tag]
+
+_InternalClient.tag = tag
+
+
+@Client.authenticated
+async def internal_tags_many(self: _InternalClient, tags: List[str], auth: str = None) -> Dict[str, InternalTag] :
+	"""
+	returns a dictionary of tag -> InternalTag object. tags that don't exist are left out
+	"""
+	tags_map: Dict[str, str] = dict(map(lambda x : (f'tag.{x}', x), tags))
+	itags: Dict[str, Optional[InternalTag]] = {
+		tags_map[key]: itag
+		for key, itag in
+		(await KVSChunkPolicies['tags'].run(tags_map.keys(), TagKVS.get_many_async)).items()
+	}
+
+	missing: List[str] = [tag for tag, itag in itags.items() if type(itag) != InternalTag]
+
+	if missing :
+		# there's no bulk endpoint for tags, so the misses are at least fetched concurrently
+		results: List[Union[InternalTag, BaseException]] = await gather(*(_InternalClient._tag(tag=tag, auth=auth) for tag in missing), return_exceptions=True)
+
+		for tag, result in zip(missing, results) :
+			if isinstance(result, ClientResponseError) and result.status == 404 :
+				del itags[tag]
+				continue
+
+			if isinstance(result, BaseException) :
+				raise result
+
+			itags[tag] = result
+			# the tag service writes tags as they're edited, so a fill must not overwrite a newer copy
+			write_behind.put_nowait(TagKVS, f'tag.{tag}', result, if_absent=True)
+
+	return itags
+
+_InternalClient.internal_tags_many = internal_tags_many
+
+
+class InternalTags(BaseModel) :
+	tag_list: List[InternalTag] = []
+
+	def append(self: 'InternalTags', tag: InternalTag) :
+		return self.tag_list.append(tag)
+
+
+	async def owners(self: 'InternalTags', client: _InternalClient, user: KhUser) -> Dict[int, UserPortable] :
+		"""
+		returns populated user objects for every tag owner
+
+		:return: dict in the form user id -> populated User object
+		"""
+		owner_ids: List[int] = list(set(filter(None, map(lambda x : x.owner, self.tag_list))))
+
+		if not owner_ids :
+			return { }
+
+		users_task: Task[Dict[int, InternalUser]] = ensure_future(client.users_many(owner_ids))
+		following: Dict[int, Optional[bool]]
+
+		if await user.authenticated(False) :
+			following = await client.following_many(user, owner_ids)
+
+		else :
+			following = defaultdict(lambda : None)
+
+		iusers: Dict[int, InternalUser] = await users_task
+
+		return {
+			user_id: UserPortable(
+				name=iuser.name,
+				handle=iuser.handle,
+				privacy=iuser.privacy,
+				icon=iuser.icon,
+				verified=iuser.verified,
+				following=following[user_id],
+			)
+			for user_id, iuser in iusers.items()
+		}
+
+
+	async def tags(self: 'InternalTags', client: _InternalClient, user: KhUser) -> List[Tag] :
+		"""
+		returns a list of external tag objects populated with owner and count information
+		"""
+		owners_task: Task[Dict[int, UserPortable]] = ensure_future(self.owners(client, user))
+		counts: Dict[str, int] = await client.tag_counts_many(list(map(lambda x : x.name, self.tag_list)))
+		owners: Dict[int, UserPortable] = await owners_task
+
+		return [
+			Tag(
+				tag=itag.name,
+				owner=owners.get(itag.owner),
+				group=itag.group,
+				deprecated=itag.deprecated,
+				inherited_tags=itag.inherited_tags,
+				description=itag.description,
+				count=counts[itag.name],
+			)
+			for itag in self.tag_list
+		]
+
+
+async def tags_hydrate_many(self: _InternalClient, user: KhUser, tags: List[str]) -> List[Tag] :
+	"""
+	returns populated tag objects for every tag provided, in the same order. owners and counts for every tag are retrieved together. tags that don't exist are left out
+	"""
+	itags: Dict[str, InternalTag] = await self.internal_tags_many(tags)
+	return await InternalTags(tag_list=[itags[tag] for tag in tags if tag in itags]).tags(self, user)
+
+_InternalClient.tags_hydrate_many = tags_hydrate_many
@@ -1,7 +1,10 @@
-from datetime import datetime
+from array import array
+from datetime import datetime, timezone
 from enum import Enum, unique
-from typing import Dict, List, Optional, Union
+from struct import Struct
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union, overload
 
+from kh_common.base64 import b64decode, b64encode
 from pydantic import BaseModel, validator
 
 from ._shared import PostId, PostIdValidator, PostSize, Score, UserPortable, _post_id_converter
@@ -33,6 +36,92 @@ class PostSort(Enum) :
 	controversial: str = 'controversial'
 
 
+class PostCursor(str) :
+	"""
+	opaque pagination token that encodes the sort order, the sort key of the last post on a page, and that post's id.
+	pass the cursor of the last post on a page to retrieve the page directly after it.
+
+	NOTE: just like PostId, when used in fastapi or pydantic ensure PostCursor is called directly.
+	EX: _post_cursor_validator = PostCursorValidator
+	"""
+
+	# sort index, sort key, post id
+	__struct__: Struct = Struct('>Bq6s')
+	__sorts__: List[PostSort] = list(PostSort)
+
+
+	def __new__(cls, value: str) :
+		if isinstance(value, PostCursor) :
+			return super(PostCursor, cls).__new__(cls, value)
+
+		if not isinstance(value, str) :
+			raise NotImplementedError('value must be of type str.')
+
+		try :
+			sort, _, _ = PostCursor.__struct__.unpack(b64decode(value))
+			PostCursor.__sorts__[sort]
+
+		except Exception :
+			raise ValueError('value is not a valid post cursor.')
+
+		return super(PostCursor, cls).__new__(cls, value)
+
+
+	@staticmethod
+	def encode(sort: PostSort, key: int, post_id: PostId) -> 'PostCursor' :
+		"""
+		:param sort: the sort order of the page the cursor belongs to
+		:param key: the value the page is sorted by for the last post on the page
+		:param post_id: the last post on the page, used to break ties between equal keys
+		"""
+		return PostCursor(b64encode(PostCursor.__struct__.pack(PostCursor.__sorts__.index(sort), key, b64decode(PostId(post_id)))).decode())
+
+
+	@staticmethod
+	def from_post(sort: PostSort, post: 'Post') -> 'PostCursor' :
+		"""
+		creates the cursor for the page after the given post, which should be the last post on the current page.
+		only sort orders with keys that can be derived from the post itself are supported.
+		"""
+		key: int
+
+		if sort in { PostSort.new, PostSort.old } :
+			if not post.created :
+				raise ValueError('post must have a created date to create a cursor sorted by new or old.')
+
+			created: datetime = post.created if post.created.tzinfo else post.created.replace(tzinfo=timezone.utc)
+			key = int(created.timestamp() * 1000000)
+
+		elif sort == PostSort.top :
+			if not post.score :
+				raise ValueError('post must have a score to create a cursor sorted by top.')
+
+			key = post.score.up - post.score.down
+
+		else :
+			raise ValueError(f'cursors sorted by {sort.name} must be created by the server.')
+
+		return PostCursor.encode(sort, key, post.post_id)
+
+
+	def decode(self: 'PostCursor') -> Tuple[PostSort, int, PostId] :
+		"""
+		:return: tuple in the form (sort, key, post id)
+		"""
+		sort, key, post_id = PostCursor.__struct__.unpack(b64decode(self))
+		return PostCursor.__sorts__[sort], key, PostId(post_id)
+
+
+def _post_cursor_converter(value) :
+	if value :
+		return PostCursor(value)
+
+	return value
+
+
+PostCursorValidator = validator('cursor', pre=True, always=True, allow_reuse=True)(_post_cursor_converter)
+
+
 class VoteRequest(BaseModel) :
 	_post_id_validator = PostIdValidator
 
@@ -41,8 +130,11 @@ class VoteRequest(BaseModel) :
 
 
 class TimelineRequest(BaseModel) :
+	_post_cursor_validator = PostCursorValidator
+
 	count: Optional[int] = 64
 	page: Optional[int] = 1
+	cursor: Optional[PostCursor]
 
 
 class BaseFetchRequest(TimelineRequest) :
@@ -60,9 +152,12 @@ class FetchCommentsRequest(BaseFetchRequest) :
 
 
 class GetUserPostsRequest(BaseModel) :
+	_post_cursor_validator = PostCursorValidator
+
 	handle: str
 	count: Optional[int] = 64
 	page: Optional[int] = 1
+	cursor: Optional[PostCursor]
 
 
 class MediaType(BaseModel) :
@@ -102,3 +197,280 @@ class Post(BaseModel) :
 	media_type: Optional[MediaType]
 	size: Optional[PostSize]
 	blocked: bool
+	partial: bool = False
+
+
+class PostProjection :
+	"""
+	subset of post fields to populate. fields are Post field names, or dotted field names within user and score, EX:
+	PostProjection(['post_id', 'blocked', 'user.handle', 'score.user_vote'])
+
+	posts built from a projection only have the requested fields set. serialize them with exclude_unset=True to leave out the rest.
+	"""
+
+	def __init__(self: 'PostProjection', fields: Iterable[str]) :
+		# field name -> requested subfields, or None when the whole field was requested
+		self.fields: Dict[str, Optional[Set[str]]] = { }
+
+		for field in fields :
+			name, _, sub = field.partition('.')
+
+			if name not in Post.__fields__ :
+				raise ValueError(f'{name} is not a post field.')
+
+			if not sub :
+				self.fields[name] = None
+				continue
+
+			submodel: Any = Post.__fields__[name].type_
+
+			if not (isinstance(submodel, type) and issubclass(submodel, BaseModel)) or sub not in submodel.__fields__ :
+				raise ValueError(f'{field} is not a post field.')
+
+			if name not in self.fields :
+				self.fields[name] = set()
+
+			if self.fields[name] is not None :
+				self.fields[name].add(sub)
+
+
+	def __contains__(self: 'PostProjection', field: str) -> bool :
+		"""
+		a field is contained when it, any of its subfields, or the field it belongs to were requested
+		"""
+		name, _, sub = field.partition('.')
+
+		if name not in self.fields :
+			return False
+
+		return not sub or self.fields[name] is None or sub in self.fields[name]
+
+
+	def build(self: 'PostProjection', values: Dict[str, Any]) -> Post :
+		"""
+		builds a post with only the requested fields set. values are assumed to already be valid, and are not validated again
+
+		:param values: post field name -> value, for at least every requested field
+		"""
+		post: Dict[str, Any] = { }
+
+		for name, subs in self.fields.items() :
+			value: Any = values.get(name)
+
+			if subs is not None and isinstance(value, BaseModel) :
+				value = type(value).construct(_fields_set=subs, **{ sub: getattr(value, sub) for sub in subs })
+
+			post[name] = value
+
+		return Post.construct(_fields_set=set(post), **post)
+
+
+class PostBatch :
+	"""
+	columnar list of posts. fields are stored in parallel arrays rather than as a model per post, and uploaders and media types are stored
+	once and shared by every post that references them. Post models are only built when a post is accessed, or when the batch is serialized.
+	"""
+
+	# bits of each post's entry in _flags
+	_Scored: int = 0b00001
+	_HasParent: int = 0b00010
+	_HasSize: int = 0b00100
+	_Blocked: int = 0b01000
+	_Partial: int = 0b10000
+
+	_ratings: List[Rating] = list(Rating)
+	_privacies: List[Privacy] = list(Privacy)
+
+
+	def __init__(self: 'PostBatch', projection: Optional[PostProjection] = None) :
+		"""
+		:param projection: when provided, posts are built with only these fields set, see PostProjection
+		"""
+		self.projection: Optional[PostProjection] = projection
+		self.users: Dict[int, UserPortable] = { }
+		self._media_types: List[MediaType] = []
+		self._media_type_index: Dict[Tuple[str, str], int] = { }
+		self._post_ids: array = array('q')
+		self._user_ids: array = array('q')
+		self._parents: array = array('q')
+		self._ratings_index: bytearray = bytearray()
+		self._privacies_index: bytearray = bytearray()
+		self._media_types_index: array = array('i')
+		self._flags: bytearray = bytearray()
+		self._up: array = array('q')
+		self._down: array = array('q')
+		self._total: array = array('q')
+		self._user_vote: array = array('b')
+		self._width: array = array('l')
+		self._height: array = array('l')
+		self._titles: List[Optional[str]] = []
+		self._descriptions: List[Optional[str]] = []
+		self._filenames: List[Optional[str]] = []
+		self._created: List[Optional[datetime]] = []
+		self._updated: List[Optional[datetime]] = []
+
+
+	def add_user(self: 'PostBatch', user_id: int, user: UserPortable) -> None :
+		"""
+		adds the uploader shared by every post with the given user id. may be added before or after those posts, but must be added before they're accessed
+		"""
+		self.users[user_id] = user
+
+
+	def _media_type(self: 'PostBatch', media_type: Optional[MediaType]) -> int :
+		if media_type is None :
+			return -1
+
+		key: Tuple[str, str] = (media_type.file_type, media_type.mime_type)
+		index: Optional[int] = self._media_type_index.get(key)
+
+		if index is None :
+			index = self._media_type_index[key] = len(self._media_types)
+			self._media_types.append(media_type)
+
+		return index
+
+
+	def append(
+		self: 'PostBatch',
+		post_id: int,
+		title: Optional[str],
+		description: Optional[str],
+		user_id: int,
+		score: Optional[Score],
+		rating: Rating,
+		parent: Optional[int],
+		privacy: Privacy,
+		created: Optional[datetime],
+		updated: Optional[datetime],
+		filename: Optional[str],
+		media_type: Optional[MediaType],
+		size: Optional[PostSize],
+		blocked: bool,
+		partial: bool = False,
+	) -> None :
+		"""
+		:param post_id: post id in int format
+		:param user_id: id of the uploader, see add_user. the uploader may be omitted if the batch's projection doesn't include user
+		:param parent: parent post id in int format
+		"""
+		flags: int = 0
+
+		if score is not None :
+			flags |= PostBatch._Scored
+
+		if parent is not None :
+			flags |= PostBatch._HasParent
+
+		if size is not None :
+			flags |= PostBatch._HasSize
+
+		if blocked :
+			flags |= PostBatch._Blocked
+
+		if partial :
+			flags |= PostBatch._Partial
+
+		self._post_ids.append(post_id)
+		self._user_ids.append(user_id)
+		self._parents.append(parent or 0)
+		self._ratings_index.append(PostBatch._ratings.index(rating))
+		self._privacies_index.append(PostBatch._privacies.index(privacy))
+		self._media_types_index.append(self._media_type(media_type))
+		self._flags.append(flags)
+		self._up.append(score.up if score else 0)
+		self._down.append(score.down if score else 0)
+		self._total.append(score.total if score else 0)
+		self._user_vote.append(score.user_vote if score else 0)
+		self._width.append(size.width if size else 0)
+		self._height.append(size.height if size else 0)
+		self._titles.append(title)
+		self._descriptions.append(description)
+		self._filenames.append(filename)
+		self._created.append(created)
+		self._updated.append(updated)
+
+
+	def __len__(self: 'PostBatch') -> int :
+		return len(self._post_ids)
+
+
+	def _post(self: 'PostBatch', i: int) -> Post :
+		flags: int = self._flags[i]
+		media_type: int = self._media_types_index[i]
+		values: Dict[str, Any] = {
+			'post_id': PostId(self._post_ids[i]),
+			'title': self._titles[i],
+			'description': self._descriptions[i],
+			'user': self.users.get(self._user_ids[i]),
+			'score': Score.construct(
+				up=self._up[i],
+				down=self._down[i],
+				total=self._total[i],
+				user_vote=self._user_vote[i],
+			) if flags & PostBatch._Scored else None,
+			'rating': PostBatch._ratings[self._ratings_index[i]],
+			'parent': PostId(self._parents[i]) if flags & PostBatch._HasParent else None,
+			'privacy': PostBatch._privacies[self._privacies_index[i]],
+			'created': self._created[i],
+			'updated': self._updated[i],
+			'filename': self._filenames[i],
+			'media_type': self._media_types[media_type] if media_type >= 0 else None,
+			'size': PostSize.construct(width=self._width[i], height=self._height[i]) if flags & PostBatch._HasSize else None,
+			'blocked': bool(flags & PostBatch._Blocked),
+			'partial': bool(flags & PostBatch._Partial),
+		}
+
+		if self.projection :
+			return self.projection.build(values)
+
+		# every field was validated on its way into the batch, so validation is skipped here
+		return Post.construct(**values)
+
+
+	@overload
+	def __getitem__(self: 'PostBatch', i: int) -> Post : ...
+
+
+	@overload
+	def __getitem__(self: 'PostBatch', i: slice) -> List[Post] : ...
+
+
+	def __getitem__(self: 'PostBatch', i: Union[int, slice]) -> Union[Post, List[Post]] :
+		if isinstance(i, slice) :
+			return list(map(self._post, range(*i.indices(len(self)))))
+
+		if i < 0 :
+			i += len(self)
+
+		if not 0 <= i < len(self) :
+			raise IndexError('post batch index out of range')
+
+		return self._post(i)
+
+
+	def __iter__(self: 'PostBatch') -> Iterator[Post] :
+		return map(self._post, range(len(self)))
+
+
+	def posts(self: 'PostBatch') -> List[Post] :
+		"""
+		:return: every post in the batch as a Post model
+		"""
+		return list(self)
+
+
+	def dict(self: 'PostBatch', **kwargs) -> List[dict] :
+		"""
+		:param kwargs: passed to each Post.dict call
+		"""
+		return [post.dict(**kwargs) for post in self]
+
+
+	def json(self: 'PostBatch', **kwargs) -> str :
+		"""
+		serializes the batch as a json list of posts, building each post only as it's written
+
+		:param kwargs: passed to each Post.json call
+		"""
+		return '[' + ','.join(post.json(**kwargs) for post in self) + ']'
@@ -28,3 +28,10 @@ class Tag(BaseModel) :
 	inherited_tags: List[str]
 	description: Optional[str]
 	count: int
+
+
+class TagSuggestion(BaseModel) :
+	tag: str
+	group: TagGroupPortable
+	deprecated: bool
+	count: int
@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta, timezone
+from random import Random
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from ..models.post import PostSort, Privacy, Rating
+from ..models.tag import TagGroupPortable
+
+
+class Dataset :
+	"""
+	deterministic, synthetic set of users, posts, tags, scores, follows, and votes to serve from the stand-in services and fake backends.
+	records are kept in the json form returned by the internal endpoints, so that serving them doesn't require the internal models or their credentials.
+	"""
+
+	def __init__(self: 'Dataset') :
+		self.users: Dict[int, Dict[str, Any]] = { }
+		self.posts: Dict[int, Dict[str, Any]] = { }
+		self.tags: Dict[str, Dict[str, Any]] = { }
+		self.configs: Dict[int, Dict[str, Any]] = { }
+		# post id -> (upvotes, downvotes)
+		self.scores: Dict[int, Tuple[int, int]] = { }
+		# post id -> tag group -> tags
+		self.post_tags: Dict[int, Dict[str, List[str]]] = { }
+		self.tag_counts: Dict[str, int] = { }
+		self.follows: Dict[int, Set[int]] = { }
+		# user id -> post id -> vote
+		self.votes: Dict[int, Dict[int, int]] = { }
+		# user id -> post ids, newest first
+		self.user_posts: Dict[int, List[int]] = { }
+		self.handles: Dict[str, int] = { }
+		# (tag, inherited tag)
+		self.inheritance: List[Tuple[str, str]] = []
+
+
+	@staticmethod
+	def generate(
+		users: int = 100,
+		posts: int = 10000,
+		tags: int = 500,
+		tags_per_post: int = 8,
+		follows_per_user: int = 20,
+		votes_per_user: int = 200,
+		seed: int = 0,
+	) -> 'Dataset' :
+		"""
+		generates a dataset of the given size. the same arguments always generate the same dataset
+		"""
+		random: Random = Random(seed)
+		dataset: Dataset = Dataset()
+		epoch: datetime = datetime(2023, 1, 1, tzinfo=timezone.utc)
+		groups: List[TagGroupPortable] = list(TagGroupPortable)
+		ratings: List[Rating] = list(Rating)
+
+		for user_id in range(1, users + 1) :
+			handle: str = f'user{user_id}'
+			dataset.handles[handle] = user_id
+			dataset.user_posts[user_id] = []
+			dataset.users[user_id] = {
+				'user_id': user_id,
+				'name': f'User {user_id}',
+				'handle': handle,
+				'privacy': 'public',
+				'icon': None,
+				'banner': None,
+				'website': None,
+				'created': epoch,
+				'description': None,
+				'verified': None,
+				'badges': [],
+			}
+
+		for i in range(tags) :
+			tag: str = f'tag{i}'
+			dataset.tag_counts[tag] = 0
+			dataset.tags[tag] = {
+				'name': tag,
+				'owner': None,
+				'group': groups[i % len(groups)].value,
+				'deprecated': False,
+				'inherited_tags': [],
+				'description': None,
+			}
+
+		tag_names: List[str] = list(dataset.tags.keys())
+
+		for post_id in range(1, posts + 1) :
+			user_id: int = random.randint(1, users)
+			created: datetime = epoch + timedelta(minutes=post_id)
+			dataset.user_posts[user_id].insert(0, post_id)
+			dataset.posts[post_id] = {
+				'post_id': post_id,
+				'title': f'Post {post_id}',
+				'description': None,
+				'user_id': user_id,
+				'rating': random.choice(ratings).value,
+				'parent': None,
+				'privacy': Privacy.public.value,
+				'created': created,
+				'updated': created,
+				'filename': f'{post_id}.png',
+				'media_type': { 'file_type': 'png', 'mime_type': 'image/png' },
+				'size': { 'width': 1024, 'height': 768 },
+			}
+
+			up: int = random.randint(0, 100)
+			dataset.scores[post_id] = (up, random.randint(0, up))
+			tag_groups: Dict[str, List[str]] = { }
+
+			for tag in random.sample(tag_names, min(tags_per_post, len(tag_names))) :
+				tag_groups.setdefault(dataset.tags[tag]['group'], []).append(tag)
+				dataset.tag_counts[tag] += 1
+
+			dataset.post_tags[post_id] = tag_groups
+
+		for user_id in dataset.users :
+			others: List[int] = [other for other in dataset.users if other != user_id]
+			dataset.follows[user_id] = set(random.sample(others, min(follows_per_user, len(others))))
+			dataset.votes[user_id] = {
+				post_id: random.choice((1, -1))
+				for post_id in random.sample(range(1, posts + 1), min(votes_per_user, posts))
+			}
+			dataset.configs[user_id] = {
+				'blocking_behavior': None,
+				'blocked_tags': [[random.choice(tag_names)]] if tag_names else [],
+				'blocked_users': [],
+				'wallpaper': None,
+				'css_properties': None,
+			}
+
+		return dataset
+
+
+	def user_portable(self: 'Dataset', user_id: int, viewer: Optional[int] = None) -> Dict[str, Any] :
+		user: Dict[str, Any] = self.users[user_id]
+		return {
+			'name': user['name'],
+			'handle': user['handle'],
+			'privacy': user['privacy'],
+			'icon': user['icon'],
+			'verified': user['verified'],
+			'following': user_id in self.follows.get(viewer, ()) if viewer else None,
+		}
+
+
+	def score(self: 'Dataset', post_id: int, viewer: Optional[int] = None) -> Dict[str, int] :
+		up, down = self.scores[post_id]
+		return {
+			'up': up,
+			'down': down,
+			'total': up + down,
+			'user_vote': self.votes.get(viewer, { }).get(post_id, 0) if viewer else 0,
+		}
+
+
+	def post(self: 'Dataset', post_id: int, viewer: Optional[int] = None) -> Dict[str, Any] :
+		"""
+		:return: the post in the form of the external Post model
+		"""
+		post: Dict[str, Any] = self.posts[post_id]
+		return {
+			**{ key: value for key, value in post.items() if key != 'user_id' },
+			'post_id': post_id,
+			'user': self.user_portable(post['user_id'], viewer),
+			'score': self.score(post_id, viewer),
+			'blocked': False,
+		}
+
+
+	def tag(self: 'Dataset', tag: str) -> Dict[str, Any] :
+		"""
+		:return: the tag in the form of the external Tag model
+		"""
+		itag: Dict[str, Any] = self.tags[tag]
+		return {
+			'tag': itag['name'],
+			'owner': self.user_portable(itag['owner']) if itag['owner'] else None,
+			'group': itag['group'],
+			'deprecated': itag['deprecated'],
+			'inherited_tags': itag['inherited_tags'],
+			'description': itag['description'],
+			'count': self.tag_counts[tag],
+		}
+
+
+	def user_post_ids(self: 'Dataset', user_id: int, sort: PostSort = PostSort.new, count: int = 64, page: int = 1, after: Optional[int] = None) -> List[int] :
+		"""
+		:param after: when provided, page is ignored and the page directly after this post id is returned
+		"""
+		post_ids: List[int] = self.user_posts.get(user_id, [])
+
+		if sort == PostSort.old :
+			post_ids = post_ids[::-1]
+
+		elif sort != PostSort.new :
+			post_ids = sorted(post_ids, key=lambda post_id : self.scores[post_id][0] - self.scores[post_id][1], reverse=True)
+
+		if after is not None :
+			start: int = post_ids.index(after) + 1 if after in post_ids else len(post_ids)
+			return post_ids[start:start + count]
+
+		return post_ids[count * (page - 1):count * page]
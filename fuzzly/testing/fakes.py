@@ -0,0 +1,274 @@
+from asyncio import sleep
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from time import sleep as block
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+from aerospike import POLICY_EXISTS_CREATE, POLICY_EXISTS_UPDATE, POLICY_GEN_EQ
+from aerospike.exception import RecordExistsError, RecordGenerationError, RecordNotFound, ServerError
+from kh_common.auth import KhUser
+from kh_common.caching.key_value_store import KeyValueStore
+from kh_common.exceptions.http_error import Unauthorized
+from kh_common.models.auth import AuthToken, Scope
+from psycopg2 import OperationalError
+
+from ..models._database import InternalScore, InternalUser
+from ..models._shared import PostId
+from ..models.tag import TagGroupPortable
+from .dataset import Dataset
+from .faults import Faults
+
+
+class FakeAerospike :
+	"""
+	in-memory stand-in for the aerospike client used by every KeyValueStore. installing it in place of the real client keeps the kvs's own
+	locking, executors, and local caching in the path, so that load tests measure them too.
+	"""
+
+	def __init__(self: 'FakeAerospike', faults: Optional[Faults] = None) :
+		self.faults: Faults = faults or Faults()
+		self.records: Dict[Tuple[str, str, str], Dict[str, Any]] = { }
+		self.generations: Dict[Tuple[str, str, str], int] = { }
+		self._lock: Lock = Lock()
+
+
+	def _fault(self: 'FakeAerospike') -> None :
+		# called from the kvs's executor threads, so blocking here doesn't block the event loop
+		delay: float = self.faults.delay()
+
+		if delay :
+			block(delay)
+
+		if self.faults.fails() :
+			raise ServerError('injected fault')
+
+
+	def put(self: 'FakeAerospike', key: Tuple[str, str, str], bins: Dict[str, Any], meta: Optional[Dict[str, Any]] = None, policy: Optional[Dict[str, Any]] = None) -> None :
+		self._fault()
+
+		policy = policy or { }
+
+		with self._lock :
+			if policy.get('exists') == POLICY_EXISTS_CREATE and key in self.records :
+				raise RecordExistsError()
+
+			if policy.get('gen') == POLICY_GEN_EQ and (meta or { }).get('gen') != self.generations.get(key, 0) :
+				raise RecordGenerationError()
+
+			self.records[key] = dict(bins)
+			self.generations[key] = self.generations.get(key, 0) + 1
+
+
+	def get(self: 'FakeAerospike', key: Tuple[str, str, str], policy: Optional[Dict[str, Any]] = None) -> Tuple[Tuple[str, str, str], Dict[str, Any], Dict[str, Any]] :
+		self._fault()
+
+		with self._lock :
+			if key not in self.records :
+				raise RecordNotFound()
+
+			return key, { 'ttl': 0, 'gen': self.generations[key] }, dict(self.records[key])
+
+
+	def get_many(self: 'FakeAerospike', keys: Iterable[Tuple[str, str, str]], policy: Optional[Dict[str, Any]] = None) -> List[Tuple[Tuple[str, str, str], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]] :
+		self._fault()
+		return [
+			(key, { 'ttl': 0, 'gen': self.generations[key] }, dict(self.records[key])) if key in self.records else (key, None, None)
+			for key in keys
+		]
+
+
+	def exists(self: 'FakeAerospike', key: Tuple[str, str, str], policy: Optional[Dict[str, Any]] = None) -> Tuple[Tuple[str, str, str], Optional[Dict[str, Any]]] :
+		self._fault()
+		return key, ({ 'ttl': 0, 'gen': self.generations[key] } if key in self.records else None)
+
+
+	def remove(self: 'FakeAerospike', key: Tuple[str, str, str], policy: Optional[Dict[str, Any]] = None) -> None :
+		self._fault()
+
+		with self._lock :
+			if self.records.pop(key, None) is None :
+				raise RecordNotFound()
+
+			self.generations.pop(key, None)
+
+
+	def increment(self: 'FakeAerospike', key: Tuple[str, str, str], bin: str, delta: int, policy: Optional[Dict[str, Any]] = None) -> None :
+		self._fault()
+
+		with self._lock :
+			if key not in self.records :
+				if policy and policy.get('exists') == POLICY_EXISTS_UPDATE :
+					raise RecordNotFound()
+
+				self.records[key] = { bin: 0 }
+
+			self.records[key][bin] = self.records[key].get(bin, 0) + delta
+			self.generations[key] = self.generations.get(key, 0) + 1
+
+
+	def truncate(self: 'FakeAerospike', namespace: str, set: str, nanos: int, policy: Optional[Dict[str, Any]] = None) -> None :
+		with self._lock :
+			for key in [key for key in self.records if key[:2] == (namespace, set)] :
+				del self.records[key]
+				self.generations.pop(key, None)
+
+
+class FakeDBI :
+	"""
+	serves the internal database interface's read queries from a dataset, so that the internal models can be run without a database
+	"""
+
+	def __init__(self: 'FakeDBI', dataset: Dataset, faults: Optional[Faults] = None) :
+		self.dataset: Dataset = dataset
+		self.faults: Faults = faults or Faults()
+		self.queries: int = 0
+
+
+	async def _fault(self: 'FakeDBI') -> None :
+		self.queries += 1
+		delay: float = self.faults.delay()
+
+		if delay :
+			await sleep(delay)
+
+		if self.faults.fails() :
+			raise OperationalError('injected fault')
+
+
+	def _users(self: 'FakeDBI', user_ids: List[int]) -> Dict[int, InternalUser] :
+		return {
+			user_id: InternalUser.parse_obj(self.dataset.users[user_id])
+			for user_id in user_ids
+			if user_id in self.dataset.users
+		}
+
+
+	def _scores(self: 'FakeDBI', post_ids: List[PostId]) -> Dict[PostId, Optional[InternalScore]] :
+		scores: Dict[PostId, Optional[InternalScore]] = { }
+
+		for post_id in post_ids :
+			score: Optional[Tuple[int, int]] = self.dataset.scores.get(PostId(post_id).int())
+			scores[PostId(post_id)] = InternalScore(up=score[0], down=score[1], total=sum(score)) if score else None
+
+		return scores
+
+
+	def _tags(self: 'FakeDBI', post_ids: List[PostId]) -> Dict[PostId, List[str]] :
+		return {
+			PostId(post_id): [tag for tags in self.dataset.post_tags.get(PostId(post_id).int(), { }).values() for tag in tags]
+			for post_id in post_ids
+		}
+
+
+	async def users_many(self: 'FakeDBI', user_ids: List[int]) -> Dict[int, InternalUser] :
+		await self._fault()
+		return self._users(user_ids)
+
+
+	async def scores_many(self: 'FakeDBI', post_ids: List[PostId]) -> Dict[PostId, Optional[InternalScore]] :
+		await self._fault()
+		return self._scores(post_ids)
+
+
+	async def votes_many(self: 'FakeDBI', user_id: int, post_ids: List[PostId]) -> Dict[PostId, int] :
+		await self._fault()
+		votes: Dict[int, int] = self.dataset.votes.get(user_id, { })
+		return { PostId(post_id): votes.get(PostId(post_id).int(), 0) for post_id in post_ids }
+
+
+	async def votes_map(self: 'FakeDBI', user_id: int, limit: int) -> List[Tuple[int, int]] :
+		await self._fault()
+		# post ids increase with post age in the dataset, so the newest posts have the largest ids
+		return sorted(self.dataset.votes.get(user_id, { }).items(), reverse=True)[:limit]
+
+
+	async def following_set(self: 'FakeDBI', user_id: int) -> List[int] :
+		await self._fault()
+		return sorted(self.dataset.follows.get(user_id, ()))
+
+
+	async def following_many(self: 'FakeDBI', user_id: int, targets: List[int]) -> Dict[int, bool] :
+		await self._fault()
+		follows: Iterable[int] = self.dataset.follows.get(user_id, ())
+		return { target: target in follows for target in targets }
+
+
+	async def tags_many(self: 'FakeDBI', post_ids: List[PostId]) -> Dict[PostId, List[str]] :
+		await self._fault()
+		return self._tags(post_ids)
+
+
+	async def hydrate_many(self: 'FakeDBI', user_ids: List[int], scored_ids: List[PostId], post_ids: List[PostId]) -> Tuple[Dict[int, InternalUser], Dict[PostId, Optional[InternalScore]], Dict[PostId, List[str]]] :
+		# a single round trip, like the real combined query
+		await self._fault()
+		return self._users(user_ids), self._scores(scored_ids), self._tags(post_ids)
+
+
+	async def tagCount(self: 'FakeDBI', tag: str) -> int :
+		await self._fault()
+		return self.dataset.tag_counts.get(tag, 0)
+
+
+	async def tag_counts_many(self: 'FakeDBI', tags: List[str]) -> Dict[str, int] :
+		await self._fault()
+		return { tag: self.dataset.tag_counts.get(tag, 0) for tag in tags }
+
+
+	async def tags_snapshot(self: 'FakeDBI') -> List[Tuple[str, TagGroupPortable, bool]] :
+		await self._fault()
+		return [(tag['name'], TagGroupPortable(tag['group']), tag['deprecated']) for tag in self.dataset.tags.values()]
+
+
+	async def tag_inheritance(self: 'FakeDBI') -> List[Tuple[str, str]] :
+		await self._fault()
+		return list(self.dataset.inheritance)
+
+
+	async def _handle_to_user_id(self: 'FakeDBI', handle: str) -> int :
+		await self._fault()
+		return self.dataset.handles[handle]
+
+
+class StandInUser(KhUser) :
+	"""
+	kh user that's treated as authenticated whenever it has a token, without verifying the token
+	"""
+
+	async def authenticated(self: 'StandInUser', raise_error: bool = True) -> bool :
+		if not self.token :
+			if raise_error :
+				raise Unauthorized('User is not authenticated.')
+
+			return False
+
+		return True
+
+
+	@staticmethod
+	def viewer(user_id: Optional[int] = None) -> 'StandInUser' :
+		"""
+		:param user_id: the authenticated user to view as, or None for an anonymous viewer
+		"""
+		if user_id is None :
+			return StandInUser(user_id=-1, token=None, scope={ Scope.default })
+
+		token: AuthToken = AuthToken(user_id, datetime.now(timezone.utc) + timedelta(hours=1), uuid4(), { }, f'stand-in.{user_id}')
+		return StandInUser(user_id=user_id, token=token, scope={ Scope.default, Scope.user })
+
+
+def install(dataset: Dataset, kvs_faults: Optional[Faults] = None, db_faults: Optional[Faults] = None) -> Tuple[FakeAerospike, FakeDBI] :
+	"""
+	replaces the kvs client and the internal models' database interface with fakes backed by the dataset.
+	should only be used in the test environment, where no kvs client is connected on import
+
+	:return: tuple of (fake kvs client, fake database interface)
+	"""
+	from ..models import internal
+
+	aerospike: FakeAerospike = FakeAerospike(kvs_faults)
+	KeyValueStore._client = aerospike
+	db: FakeDBI = FakeDBI(dataset, db_faults)
+	internal.DB = db
+	internal.tag_implications.load(dataset.inheritance)
+	return aerospike, db
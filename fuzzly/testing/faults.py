@@ -0,0 +1,35 @@
+from random import Random
+from typing import Optional
+
+
+class Faults :
+	"""
+	latency and error injection for a stand-in service or fake backend. can be changed at any time, such as partway through a load test
+	"""
+
+	def __init__(self: 'Faults', latency: float = 0, jitter: float = 0, error_rate: float = 0, error_status: int = 503, seed: Optional[int] = None) :
+		"""
+		:param latency: seconds added to every call
+		:param jitter: up to this many seconds are added on top of latency, uniformly at random
+		:param error_rate: share of calls, from 0 to 1, that fail
+		:param error_status: http status returned by failed calls to stand-in services
+		"""
+		self.latency: float = latency
+		self.jitter: float = jitter
+		self.error_rate: float = error_rate
+		self.error_status: int = error_status
+		self._random: Random = Random(seed)
+
+
+	def delay(self: 'Faults') -> float :
+		"""
+		:return: seconds the current call should be delayed by
+		"""
+		return self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+
+
+	def fails(self: 'Faults') -> bool :
+		"""
+		:return: whether the current call should fail
+		"""
+		return self.error_rate > 0 and self._random.random() < self.error_rate
@@ -0,0 +1,228 @@
+from argparse import ArgumentParser, Namespace
+from asyncio import gather, run
+from math import ceil, inf
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from pydantic import BaseModel
+
+from .. import FuzzlyClient
+from ..models._shared import PostId
+from .dataset import Dataset
+from .faults import Faults
+from .services import StandInServices
+
+
+Workload = Callable[[int], Awaitable[Any]]
+
+# posts per page for the page-sized workloads
+PageSize: int = 64
+
+
+class LoadReport(BaseModel) :
+	workload: str
+	concurrency: int
+	requests: int
+	errors: int
+	duration: float
+	rps: float
+	mean: float
+	p50: float
+	p90: float
+	p99: float
+	max: float
+
+
+def percentile(latencies: Sequence[float], p: float) -> float :
+	"""
+	:param latencies: latencies, sorted in ascending order
+	:param p: percentile, from 0 to 100
+	:return: the nearest-rank percentile, or 0 when there are no latencies
+	"""
+	if not latencies :
+		return 0
+
+	return latencies[min(len(latencies) - 1, max(ceil(p / 100 * len(latencies)) - 1, 0))]
+
+
+async def run_load(workload: Workload, concurrency: int = 16, duration: Optional[float] = 10, requests: Optional[int] = None, name: str = 'workload') -> LoadReport :
+	"""
+	calls the workload from concurrency workers at once, as fast as it completes, until either duration seconds pass or requests calls are made
+
+	:param workload: async callable, called with the index of each request
+	:return: throughput and latency percentiles, in seconds, of every call. failed calls are counted as errors, but their latencies are still included
+	"""
+	assert duration is not None or requests is not None, 'either duration or requests must be provided.'
+	latencies: List[float] = []
+	errors: int = 0
+	issued: int = 0
+	start: float = perf_counter()
+	end: float = start + duration if duration is not None else inf
+
+	async def worker() -> None :
+		nonlocal errors, issued
+
+		while (requests is None or issued < requests) and perf_counter() < end :
+			index: int = issued
+			issued += 1
+			began: float = perf_counter()
+
+			try :
+				await workload(index)
+
+			except Exception :
+				errors += 1
+
+			latencies.append(perf_counter() - began)
+
+	await gather(*(worker() for _ in range(concurrency)))
+	elapsed: float = perf_counter() - start
+	latencies.sort()
+
+	return LoadReport(
+		workload=name,
+		concurrency=concurrency,
+		requests=len(latencies),
+		errors=errors,
+		duration=elapsed,
+		rps=len(latencies) / elapsed if elapsed else 0,
+		mean=sum(latencies) / len(latencies) if latencies else 0,
+		p50=percentile(latencies, 50),
+		p90=percentile(latencies, 90),
+		p99=percentile(latencies, 99),
+		max=latencies[-1] if latencies else 0,
+	)
+
+
+def _post(dataset: Dataset) -> Workload :
+	client: FuzzlyClient = FuzzlyClient()
+	post_ids: List[PostId] = list(map(PostId, dataset.posts))
+	return lambda i : client.post(post_ids[i % len(post_ids)])
+
+
+def _post_tags(dataset: Dataset) -> Workload :
+	client: FuzzlyClient = FuzzlyClient()
+	post_ids: List[PostId] = list(map(PostId, dataset.posts))
+	return lambda i : client.post_tags(post_ids[i % len(post_ids)])
+
+
+def _tag(dataset: Dataset) -> Workload :
+	client: FuzzlyClient = FuzzlyClient()
+	tags: List[str] = list(dataset.tags)
+	return lambda i : client.tag(tags[i % len(tags)])
+
+
+def _internal_post(dataset: Dataset) -> Workload :
+	# the internal models require the test environment and db credentials to import, so they're only imported when used
+	from ..models.internal import _InternalClient
+	from .fakes import install
+
+	install(dataset)
+	client: _InternalClient = _InternalClient()
+	post_ids: List[PostId] = list(map(PostId, dataset.posts))
+	return lambda i : client.post(post_ids[i % len(post_ids)])
+
+
+def _hydrate_page(dataset: Dataset) -> Workload :
+	from ..models.internal import InternalPost, InternalPosts, _InternalClient
+	from .fakes import StandInUser, install
+
+	install(dataset)
+	client: _InternalClient = _InternalClient()
+	iposts: List[InternalPost] = list(map(InternalPost.parse_obj, dataset.posts.values()))
+	user_ids: List[int] = list(dataset.users)
+
+	async def hydrate_page(i: int) -> Any :
+		start: int = (i * PageSize) % max(len(iposts) - PageSize, 1)
+		viewer: StandInUser = StandInUser.viewer(user_ids[i % len(user_ids)])
+		return await InternalPosts(post_list=iposts[start:start + PageSize]).posts(client, viewer)
+
+	return hydrate_page
+
+
+def _posts_many(dataset: Dataset) -> Workload :
+	from ..models.internal import InternalPosts, _InternalClient
+	from .fakes import StandInUser, install
+
+	install(dataset)
+	client: _InternalClient = _InternalClient()
+	post_ids: List[PostId] = list(map(PostId, dataset.posts))
+	user_ids: List[int] = list(dataset.users)
+
+	async def posts_many(i: int) -> Any :
+		start: int = (i * PageSize) % max(len(post_ids) - PageSize, 1)
+		viewer: StandInUser = StandInUser.viewer(user_ids[i % len(user_ids)])
+		iposts = await client.posts_many(post_ids[start:start + PageSize])
+		return await InternalPosts(post_list=list(iposts.values())).posts(client, viewer)
+
+	return posts_many
+
+
+def _user_posts(dataset: Dataset) -> Workload :
+	from ..models.internal import InternalPosts, _InternalClient
+	from .fakes import StandInUser, install
+
+	install(dataset)
+	client: _InternalClient = _InternalClient()
+	user_ids: List[int] = list(dataset.users)
+
+	async def user_posts(i: int) -> Any :
+		viewer: StandInUser = StandInUser.viewer(user_ids[i % len(user_ids)])
+		iposts = await client.user_posts(user_ids[(i * 7) % len(user_ids)], count=PageSize)
+		return await InternalPosts(post_list=iposts).posts(client, viewer)
+
+	return user_posts
+
+
+# workload name -> function that creates the workload for a dataset
+#   post, post_tags, tag: single external fetches through FuzzlyClient
+#   internal_post: single internal post fetches, served mostly from the client's local cache once warm
+#   hydrate_page: a page of internal posts hydrated for a logged in viewer
+#   posts_many: a page of internal posts fetched by id and then hydrated
+#   user_posts: a page of a user's posts fetched and then hydrated
+Workloads: Dict[str, Callable[[Dataset], Workload]] = {
+	'post': _post,
+	'post_tags': _post_tags,
+	'tag': _tag,
+	'internal_post': _internal_post,
+	'hydrate_page': _hydrate_page,
+	'posts_many': _posts_many,
+	'user_posts': _user_posts,
+}
+
+
+async def _main(args: Namespace) -> None :
+	dataset: Dataset = Dataset.generate(users=args.users, posts=args.posts, seed=args.seed)
+	faults: Dict[str, Faults] = {
+		host: Faults(args.latency, args.jitter, args.error_rate, seed=args.seed)
+		for host in ['AccountHost', 'TagHost', 'PostHost', 'UserHost', 'ConfigHost']
+	}
+
+	async with StandInServices(dataset, faults) :
+		for workload in args.workload :
+			func: Workload = Workloads[workload](dataset)
+
+			if args.warmup :
+				await run_load(func, args.concurrency, None, args.warmup, workload)
+
+			report: LoadReport = await run_load(func, args.concurrency, args.duration, args.requests, workload)
+			print(
+				f'{report.workload}: {report.requests} requests, {report.errors} errors in {report.duration:.2f}s, {report.rps:.1f} req/s,',
+				f'mean {report.mean * 1000:.2f}ms, p50 {report.p50 * 1000:.2f}ms, p90 {report.p90 * 1000:.2f}ms, p99 {report.p99 * 1000:.2f}ms, max {report.max * 1000:.2f}ms',
+			)
+
+
+def main(argv: Optional[List[str]] = None) -> None :
+	parser: ArgumentParser = ArgumentParser(prog='python -m fuzzly.testing', description='runs workloads against local stand-ins of the fuzz.ly services. run with ENVIRONMENT=test')
+	parser.add_argument('workload', nargs='+', choices=list(Workloads))
+	parser.add_argument('--concurrency', type=int, default=16)
+	parser.add_argument('--duration', type=float, default=10, help='seconds to run each workload for')
+	parser.add_argument('--requests', type=int, default=None, help='stop each workload after this many requests')
+	parser.add_argument('--warmup', type=int, default=0, help='requests to make before measuring each workload')
+	parser.add_argument('--users', type=int, default=100)
+	parser.add_argument('--posts', type=int, default=10000)
+	parser.add_argument('--latency', type=float, default=0, help='seconds added to every stand-in response')
+	parser.add_argument('--jitter', type=float, default=0, help='up to this many seconds are added on top of latency')
+	parser.add_argument('--error-rate', type=float, default=0, help='share of stand-in responses that fail with a 503')
+	parser.add_argument('--seed', type=int, default=0)
+	run(_main(parser.parse_args(argv)))
@@ -0,0 +1,196 @@
+from asyncio import sleep
+from datetime import datetime, timedelta, timezone
+from json import dumps
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from aiohttp import web
+from pydantic.json import pydantic_encoder
+
+from .. import constants
+from ..models._shared import PostId
+from ..models.post import PostCursor, PostSort
+from .dataset import Dataset
+from .faults import Faults
+
+
+Handler = Callable[[web.Request], Awaitable[web.Response]]
+
+
+def _json(data: Any) -> web.Response :
+	return web.Response(text=dumps(data, default=pydantic_encoder), content_type='application/json')
+
+
+def _post_id(request: web.Request) -> int :
+	try :
+		return PostId(request.match_info['post_id']).int()
+
+	except ValueError :
+		raise web.HTTPNotFound()
+
+
+def _page(dataset: Dataset, user_id: int, body: Dict[str, Any]) -> List[int] :
+	after: Optional[int] = PostCursor(body['cursor']).decode()[2].int() if body.get('cursor') else None
+	return dataset.user_post_ids(user_id, PostSort[body.get('sort', 'new')], body.get('count', 64), body.get('page', 1), after)
+
+
+def _record(records: Dict[Any, Any], key: Any) -> Any :
+	if key not in records :
+		raise web.HTTPNotFound()
+
+	return records[key]
+
+
+class StandInServices :
+	"""
+	local stand-ins for the fuzz.ly services that the clients call, serving a dataset on the ports of the current environment's hosts.
+	only the endpoints called by this library are served. each service has its own Faults, for latency and error injection.
+	should only be used with the local or test environments, whose hosts all point to localhost.
+	"""
+
+	def __init__(self: 'StandInServices', dataset: Dataset, faults: Optional[Dict[str, Faults]] = None) :
+		"""
+		:param dataset: data served by every service
+		:param faults: host name, as found in fuzzly.constants, -> faults injected into that service. services without faults respond immediately
+		"""
+		self.dataset: Dataset = dataset
+		self.routes: Dict[str, List[web.RouteDef]] = {
+			'AccountHost': [
+				web.post('/v1/bot_login', self.bot_login),
+			],
+			'TagHost': [
+				web.get('/v1/tag/{tag}', self.tag),
+				web.get('/v1/tags/{post_id}', self.post_tags),
+				web.get('/i1/tag/{tag}', self.internal_tag),
+				web.get('/i1/tags/{post_id}', self.post_tags),
+			],
+			'PostHost': [
+				web.get('/v1/post/{post_id}', self.post),
+				web.post('/v1/my_posts', self.my_posts),
+				web.get('/i1/post/{post_id}', self.internal_post),
+				web.post('/i1/posts', self.internal_posts),
+				web.post('/i1/user/{user_id}', self.internal_user_posts),
+			],
+			'UserHost': [
+				web.get('/i1/user/{user_id}', self.internal_user),
+			],
+			'ConfigHost': [
+				web.get('/i1/user/{user_id}', self.user_config),
+			],
+		}
+		self.faults: Dict[str, Faults] = { host: Faults() for host in self.routes }
+		self.faults.update(faults or { })
+		self.requests: Dict[str, int] = { host: 0 for host in self.routes }
+		self._runners: List[web.AppRunner] = []
+
+
+	def _middleware(self: 'StandInServices', host: str) -> Callable :
+		@web.middleware
+		async def inject(request: web.Request, handler: Handler) -> web.Response :
+			self.requests[host] += 1
+			faults: Faults = self.faults[host]
+			delay: float = faults.delay()
+
+			if delay :
+				await sleep(delay)
+
+			if faults.fails() :
+				return web.json_response({ 'error': 'injected fault' }, status=faults.error_status)
+
+			return await handler(request)
+
+		return inject
+
+
+	async def start(self: 'StandInServices') -> None :
+		for host, routes in self.routes.items() :
+			url = urlparse(getattr(constants, host))
+			app: web.Application = web.Application(middlewares=[self._middleware(host)])
+			app.add_routes(routes)
+			runner: web.AppRunner = web.AppRunner(app, access_log=None)
+			await runner.setup()
+			await web.TCPSite(runner, url.hostname, url.port).start()
+			self._runners.append(runner)
+
+
+	async def stop(self: 'StandInServices') -> None :
+		while self._runners :
+			await self._runners.pop().cleanup()
+
+
+	async def __aenter__(self: 'StandInServices') -> 'StandInServices' :
+		await self.start()
+		return self
+
+
+	async def __aexit__(self: 'StandInServices', *exc: Any) -> None :
+		await self.stop()
+
+
+	async def bot_login(self: 'StandInServices', request: web.Request) -> web.Response :
+		now: datetime = datetime.now(timezone.utc)
+		return _json({
+			'user_id': 0,
+			'handle': 'stand_in_bot',
+			'name': None,
+			'mod': False,
+			'token': {
+				'version': '1',
+				'algorithm': 'ed25519',
+				'key_id': 0,
+				'issued': now,
+				'expires': now + timedelta(days=1),
+				'token': 'stand-in',
+			},
+		})
+
+
+	async def tag(self: 'StandInServices', request: web.Request) -> web.Response :
+		_record(self.dataset.tags, request.match_info['tag'])
+		return _json(self.dataset.tag(request.match_info['tag']))
+
+
+	async def internal_tag(self: 'StandInServices', request: web.Request) -> web.Response :
+		return _json(_record(self.dataset.tags, request.match_info['tag']))
+
+
+	async def post_tags(self: 'StandInServices', request: web.Request) -> web.Response :
+		return _json(_record(self.dataset.post_tags, _post_id(request)))
+
+
+	async def post(self: 'StandInServices', request: web.Request) -> web.Response :
+		post_id: int = _post_id(request)
+		_record(self.dataset.posts, post_id)
+		return _json(self.dataset.post(post_id))
+
+
+	async def my_posts(self: 'StandInServices', request: web.Request) -> web.Response :
+		body: Dict[str, Any] = await request.json()
+		# the stand-in bot owns no posts, so the first user's posts are returned instead
+		return _json(list(map(self.dataset.post, _page(self.dataset, 1, body))))
+
+
+	async def internal_post(self: 'StandInServices', request: web.Request) -> web.Response :
+		return _json(_record(self.dataset.posts, _post_id(request)))
+
+
+	async def internal_posts(self: 'StandInServices', request: web.Request) -> web.Response :
+		body: Dict[str, Any] = await request.json()
+		post_ids: List[int] = [PostId(post_id).int() for post_id in body['post_ids']]
+		# like the bulk endpoint, posts that don't exist are left out rather than failing the request
+		return _json([self.dataset.posts[post_id] for post_id in post_ids if post_id in self.dataset.posts])
+
+
+	async def internal_user_posts(self: 'StandInServices', request: web.Request) -> web.Response :
+		body: Dict[str, Any] = await request.json()
+		user_id: int = int(request.match_info['user_id'])
+		_record(self.dataset.users, user_id)
+		return _json([self.dataset.posts[post_id] for post_id in _page(self.dataset, user_id, body)])
+
+
+	async def internal_user(self: 'StandInServices', request: web.Request) -> web.Response :
+		return _json(_record(self.dataset.users, int(request.match_info['user_id'])))
+
+
+	async def user_config(self: 'StandInServices', request: web.Request) -> web.Response :
+		return _json(_record(self.dataset.configs, int(request.match_info['user_id'])))
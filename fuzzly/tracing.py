@@ -0,0 +1,313 @@
+from asyncio import current_task
+from collections import deque
+from contextvars import ContextVar, Token
+from functools import wraps
+from itertools import count
+from json import dump
+from random import random
+from time import perf_counter
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Union
+
+from kh_common.caching.key_value_store import KeyValueStore
+from kh_common.gateway import Gateway
+
+
+"""
+lightweight tracing for requests made through this library. spans are recorded into the trace of the span that was active when they started.
+the active span is held in a context variable, so it follows tasks created with ensure_future or gather, which copy the context they're created in.
+traces are sampled when their first span starts, and every span of a sampled trace is passed to the tracer's sinks once that first span ends.
+"""
+
+
+class Span :
+	"""
+	a single timed operation within a trace. used as a context manager, which makes it the active span until it exits
+	"""
+
+	__slots__ = ('tracer', 'name', 'trace_id', 'span_id', 'parent_id', 'lane', 'start', 'end', 'attributes', 'error', '_spans', '_token')
+
+	def __init__(self: 'Span', tracer: 'Tracer', name: str, attributes: Optional[Dict[str, Any]], parent: Optional['Span']) :
+		self.tracer: Tracer = tracer
+		self.name: str = name
+		self.trace_id: int = parent.trace_id if parent else next(_ids)
+		self.span_id: int = next(_ids)
+		self.parent_id: Optional[int] = parent.span_id if parent else None
+		self.lane: int = _lane()
+		self.start: float = 0
+		self.end: Optional[float] = None
+		self.attributes: Dict[str, Any] = attributes or { }
+		self.error: Optional[str] = None
+		# every span of a trace shares the root span's list
+		self._spans: List[Span] = parent._spans if parent else []
+		self._token: Optional[Token] = None
+
+
+	@property
+	def duration(self: 'Span') -> Optional[float] :
+		return self.end - self.start if self.end is not None else None
+
+
+	def set(self: 'Span', **attributes: Any) -> None :
+		self.attributes.update(attributes)
+
+
+	def __enter__(self: 'Span') -> 'Span' :
+		if len(self._spans) < self.tracer.max_spans :
+			self._spans.append(self)
+
+		self._token = _current.set(self)
+		self.start = perf_counter()
+		return self
+
+
+	def __exit__(self: 'Span', exc_type: Optional[type], exc: Optional[BaseException], tb: Any) -> None :
+		self.end = perf_counter()
+		_current.reset(self._token)
+
+		if exc_type :
+			self.error = exc_type.__name__
+
+		if self.parent_id is None :
+			self.tracer._finish(self._spans)
+
+
+class _Unsampled :
+	"""
+	stands in for the root span of a trace that wasn't sampled, so that its descendants don't each start traces of their own
+	"""
+
+	__slots__ = ('_token',)
+
+	def set(self: '_Unsampled', **attributes: Any) -> None :
+		pass
+
+
+	def __enter__(self: '_Unsampled') -> '_Unsampled' :
+		self._token = _current.set(self)
+		return self
+
+
+	def __exit__(self: '_Unsampled', exc_type: Optional[type], exc: Optional[BaseException], tb: Any) -> None :
+		_current.reset(self._token)
+
+
+class _Noop :
+
+	__slots__ = ()
+
+	def set(self: '_Noop', **attributes: Any) -> None :
+		pass
+
+
+	def __enter__(self: '_Noop') -> '_Noop' :
+		return self
+
+
+	def __exit__(self: '_Noop', exc_type: Optional[type], exc: Optional[BaseException], tb: Any) -> None :
+		pass
+
+
+_ids: Iterator[int] = count(1)
+_current: ContextVar[Union[Span, _Unsampled, None]] = ContextVar('fuzzly_span', default=None)
+_noop: _Noop = _Noop()
+
+
+def _lane() -> int :
+	# spans that run in the same task are drawn on the same lane, concurrent tasks get lanes of their own
+	try :
+		return id(current_task())
+
+	except RuntimeError :
+		return 0
+
+
+def current_span() -> Optional[Span] :
+	"""
+	:return: the active span, or None if the current trace isn't sampled or there is none
+	"""
+	span: Union[Span, _Unsampled, None] = _current.get()
+	return span if isinstance(span, Span) else None
+
+
+class Sink :
+	"""
+	receives the spans of every sampled trace once its root span ends. subclass and add to a tracer's sinks to export traces elsewhere
+	"""
+
+	def emit(self: 'Sink', spans: List[Span]) -> None :
+		raise NotImplementedError
+
+
+class MemorySink(Sink) :
+	"""
+	keeps the most recent traces in memory
+	"""
+
+	def __init__(self: 'MemorySink', max_traces: int = 100) :
+		self.traces: Deque[List[Span]] = deque(maxlen=max_traces)
+
+
+	def emit(self: 'MemorySink', spans: List[Span]) -> None :
+		self.traces.append(spans)
+
+
+class ChromeTraceSink(Sink) :
+	"""
+	collects traces in the chrome trace event format, which can be opened with chrome://tracing or https://ui.perfetto.dev.
+	each trace is drawn as its own process, and each task within the trace as its own thread.
+	"""
+
+	def __init__(self: 'ChromeTraceSink', path: str, max_events: int = 100000) :
+		"""
+		:param path: file that the trace is written to when flushed
+		:param max_events: events past this many are dropped until the sink is flushed
+		"""
+		self.path: str = path
+		self.max_events: int = max_events
+		self.events: List[Dict[str, Any]] = []
+		self.dropped: int = 0
+
+
+	def emit(self: 'ChromeTraceSink', spans: List[Span]) -> None :
+		if len(self.events) + len(spans) + 1 > self.max_events :
+			self.dropped += len(spans)
+			return
+
+		lanes: Dict[int, int] = { }
+		root: Span = spans[0]
+		self.events.append({ 'name': 'process_name', 'ph': 'M', 'pid': root.trace_id, 'args': { 'name': root.name } })
+
+		for span in spans :
+			# spans that never finished, such as ones abandoned in the background, have nothing to draw
+			if span.end is None :
+				continue
+
+			args: Dict[str, Any] = dict(span.attributes)
+
+			if span.error :
+				args['error'] = span.error
+
+			self.events.append({
+				'name': span.name,
+				'ph': 'X',
+				'ts': span.start * 1000000,
+				'dur': (span.end - span.start) * 1000000,
+				'pid': span.trace_id,
+				'tid': lanes.setdefault(span.lane, len(lanes)),
+				'args': args,
+			})
+
+
+	def flush(self: 'ChromeTraceSink') -> None :
+		"""
+		writes every trace collected so far to path, replacing its contents
+		"""
+		with open(self.path, 'w') as fp :
+			dump({ 'traceEvents': self.events, 'displayTimeUnit': 'ms' }, fp, default=str)
+
+
+class Tracer :
+
+	def __init__(self: 'Tracer', sample_rate: float = 0, sinks: Optional[List[Sink]] = None, max_spans: int = 1000) :
+		"""
+		:param sample_rate: share of traces, from 0 to 1, that are recorded. 0 disables tracing, other than forced traces
+		:param sinks: sinks that sampled traces are passed to
+		:param max_spans: spans past this many within a single trace aren't recorded
+		"""
+		self.sample_rate: float = sample_rate
+		self.sinks: List[Sink] = sinks if sinks is not None else []
+		self.max_spans: int = max_spans
+
+
+	def span(self: 'Tracer', name: str, attributes: Optional[Dict[str, Any]] = None, force: bool = False) -> Union[Span, _Unsampled, _Noop] :
+		"""
+		creates a span within the active trace, or starts a new trace if there isn't one. use as a context manager, EX:
+		with tracer.span('db.users_many', { 'users': len(user_ids) }) as span :
+			...
+
+		:param attributes: values recorded alongside the span
+		:param force: always record the trace, when this span starts a new one
+		"""
+		parent: Union[Span, _Unsampled, None] = _current.get()
+
+		if parent is None :
+			if not force and not self.sample_rate :
+				return _noop
+
+			if not force and random() >= self.sample_rate :
+				return _Unsampled()
+
+			return Span(self, name, attributes, None)
+
+		if isinstance(parent, _Unsampled) :
+			return _noop
+
+		return Span(self, name, attributes, parent)
+
+
+	def traced(self: 'Tracer', name: Optional[str] = None) -> Callable[[Callable], Callable] :
+		"""
+		wraps an async function in a span, named after the function unless a name is provided
+		"""
+		def decorator(func: Callable) -> Callable :
+			span_name: str = name or func.__qualname__
+
+			@wraps(func)
+			async def wrapper(*args: Any, **kwargs: Any) -> Any :
+				with self.span(span_name) :
+					return await func(*args, **kwargs)
+
+			return wrapper
+
+		return decorator
+
+
+	def _finish(self: 'Tracer', spans: List[Span]) -> None :
+		for sink in self.sinks :
+			try :
+				sink.emit(spans)
+
+			except Exception :
+				# a broken sink shouldn't break the request being traced
+				pass
+
+
+# the tracer used by every span emitted by this library. disabled until sample_rate is set or a trace is forced
+tracer: Tracer = Tracer()
+
+
+class TracedGateway(Gateway) :
+	"""
+	Gateway that records a span for every call
+	"""
+
+	async def __call__(self: 'TracedGateway', body: dict = None, params: dict = None, auth: str = None, headers: Dict[str, str] = None, **kwargs: Any) -> Any :
+		with tracer.span(f'{self._method.upper()} {self._endpoint}', kwargs or None) :
+			return await super().__call__(body, params, auth, headers, **kwargs)
+
+
+class TracedKeyValueStore(KeyValueStore) :
+	"""
+	KeyValueStore that records a span for every asynchronous operation
+	"""
+
+	async def get_async(self: 'TracedKeyValueStore', key: str, *args: Any, **kwargs: Any) -> Any :
+		with tracer.span(f'kvs.get {self._set}', { 'key': key }) :
+			return await super().get_async(key, *args, **kwargs)
+
+
+	async def get_many_async(self: 'TracedKeyValueStore', keys: Any, *args: Any, **kwargs: Any) -> Dict[str, Any] :
+		keys = list(keys)
+
+		with tracer.span(f'kvs.get_many {self._set}', { 'keys': len(keys) }) :
+			return await super().get_many_async(keys, *args, **kwargs)
+
+
+	async def put_async(self: 'TracedKeyValueStore', key: str, *args: Any, **kwargs: Any) -> None :
+		with tracer.span(f'kvs.put {self._set}', { 'key': key }) :
+			return await super().put_async(key, *args, **kwargs)
+
+
+	async def remove_async(self: 'TracedKeyValueStore', key: str, *args: Any, **kwargs: Any) -> None :
+		with tracer.span(f'kvs.remove {self._set}', { 'key': key }) :
+			return await super().remove_async(key, *args, **kwargs)
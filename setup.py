@@ -13,6 +13,10 @@ setup(
 	url='https://github.com/kheina-com/fuzzly',
 	packages=find_packages(exclude=['tests']),
 	install_requires=list(filter(None, map(str.strip, open('requirements.txt').read().split()))),
+	extras_require={
+		'export': ['avro>=1.11', 'avrofastapi>=0.0.4'],
+		'local': ['numpy>=1.21'],
+	},
 	python_requires='>=3.9',
 	license='Mozilla Public License 2.0',
 )
@@ -0,0 +1,64 @@
+from typing import List
+
+import pytest
+
+from fuzzly.local.autocomplete import TagIndex
+from fuzzly.models.tag import TagGroupPortable
+
+
+@pytest.fixture
+def index() -> TagIndex :
+	index: TagIndex = TagIndex()
+	index.apply([
+		('canine', TagGroupPortable.species, False, 50),
+		('cat', TagGroupPortable.species, False, 80),
+		('catgirl', TagGroupPortable.misc, False, 10),
+		('caterpillar', TagGroupPortable.species, True, 500),
+		('dog', TagGroupPortable.species, False, 60),
+		('cb', TagGroupPortable.misc, False, 80),
+	])
+	return index
+
+
+@pytest.mark.parametrize(
+	'prefix, k, expected',
+	[
+		('c', 10, ['cat', 'cb', 'canine', 'catgirl']),
+		('ca', 2, ['cat', 'canine']),
+		('cat', 10, ['cat', 'catgirl']),
+		('CAT', 10, ['cat', 'catgirl']),
+		('', 1, ['cat']),
+		('z', 10, []),
+	]
+)
+def test_TagIndex_SearchRankedByCount(index: TagIndex, prefix: str, k: int, expected: List[str]) :
+	assert [t.tag for t in index.search(prefix, k)] == expected
+
+
+def test_TagIndex_IncludeDeprecated(index: TagIndex) :
+	suggestion = index.search('cat', 1, include_deprecated=True)[0]
+	assert suggestion.tag == 'caterpillar'
+	assert suggestion.deprecated
+
+
+def test_TagIndex_UpdatesInvalidateCachedPrefixes(index: TagIndex) :
+	assert index.search('c', 1)[0].tag == 'cat'
+	index.adjust('catgirl', 100)
+	assert index.search('c', 1)[0].tag == 'catgirl'
+	index.remove('catgirl')
+	assert index.search('c', 1)[0].tag == 'cat'
+	assert 'catgirl' not in index
+
+
+def test_TagIndex_ApplyOnlyTouchesChangedTags(index: TagIndex) :
+	changed: int = index.apply([
+		('canine', TagGroupPortable.species, False, 50),
+		('cat', TagGroupPortable.species, False, 81),
+		('catgirl', TagGroupPortable.misc, False, 10),
+		('caterpillar', TagGroupPortable.species, True, 500),
+		('dog', TagGroupPortable.species, False, 60),
+		('wolf', TagGroupPortable.species, False, 1),
+	])
+	assert changed == 3  # cat updated, wolf added, cb removed
+	assert len(index) == 6
+	assert [t.tag for t in index.search('c', 10)] == ['cat', 'canine', 'catgirl']
@@ -0,0 +1,186 @@
+from asyncio import gather, sleep
+
+import pytest
+from aerospike.exception import RecordNotFound
+from kh_common.caching.key_value_store import KeyValueStore
+from pydantic import BaseModel
+
+from fuzzly.models._caching import StaleWhileRevalidate, update_record
+
+
+class Model(BaseModel) :
+	value: int
+
+
+class FakeKVS :
+
+	def __init__(self) :
+		self.data = { }
+
+	async def get_async(self, key) :
+		if key not in self.data :
+			raise RecordNotFound()
+
+		return self.data[key]
+
+
+class Fetcher :
+
+	def __init__(self) :
+		self.calls = 0
+
+	async def fetch(self, item_id: int, auth: str = None) -> Model :
+		self.calls += 1
+		await sleep(0.01)
+		return Model(value=self.calls)
+
+
+@pytest.mark.asyncio
+async def test_Miss_ConcurrentCalls_SingleFetch() :
+	# arrange
+	fetcher = Fetcher()
+	fetch = StaleWhileRevalidate(FakeKVS(), 'item.{item_id}')(Fetcher.fetch)
+
+	# act
+	results = await gather(*[fetch(fetcher, 1) for _ in range(5)])
+
+	# assert
+	assert fetcher.calls == 1
+	assert all(result.value == 1 for result in results)
+
+
+@pytest.mark.asyncio
+async def test_Stale_ServedWhileRefreshing() :
+	# arrange
+	fetcher = Fetcher()
+	fetch = StaleWhileRevalidate(FakeKVS(), 'item.{item_id}', soft_TTL=0, hard_TTL=60)(Fetcher.fetch)
+	await fetch(fetcher, 1)
+
+	# act
+	stale = await fetch(fetcher, item_id=1)
+	await sleep(0.02)
+	fresh = await fetch(fetcher, 1)
+
+	# assert
+	assert stale.value == 1
+	assert fresh.value == 2
+	assert fetch.cache.stale == 2
+
+
+@pytest.mark.asyncio
+async def test_KVS_ReadBeforeFetch_InvalidDataIgnored() :
+	# arrange
+	kvs = FakeKVS()
+	kvs.data['item.1'] = Model(value=100)
+	kvs.data['item.2'] = bytearray(b'not a model')
+	fetcher = Fetcher()
+	fetch = StaleWhileRevalidate(kvs, 'item.{item_id}', soft_TTL=0, hard_TTL=0)(Fetcher.fetch)
+
+	# act
+	first = await fetch(fetcher, 1)
+	second = await fetch(fetcher, 2)
+
+	# assert
+	assert first.value == 100
+	assert second.value == 1
+	assert fetcher.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_Hit_ResultMutated_CacheUnchanged() :
+	# arrange
+	fetcher = Fetcher()
+	fetch = StaleWhileRevalidate(FakeKVS(), 'item.{item_id}')(Fetcher.fetch)
+	first = await fetch(fetcher, 1)
+
+	# act
+	first.value = 100
+	second = await fetch(fetcher, 1)
+
+	# assert
+	assert second.value == 1
+	assert fetcher.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_Invalidate_KeyArgumentsOnly_NextCallFetches() :
+	# arrange
+	fetcher = Fetcher()
+	fetch = StaleWhileRevalidate(FakeKVS(), 'item.{item_id}')(Fetcher.fetch)
+	await fetch(fetcher, 1)
+
+	# act
+	fetch.cache.invalidate(item_id=1)
+	result = await fetch(fetcher, 1)
+
+	# assert
+	assert result.value == 2
+	assert fetcher.calls == 2
+
+
+@pytest.fixture
+def aerospike(monkeypatch) :
+	fakes = pytest.importorskip('fuzzly.testing.fakes', exc_type=ImportError)
+	client = fakes.FakeAerospike()
+	monkeypatch.setattr(KeyValueStore, '_client', client)
+	return client
+
+
+@pytest.mark.asyncio
+async def test_UpdateRecord_ConcurrentWrite_ReappliedOnTop(aerospike) :
+	# arrange
+	kvs = KeyValueStore('kheina', 'test')
+	kvs.put('key', [1])
+	calls = []
+
+	def modify(data) :
+		calls.append(list(data))
+
+		if len(calls) == 1 :
+			# another writer lands between the read and the write
+			kvs.put('key', data + [2])
+
+		return data + [3]
+
+	# act
+	result = await update_record(kvs, 'key', modify)
+
+	# assert
+	assert calls == [[1], [1, 2]]
+	assert result == [1, 2, 3]
+	assert aerospike.records[('kheina', 'test', 'key')] == { 'data': [1, 2, 3] }
+	assert kvs.get('key') == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_UpdateRecord_AlwaysConflicts_RecordDropped(aerospike) :
+	# arrange
+	kvs = KeyValueStore('kheina', 'test')
+	kvs.put('key', 0)
+
+	def modify(data) :
+		kvs.put('key', data + 1)
+		return -1
+
+	# act
+	result = await update_record(kvs, 'key', modify, retries=3)
+
+	# assert
+	assert result is None
+	assert ('kheina', 'test', 'key') not in aerospike.records
+
+	with pytest.raises(RecordNotFound) :
+		kvs.get('key')
+
+
+@pytest.mark.asyncio
+async def test_UpdateRecord_Missing_NothingWritten(aerospike) :
+	# arrange
+	kvs = KeyValueStore('kheina', 'test')
+
+	# act
+	result = await update_record(kvs, 'key', lambda data : data)
+
+	# assert
+	assert result is None
+	assert not aerospike.records
@@ -0,0 +1,96 @@
+from asyncio import sleep
+
+import pytest
+
+from fuzzly.models._chunking import ChunkPolicy
+
+
+@pytest.mark.asyncio
+async def test_Run_OversizedBatch_SplitsAndMerges() :
+	# arrange
+	policy = ChunkPolicy(chunk_size=10, concurrency=2, target_latency=None)
+	chunks = []
+	running = [0, 0]
+
+	async def fetch(keys) :
+		chunks.append(len(keys))
+		running[0] += 1
+		running[1] = max(running)
+		await sleep(0.001)
+		running[0] -= 1
+		return { key: key * 2 for key in keys }
+
+	# act
+	result = await policy.run(range(35), fetch)
+
+	# assert
+	assert result == { key: key * 2 for key in range(35) }
+	assert sorted(chunks) == [5, 10, 10, 10]
+	assert running[1] == 2
+	assert policy.chunks == 4
+
+
+@pytest.mark.asyncio
+async def test_Decorator_LeadingArguments_PassedToEveryChunk() :
+	# arrange
+	class Store :
+		@ChunkPolicy(chunk_size=2, target_latency=None)
+		async def votes_many(self, user_id, post_ids) :
+			return { post_id: user_id for post_id in post_ids }
+
+	# act
+	result = await Store().votes_many(7, [1, 2, 3])
+
+	# assert
+	assert result == { 1: 7, 2: 7, 3: 7 }
+
+
+@pytest.mark.asyncio
+async def test_Decorator_KeywordArguments_PassedThrough() :
+	# arrange
+	class Store :
+		@ChunkPolicy(chunk_size=2, target_latency=None)
+		async def votes_many(self, user_id, post_ids) :
+			return { post_id: user_id for post_id in post_ids }
+
+	# act
+	by_keyword = await Store().votes_many(user_id=7, post_ids=[1, 2, 3])
+	keys_by_keyword = await Store().votes_many(8, post_ids=[1, 2, 3])
+
+	# assert
+	assert by_keyword == { 1: 7, 2: 7, 3: 7 }
+	assert keys_by_keyword == { 1: 8, 2: 8, 3: 8 }
+
+
+def test_Observe_SlowChunks_ShrinksChunkSize() :
+	# arrange
+	policy = ChunkPolicy(chunk_size=100, min_size=10, max_size=1000, target_latency=0.05, smoothing=1)
+
+	# act + assert
+	policy._observe(100, 0.1)
+	assert policy.chunk_size == 50
+
+	policy._observe(50, 0.01)
+	assert policy.chunk_size == 250
+
+	# calls well under the chunk size don't adjust it
+	policy._observe(1, 1)
+	assert policy.chunk_size == 250
+
+
+@pytest.mark.asyncio
+async def test_Run_NoKeys_FuncNotCalled() :
+	# arrange
+	policy = ChunkPolicy()
+	calls = []
+
+	async def func(chunk) :
+		calls.append(chunk)
+		return { }
+
+	# act
+	result = await policy.run([], func)
+
+	# assert
+	assert result == { }
+	assert calls == []
@@ -0,0 +1,66 @@
+from datetime import datetime, timezone
+from io import BytesIO, StringIO
+from json import loads
+from typing import AsyncIterator, List, Optional
+
+import pytest
+from avro.datafile import DataFileReader
+from avro.io import DatumReader
+from pydantic import BaseModel
+
+from fuzzly.export import write_avro, write_ndjson
+from fuzzly.models.post import Rating
+
+
+class Record(BaseModel) :
+	post_id: int
+	rating: Rating
+	created: datetime
+	tags: List[str]
+	title: Optional[str]
+
+
+async def records(count: int) -> AsyncIterator[Record] :
+	for i in range(count) :
+		yield Record(
+			post_id=i,
+			rating=Rating.general,
+			created=datetime(2022, 1, 1, tzinfo=timezone.utc),
+			tags=['tag'] * i,
+			title=None if i % 2 else f'post {i}',
+		)
+
+
+@pytest.mark.asyncio
+async def test_WriteNdjson_Records_OneLinePerRecord() :
+	# arrange
+	fp = StringIO()
+
+	# act
+	count = await write_ndjson(records(3), fp)
+
+	# assert
+	lines = fp.getvalue().splitlines()
+	assert count == 3
+	assert len(lines) == 3
+	assert loads(lines[2]) == { 'post_id': 2, 'rating': 'general', 'created': '2022-01-01T00:00:00+00:00', 'tags': ['tag', 'tag'], 'title': 'post 2' }
+
+
+@pytest.mark.asyncio
+async def test_WriteAvro_Records_ReadableContainerFile() :
+	# arrange
+	fp = BytesIO()
+
+	# act
+	count = await write_avro(records(100), Record, fp)
+
+	# assert
+	fp.seek(0)
+	data = list(DataFileReader(fp, DatumReader()))
+	assert count == 100
+	assert len(data) == 100
+	assert data[3]['post_id'] == 3
+	assert data[3]['rating'] == 'general'
+	assert data[3]['tags'] == ['tag'] * 3
+	assert data[3]['title'] is None
+	assert data[4]['title'] == 'post 4'
@@ -0,0 +1,154 @@
+import pytest
+from aerospike import POLICY_EXISTS_CREATE, POLICY_EXISTS_UPDATE, POLICY_GEN_EQ
+from aerospike.exception import RecordExistsError, RecordGenerationError, RecordNotFound, ServerError
+
+from fuzzly.testing.dataset import Dataset
+from fuzzly.testing.faults import Faults
+
+
+fakes = pytest.importorskip('fuzzly.testing.fakes', exc_type=ImportError)
+internal = pytest.importorskip('fuzzly.models.internal', exc_type=ImportError)
+
+
+KEY = ('kheina', 'test', 'key')
+
+
+class TestFakeAerospike :
+
+	def test_Put_ThenGet_GenerationIncremented(self) :
+		# arrange
+		client = fakes.FakeAerospike()
+
+		# act
+		client.put(KEY, { 'data': 1 })
+		client.put(KEY, { 'data': 2 })
+
+		# assert
+		assert client.get(KEY) == (KEY, { 'ttl': 0, 'gen': 2 }, { 'data': 2 })
+		assert client.exists(KEY) == (KEY, { 'ttl': 0, 'gen': 2 })
+		assert client.get_many([KEY, ('kheina', 'test', 'missing')])[1] == (('kheina', 'test', 'missing'), None, None)
+
+
+	def test_Put_GenerationChanged_RaisesRecordGenerationError(self) :
+		# arrange
+		client = fakes.FakeAerospike()
+		client.put(KEY, { 'data': 1 })
+		_, meta, _ = client.get(KEY)
+		client.put(KEY, { 'data': 2 })
+
+		# act
+		with pytest.raises(RecordGenerationError) :
+			client.put(KEY, { 'data': 3 }, meta=meta, policy={ 'gen': POLICY_GEN_EQ })
+
+		# assert
+		assert client.get(KEY)[2] == { 'data': 2 }
+
+
+	def test_Put_CreateOnlyExists_RaisesRecordExistsError(self) :
+		# arrange
+		client = fakes.FakeAerospike()
+		client.put(KEY, { 'data': 1 }, policy={ 'exists': POLICY_EXISTS_CREATE })
+
+		# act
+		with pytest.raises(RecordExistsError) :
+			client.put(KEY, { 'data': 2 }, policy={ 'exists': POLICY_EXISTS_CREATE })
+
+		# assert
+		assert client.get(KEY)[2] == { 'data': 1 }
+
+
+	def test_Increment_UpdateOnly_MissingRecordSkipped(self) :
+		# arrange
+		client = fakes.FakeAerospike()
+		client.put(KEY, { 'data': 1 })
+
+		# act
+		client.increment(KEY, 'data', 2, policy={ 'exists': POLICY_EXISTS_UPDATE })
+
+		with pytest.raises(RecordNotFound) :
+			client.increment(('kheina', 'test', 'missing'), 'data', 2, policy={ 'exists': POLICY_EXISTS_UPDATE })
+
+		client.increment(('kheina', 'test', 'created'), 'data', 2)
+
+		# assert
+		assert client.get(KEY)[2] == { 'data': 3 }
+		assert client.get(('kheina', 'test', 'created'))[2] == { 'data': 2 }
+
+
+	def test_RemoveAndTruncate_RecordsDropped(self) :
+		# arrange
+		client = fakes.FakeAerospike()
+		client.put(KEY, { 'data': 1 })
+		client.put(('kheina', 'test', 'other'), { 'data': 1 })
+		client.put(('kheina', 'kept', 'key'), { 'data': 1 })
+
+		# act
+		client.remove(KEY)
+
+		with pytest.raises(RecordNotFound) :
+			client.remove(KEY)
+
+		client.truncate('kheina', 'test', 0)
+
+		# assert
+		assert list(client.records) == [('kheina', 'kept', 'key')]
+
+
+	def test_Faults_ErrorRate_RaisesServerError(self) :
+		# arrange
+		client = fakes.FakeAerospike(Faults(error_rate=1))
+
+		# act
+		with pytest.raises(ServerError) :
+			client.get(KEY)
+
+
+class TestFakeDBI :
+
+	@pytest.mark.asyncio
+	async def test_Reads_ServedFromDataset(self) :
+		# arrange
+		dataset = Dataset.generate(users=5, posts=20, tags=10)
+		db = fakes.FakeDBI(dataset)
+		user_id = dataset.posts[1]['user_id']
+
+		# act
+		users, scores, tags = await db.hydrate_many([user_id, 99], [internal.PostId(1)], [internal.PostId(1)])
+		following = await db.following_many(user_id, list(dataset.users))
+
+		# assert
+		assert list(users) == [user_id]
+		assert users[user_id].handle == dataset.users[user_id]['handle']
+		assert scores[internal.PostId(1)].up == dataset.scores[1][0]
+		assert sorted(tags[internal.PostId(1)]) == sorted(tag for group in dataset.post_tags[1].values() for tag in group)
+		assert { target for target, follows in following.items() if follows } == dataset.follows[user_id]
+		assert await db.tag_counts_many(['tag1']) == { 'tag1': dataset.tag_counts['tag1'] }
+		assert len(await db.votes_map(user_id, 10)) == 10
+		assert await db._handle_to_user_id(dataset.users[user_id]['handle']) == user_id
+		assert db.queries == 5
+
+
+	@pytest.mark.asyncio
+	async def test_Faults_ErrorRate_RaisesOperationalError(self) :
+		# arrange
+		db = fakes.FakeDBI(Dataset(), Faults(error_rate=1))
+
+		# act
+		with pytest.raises(fakes.OperationalError) :
+			await db.users_many([1])
+
+
+@pytest.mark.asyncio
+async def test_StandInUser_Viewer_AuthenticatedOnlyWithToken() :
+	# act
+	anonymous = fakes.StandInUser.viewer()
+	viewer = fakes.StandInUser.viewer(1)
+
+	# assert
+	assert not await anonymous.authenticated(raise_error=False)
+	assert await viewer.authenticated()
+	assert viewer.user_id == 1
+
+	with pytest.raises(fakes.Unauthorized) :
+		await anonymous.authenticated()
+
@@ -0,0 +1,133 @@
+import pytest
+
+from fuzzly.local.implications import TagImplications
+
+
+@pytest.fixture
+def implications() -> TagImplications :
+	implications: TagImplications = TagImplications()
+	implications.load([
+		('wolf', 'canine'),
+		('canine', 'mammal'),
+		('mammal', 'animal'),
+		('fox', 'canine'),
+		# cycles shouldn't prevent the closure from completing
+		('a', 'b'),
+		('b', 'c'),
+		('c', 'a'),
+	])
+	return implications
+
+
+def test_TagImplications_TransitiveClosure(implications: TagImplications) :
+	assert implications.implied('wolf') == { 'canine', 'mammal', 'animal' }
+	assert implications.implied('animal') == set()
+	assert implications.implied('unknown') == set()
+
+
+def test_TagImplications_Cycles(implications: TagImplications) :
+	assert implications.implied('a') == { 'b', 'c' }
+	assert implications.expand(['b']) == { 'a', 'b', 'c' }
+
+
+def test_TagImplications_ExpandMany(implications: TagImplications) :
+	assert implications.expand_many({ 1: ['fox', 'red'], 2: [] }) == {
+		1: { 'fox', 'red', 'canine', 'mammal', 'animal' },
+		2: set(),
+	}
+
+
+def test_TagImplications_EmptyExpandsToInput() :
+	assert TagImplications().expand(['wolf']) == { 'wolf' }
+
+
+class FakeClient :
+
+	def __init__(self, edges, error=None) :
+		self.edges = edges
+		self.error = error
+		self.calls = 0
+
+	async def tag_inheritance(self) :
+		self.calls += 1
+
+		if self.error :
+			raise self.error
+
+		return self.edges
+
+
+@pytest.mark.asyncio
+async def test_EnsureFresh_NeverLoaded_WaitsForLoad() :
+	# arrange
+	implications = TagImplications()
+	client = FakeClient([('wolf', 'canine')])
+
+	# act
+	await implications.ensure_fresh(client)
+	await implications.ensure_fresh(client)
+
+	# assert
+	assert implications.implied('wolf') == { 'canine' }
+	assert client.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_EnsureFresh_Stale_RefreshedInBackground() :
+	# arrange
+	implications = TagImplications(TTL=0)
+	implications.load([('wolf', 'canine')])
+	client = FakeClient([('wolf', 'mammal')])
+
+	# act
+	await implications.ensure_fresh(client)
+	stale = implications.implied('wolf')
+	await implications._refreshing
+
+	# assert
+	assert stale == { 'canine' }
+	assert implications.implied('wolf') == { 'mammal' }
+
+
+@pytest.mark.asyncio
+async def test_EnsureFresh_LoadFails_TagsUnexpanded() :
+	# arrange
+	implications = TagImplications()
+	client = FakeClient([('wolf', 'canine')], ConnectionError('db unavailable'))
+
+	# act
+	await implications.ensure_fresh(client)
+	await implications.ensure_fresh(client)
+
+	with pytest.raises(ConnectionError) :
+		await implications._refreshing
+
+	# assert
+	assert implications.expand(['wolf']) == { 'wolf' }
+	assert client.calls == 2
+
+	# act
+	client.error = None
+	await implications.ensure_fresh(client)
+	await implications._refreshing
+
+	# assert
+	assert implications.implied('wolf') == { 'canine' }
+
+
+@pytest.mark.asyncio
+async def test_Warm_LoadsInBackground() :
+	# arrange
+	implications = TagImplications()
+	client = FakeClient([('wolf', 'canine')])
+
+	# act
+	task = implications.warm(client)
+	before = implications.implied('wolf')
+	await task
+	await implications.ensure_fresh(client)
+
+	# assert
+	assert before == set()
+	assert implications.implied('wolf') == { 'canine' }
+	assert client.calls == 1
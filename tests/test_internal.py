@@ -0,0 +1,582 @@
+from asyncio import gather, sleep
+
+import pytest
+from kh_common.caching.key_value_store import KeyValueStore
+
+
+internal = pytest.importorskip('fuzzly.models.internal', exc_type=ImportError)
+fakes = pytest.importorskip('fuzzly.testing.fakes', exc_type=ImportError)
+
+from fuzzly.models._database import FollowSet, FollowSetKVS, VoteMap, VoteMapKVS
+from fuzzly.testing.faults import Faults
+
+
+@pytest.fixture
+def aerospike(monkeypatch) :
+	# enough latency that concurrent updates read the same generation
+	client = fakes.FakeAerospike(Faults(latency=0.002, jitter=0.004, seed=0))
+	monkeypatch.setattr(KeyValueStore, '_client', client)
+	monkeypatch.setattr(internal, '_follow_sets', internal.OrderedDict())
+	monkeypatch.setattr(internal, '_vote_maps', internal.OrderedDict())
+	monkeypatch.setattr(internal, '_block_trees', internal.OrderedDict())
+	monkeypatch.setattr(internal._InternalClient.user_config.cache, '_local', internal.OrderedDict())
+	return client
+
+
+@pytest.mark.asyncio
+async def test_UpdateFollowSet_ConcurrentUpdates_NoneLost(aerospike) :
+	# arrange
+	follow_set = FollowSet(1, [2, 3])
+	FollowSetKVS.put('1', { 'version': follow_set.version, 'follows': follow_set.tobytes() })
+
+	# act
+	await gather(
+		internal.update_follow_set(1, 4, True),
+		internal.update_follow_set(1, 5, True),
+		internal.update_follow_set(1, 6, True),
+		internal.update_follow_set(1, 2, False),
+	)
+
+	# assert
+	data = aerospike.records[('kheina', 'follow_set', '1')]['data']
+	assert list(FollowSet.from_bytes(data['version'], data['follows']).follows) == [3, 4, 5, 6]
+	assert list((await internal.fetch_follow_set(1)).follows) == [3, 4, 5, 6]
+
+
+@pytest.mark.asyncio
+async def test_UpdateFollowSet_NotStored_NothingWritten(aerospike) :
+	# act
+	await internal.update_follow_set(1, 2, True)
+
+	# assert
+	assert not aerospike.records
+
+
+@pytest.mark.asyncio
+async def test_UpdateVoteMap_ConcurrentUpdates_NoneLost(aerospike) :
+	# arrange
+	VoteMapKVS.put('1', internal._vote_map_record(VoteMap(1, True, [(10, 1), (20, -1)])))
+
+	# act
+	await gather(
+		internal.update_vote_map(1, internal.PostId(30), 1),
+		internal.update_vote_map(1, internal.PostId(40), -1),
+		internal.update_vote_map(1, internal.PostId(20), 0),
+		internal.update_vote_map(1, internal.PostId(10), -1),
+	)
+
+	# assert
+	data = aerospike.records[('kheina', 'vote_map', '1')]['data']
+	vote_map = VoteMap.from_bytes(data['version'], data['complete'], data['post_ids'], data['votes'])
+	assert list(zip(vote_map.post_ids, vote_map.votes)) == [(10, -1), (30, 1), (40, -1)]
+	assert (await internal.fetch_vote_map(1)).get(30) == 1
+
+
+def _ipost(post_id, created, privacy='public', user_id=1) :
+	return internal.InternalPost(
+		post_id=post_id,
+		user_id=user_id,
+		rating='general',
+		privacy=privacy,
+		created=internal.datetime(2023, 1, created),
+	)
+
+
+@pytest.mark.asyncio
+async def test_UserPostsUpdate_ConcurrentUpdates_NoneLost(aerospike) :
+	# arrange
+	client = internal._InternalClient()
+	internal.UserPostsKVS.put('1.new', internal.InternalUserPosts(version=1, complete=True, post_list=[_ipost(2, 2), _ipost(1, 1)]))
+
+	# act
+	await gather(
+		client.user_posts_update(_ipost(3, 3)),
+		client.user_posts_update(_ipost(4, 4)),
+		client.user_posts_update(_ipost(1, 1, 'private')),
+	)
+
+	# assert
+	head = aerospike.records[('kheina', 'user_posts', '1.new')]['data']
+	assert [post.post_id for post in head.post_list] == [4, 3, 2]
+	assert head.version > 1
+
+
+@pytest.mark.asyncio
+async def test_InvalidateBlockTree_ConfigEdited_EditVisibleImmediately(dataset) :
+	# arrange
+	client = internal._InternalClient()
+	viewer = fakes.StandInUser.viewer(1)
+	internal.UserConfigKVS.put('user.1', internal.UserConfig(blocked_tags=[['a']]))
+	tree, _ = await internal.fetch_block_tree(client, viewer)
+	assert tree.blocked({ 'a' })
+
+	# act
+	internal.UserConfigKVS.put('user.1', internal.UserConfig(blocked_tags=[['b']]))
+	await internal.invalidate_block_tree(1)
+	tree, user_config = await internal.fetch_block_tree(client, viewer)
+
+	# assert
+	assert user_config.blocked_tags == [['b']]
+	assert tree.blocked({ 'b' })
+	assert not tree.blocked({ 'a' })
+
+
+@pytest.mark.asyncio
+async def test_FetchBlockTree_ImplicationsUnavailable_TagsUnexpanded(dataset, monkeypatch) :
+	# arrange
+	async def tag_inheritance() :
+		raise fakes.OperationalError('db unavailable')
+
+	monkeypatch.setattr(internal.DB, 'tag_inheritance', tag_inheritance)
+	internal.UserConfigKVS.put('user.1', internal.UserConfig(blocked_tags=[['mammal']]))
+
+	# act
+	tree, user_config = await internal.fetch_block_tree(internal._InternalClient(), fakes.StandInUser.viewer(1))
+
+	# assert
+	assert user_config.blocked_tags == [['mammal']]
+	assert not internal.post_blocked(tree, user_config, 'user', 2, ['wolf'])
+	assert internal.post_blocked(tree, user_config, 'user', 2, ['mammal'])
+
+
+@pytest.mark.asyncio
+async def test_InvalidateBlockTree_OtherProcess_EditVisibleImmediately(aerospike, dataset) :
+	# arrange
+	client = internal._InternalClient()
+	viewer = fakes.StandInUser.viewer(1)
+	internal.UserConfigKVS.put('user.1', internal.UserConfig(blocked_tags=[['a']]))
+	tree, _ = await internal.fetch_block_tree(client, viewer)
+	assert tree.blocked({ 'a' })
+
+	# act
+	# another process stores the new config and invalidates it, without touching this process's local copies
+	aerospike.put(('kheina', 'configs', 'user.1'), { 'data': internal.UserConfig(blocked_tags=[['b']]) })
+	aerospike.increment(('kheina', 'configs', 'block_generation.1'), 'data', 1)
+	tree, user_config = await internal.fetch_block_tree(client, viewer)
+
+	# assert
+	assert user_config.blocked_tags == [['b']]
+	assert tree.blocked({ 'b' })
+	assert not tree.blocked({ 'a' })
+
+
+@pytest.mark.asyncio
+async def test_AdjustTagCounts_ConcurrentBackFill_AdjustmentKept(aerospike) :
+	# arrange
+	db = object.__new__(internal.DBI)
+
+	async def prepared_async(name, sql, params=(), **kwargs) :
+		# the count is read from the db before the tag is added, but written back after its count is adjusted
+		internal.CountKVS.put('a', 5)
+		await internal.adjust_tag_counts(['a', 'a'], 1)
+		return [('a', 5)]
+
+	db.prepared_async = prepared_async
+
+	# act
+	counts = await db.tag_counts_many(['a', 'b'])
+	await internal.write_behind.drain()
+
+	# assert
+	assert counts == { 'a': 5, 'b': 0 }
+	assert aerospike.records[('kheina', 'tag_count', 'a')] == { 'data': 6 }
+	assert aerospike.records[('kheina', 'tag_count', 'b')] == { 'data': 0 }
+	assert await db.tagCount('a') == 6
+
+
+@pytest.mark.asyncio
+async def test_ScoresMany_ReplicaLagging_NewerScoreKept(aerospike) :
+	# arrange
+	db = object.__new__(internal.DBI)
+	newer = internal.InternalScore(up=5, down=0, total=5)
+
+	async def prepared_async(name, sql, params=(), **kwargs) :
+		# the vote service stores a newer score while the lagging replica is read
+		internal.ScoreCache.put(internal.PostId(1), newer)
+		return [(1, 1, 0), (2, 1, 0)]
+
+	db.prepared_async = prepared_async
+
+	# act
+	scores = await db.scores_many([internal.PostId(1), internal.PostId(2)])
+	await internal.write_behind.drain()
+
+	# assert
+	assert scores[internal.PostId(1)].up == 1
+	assert aerospike.records[('kheina', 'score', internal.PostId(1))] == { 'data': newer }
+	assert aerospike.records[('kheina', 'score', internal.PostId(2))]['data'].up == 1
+
+
+@pytest.fixture
+def head(aerospike) :
+	internal.UserPostsKVS.put('1.new', internal.InternalUserPosts(version=1, complete=True, post_list=[_ipost(4, 4), _ipost(3, 3), _ipost(2, 2)]))
+
+
+def _cursor(sort, created, post_id) :
+	return internal.PostCursor.encode(sort, internal._created_key(_ipost(post_id, created)), internal.PostId(post_id))
+
+
+@pytest.mark.asyncio
+async def test_UserPosts_CursorInHead_PageAfterCursor(head) :
+	# act
+	posts = await internal._InternalClient().user_posts(1, count=2, cursor=_cursor(internal.PostSort.new, 4, 4))
+
+	# assert
+	assert [post.post_id for post in posts] == [3, 2]
+
+
+@pytest.mark.asyncio
+async def test_UserPosts_CursorPostDeleted_SeeksByKey(head, monkeypatch) :
+	# arrange
+	async def posts(body, auth=None) :
+		return []
+
+	monkeypatch.setattr(internal._InternalClient, '_posts', posts)
+
+	# act
+	posts = await internal._InternalClient().user_posts(1, count=2, cursor=_cursor(internal.PostSort.new, 4, 1))
+
+	# assert
+	assert [post.post_id for post in posts] == [3, 2]
+
+
+@pytest.mark.asyncio
+async def test_UserPosts_CursorSortMismatched_BadRequest(head) :
+	# act
+	with pytest.raises(internal.BadRequest) :
+		await internal._InternalClient().user_posts(1, sort=internal.PostSort.new, cursor=_cursor(internal.PostSort.old, 4, 4))
+
+
+@pytest.mark.asyncio
+async def test_UserPosts_CursorUserMismatched_BadRequest(head) :
+	# arrange
+	internal.PostKVS.put(internal.PostId(9), _ipost(9, 3, user_id=2))
+
+	# act
+	with pytest.raises(internal.BadRequest) :
+		await internal._InternalClient().user_posts(1, cursor=_cursor(internal.PostSort.new, 3, 9))
+
+
+@pytest.fixture
+def dataset(aerospike, monkeypatch) :
+	dataset = fakes.Dataset.generate(users=5, posts=20, tags=10)
+	monkeypatch.setattr(internal, 'DB', fakes.FakeDBI(dataset))
+	monkeypatch.setattr(internal, 'tag_implications', internal.TagImplications())
+	return dataset
+
+
+def _dataset_ipost(dataset, post_id) :
+	return internal.InternalPost.parse_obj(dataset.posts[post_id])
+
+
+@pytest.mark.asyncio
+async def test_Posts_UploaderMissing_Raises(dataset) :
+	# arrange
+	iposts = internal.InternalPosts(post_list=[_dataset_ipost(dataset, 1), _ipost(99, 1, user_id=99)])
+
+	# act
+	with pytest.raises(internal.NotFound) :
+		await iposts.posts(internal._InternalClient(), fakes.StandInUser.viewer())
+
+
+@pytest.mark.asyncio
+async def test_Posts_UploaderMissingWithTimeout_PostOmitted(dataset) :
+	# arrange
+	iposts = internal.InternalPosts(post_list=[_dataset_ipost(dataset, 1), _ipost(99, 1, user_id=99)])
+
+	# act
+	posts = await iposts.posts(internal._InternalClient(), fakes.StandInUser.viewer(), timeout=5)
+
+	# assert
+	assert [post.post_id for post in posts] == [internal.PostId(1)]
+
+
+@pytest.mark.asyncio
+async def test_Posts_UploaderStageAbandoned_ServiceUnavailable(dataset, monkeypatch) :
+	# arrange
+	monkeypatch.setitem(internal.HydrationStages, 'uploader', internal.StagePriority.optional)
+	monkeypatch.setattr(internal, 'DB', fakes.FakeDBI(dataset, Faults(latency=0.05)))
+	iposts = internal.InternalPosts(post_list=[_dataset_ipost(dataset, 1)])
+
+	# act
+	with pytest.raises(internal.ServiceUnavailable) :
+		await iposts.posts(internal._InternalClient(), fakes.StandInUser.viewer(), timeout=0.001)
+
+
+@pytest.mark.asyncio
+async def test_Uploaders_UploaderMissing_LeftOut(dataset) :
+	# arrange
+	ipost = _dataset_ipost(dataset, 1)
+	iposts = internal.InternalPosts(post_list=[ipost, _ipost(99, 1, user_id=99)])
+
+	# act
+	uploaders = await iposts.uploaders(internal._InternalClient(), fakes.StandInUser.viewer())
+
+	# assert
+	assert list(uploaders.keys()) == [ipost.user_id]
+	assert uploaders[ipost.user_id].handle == dataset.users[ipost.user_id]['handle']
+
+
+@pytest.mark.asyncio
+async def test_Uploaders_EveryUploaderMissing_Empty(dataset) :
+	# arrange
+	iposts = internal.InternalPosts(post_list=[_ipost(98, 1, user_id=98), _ipost(99, 1, user_id=99)])
+
+	# act
+	uploaders = await iposts.uploaders(internal._InternalClient(), fakes.StandInUser.viewer())
+
+	# assert
+	assert uploaders == { }
+
+
+@pytest.mark.asyncio
+async def test_Scores_EveryPost_ScoreOrNone(dataset) :
+	# arrange
+	iposts = internal.InternalPosts(post_list=[_dataset_ipost(dataset, 1), _ipost(99, 1, privacy='draft')])
+
+	# act
+	scores = await iposts.scores(internal._InternalClient(), fakes.StandInUser.viewer())
+
+	# assert
+	assert scores[internal.PostId(1)].up == dataset.scores[1][0]
+	assert scores[internal.PostId(99)] is None
+
+
+@pytest.fixture
+def hydrator(dataset, monkeypatch) :
+	hydrator = internal.PostHydrator(window=0.01, max_batch=256)
+	monkeypatch.setattr(internal, 'post_hydrator', hydrator)
+	return hydrator
+
+
+@pytest.mark.asyncio
+async def test_Post_ConcurrentCalls_HydratedInOneBatch(dataset, hydrator) :
+	# arrange
+	client = internal._InternalClient()
+	viewer = fakes.StandInUser.viewer()
+	iposts = [_dataset_ipost(dataset, post_id) for post_id in range(1, 11)]
+
+	# act
+	posts = await gather(*(ipost.post(client, viewer) for ipost in iposts))
+
+	# assert
+	assert [post.post_id for post in posts] == [internal.PostId(post_id) for post_id in range(1, 11)]
+	assert [post.user.handle for post in posts] == [dataset.users[ipost.user_id]['handle'] for ipost in iposts]
+	# uploaders, scores, and tags for the whole batch are fetched in a single combined query
+	assert internal.DB.queries == 1
+
+
+@pytest.mark.asyncio
+async def test_Post_CachesWarm_NoQueries(dataset, hydrator) :
+	# arrange
+	client = internal._InternalClient()
+	viewer = fakes.StandInUser.viewer()
+	ipost = _dataset_ipost(dataset, 1)
+	post_id = internal.PostId(1)
+	internal.TagKVS.put(f'post.{post_id}', internal.TagGroups(dataset.post_tags[1]))
+	internal.UserKVS.put(str(ipost.user_id), internal.DB._users([ipost.user_id])[ipost.user_id])
+	internal.ScoreCache.put(post_id, internal.DB._scores([post_id])[post_id])
+
+	# act
+	posts = [await ipost.post(client, viewer) for _ in range(5)]
+
+	# assert
+	assert posts[-1].user.handle == dataset.users[ipost.user_id]['handle']
+	assert internal.DB.queries == 0
+
+
+@pytest.mark.asyncio
+async def test_Post_MaxBatchReached_FlushedBeforeWindow(dataset, hydrator) :
+	# arrange
+	hydrator.window = 10
+	hydrator.max_batch = 2
+	client = internal._InternalClient()
+	viewer = fakes.StandInUser.viewer()
+
+	# act
+	posts = await internal.wait_for(gather(
+		_dataset_ipost(dataset, 1).post(client, viewer),
+		_dataset_ipost(dataset, 2).post(client, viewer),
+	), 1)
+
+	# assert
+	assert len(posts) == 2
+
+
+@pytest.mark.asyncio
+async def test_Post_SingleCall_FlushedAfterWindow(dataset, hydrator) :
+	# arrange
+	hydrator.window = 0.05
+	loop = internal.get_event_loop()
+	start = loop.time()
+
+	# act
+	post = await _dataset_ipost(dataset, 1).post(internal._InternalClient(), fakes.StandInUser.viewer())
+
+	# assert
+	assert post.post_id == internal.PostId(1)
+	assert loop.time() - start >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_Post_CallerCancelled_BatchCompletes(dataset, hydrator) :
+	# arrange
+	client = internal._InternalClient()
+	viewer = fakes.StandInUser.viewer()
+	cancelled = internal.ensure_future(_dataset_ipost(dataset, 1).post(client, viewer))
+	remaining = internal.ensure_future(_dataset_ipost(dataset, 2).post(client, viewer))
+
+	# act
+	await sleep(0)
+	cancelled.cancel()
+	post = await remaining
+	await gather(*hydrator._tasks)
+
+	# assert
+	assert cancelled.cancelled()
+	assert post.post_id == internal.PostId(2)
+
+
+@pytest.mark.asyncio
+async def test_Post_UploaderMissing_ErrorOnlyRaisedToItsCaller(dataset, hydrator) :
+	# arrange
+	client = internal._InternalClient()
+	viewer = fakes.StandInUser.viewer()
+
+	# act
+	results = await gather(
+		_dataset_ipost(dataset, 1).post(client, viewer),
+		_ipost(99, 1, user_id=99).post(client, viewer),
+		return_exceptions=True,
+	)
+
+	# assert
+	assert results[0].post_id == internal.PostId(1)
+	assert isinstance(results[1], internal.NotFound)
+
+
+@pytest.mark.asyncio
+async def test_Post_DatabaseFails_ErrorPropagatedToEveryCaller(dataset, hydrator) :
+	# arrange
+	internal.DB.faults.error_rate = 1
+	client = internal._InternalClient()
+	viewer = fakes.StandInUser.viewer()
+
+	# act
+	results = await gather(
+		_dataset_ipost(dataset, 1).post(client, viewer),
+		_dataset_ipost(dataset, 2).post(client, viewer),
+		return_exceptions=True,
+	)
+
+	# assert
+	assert all(isinstance(result, fakes.OperationalError) for result in results)
+
+
+@pytest.fixture
+def tag_service(dataset, monkeypatch) :
+	calls = []
+
+	async def _tag(tag, auth=None) :
+		calls.append(tag)
+
+		if tag == 'broken' :
+			raise internal.ClientResponseError(None, (), status=500)
+
+		if tag not in dataset.tags :
+			raise internal.ClientResponseError(None, (), status=404)
+
+		return internal.InternalTag.parse_obj(dataset.tags[tag])
+
+	monkeypatch.setattr(internal._InternalClient, '_tag', _tag)
+	return calls
+
+
+@pytest.mark.asyncio
+async def test_InternalTagsMany_TagMissing_LeftOutAndFoundBackFilled(dataset, tag_service) :
+	# arrange
+	client = internal._InternalClient()
+
+	# act
+	itags = await client.internal_tags_many(['tag1', 'missing', 'tag2'])
+	await internal.write_behind.drain()
+
+	# assert
+	assert set(itags.keys()) == { 'tag1', 'tag2' }
+	assert internal.TagKVS.get('tag.tag1').name == 'tag1'
+	await client.internal_tags_many(['tag1', 'tag2'])
+	assert sorted(tag_service) == ['missing', 'tag1', 'tag2']
+
+
+@pytest.mark.asyncio
+async def test_InternalTagsMany_ServiceError_Raised(dataset, tag_service) :
+	# act
+	with pytest.raises(internal.ClientResponseError) :
+		await internal._InternalClient().internal_tags_many(['tag1', 'broken'])
+
+
+@pytest.mark.asyncio
+async def test_Tag_TagMissing_NotFound(dataset, tag_service) :
+	# act
+	with pytest.raises(internal.NotFound) :
+		await internal._InternalClient().tag('missing')
+
+
+@pytest.mark.asyncio
+async def test_TagsHydrateMany_TagMissing_LeftOutWithCounts(dataset, tag_service) :
+	# act
+	tags = await internal._InternalClient().tags_hydrate_many(fakes.StandInUser.viewer(), ['tag2', 'missing', 'tag1'])
+
+	# assert
+	assert [tag.tag for tag in tags] == ['tag2', 'tag1']
+	assert [tag.count for tag in tags] == [dataset.tag_counts['tag2'], dataset.tag_counts['tag1']]
+
+
+@pytest.mark.asyncio
+async def test_InternalTagTag_CountReadThroughTagCounts(dataset, tag_service) :
+	# arrange
+	client = internal._InternalClient()
+	itag = await client.tag('tag3')
+
+	# act
+	tag = await itag.tag(client, fakes.StandInUser.viewer())
+
+	# assert
+	assert tag.count == dataset.tag_counts['tag3']
+	assert internal.DB.queries == 1
+
+
+@pytest.mark.asyncio
+async def test_Posts_PostTagIndex_OnlyPublicPostsIndexed(dataset, monkeypatch) :
+	# arrange
+	index = internal.PostTagIndex()
+	monkeypatch.setattr(internal, 'post_tag_index', index)
+	public = _dataset_ipost(dataset, 1)
+	private = _dataset_ipost(dataset, 2)
+	private.privacy = internal.Privacy.private
+	index.update(internal.PostId(2), ['stale'])
+
+	# act
+	await internal.InternalPosts(post_list=[public, private]).posts(internal._InternalClient(), fakes.StandInUser.viewer())
+
+	# assert
+	assert internal.PostId(1) in index
+	assert internal.PostId(2) not in index
+	assert index.query(['stale']) == []
+
+
+@pytest.mark.asyncio
+async def test_PostBlocked_ImpliedTagBlocked(dataset) :
+	# arrange
+	dataset.inheritance = [('wolf', 'canine'), ('canine', 'mammal')]
+	internal.UserConfigKVS.put('user.1', internal.UserConfig(blocked_tags=[['mammal']]))
+	client = internal._InternalClient()
+	viewer = fakes.StandInUser.viewer(1)
+
+	# act
+	tree, user_config = await internal.fetch_block_tree(client, viewer)
+
+	# assert
+	assert internal.post_blocked(tree, user_config, 'user2', 2, ['wolf'])
+	assert not internal.post_blocked(tree, user_config, 'user2', 2, ['fox'])
+	assert await internal.is_post_blocked(client, viewer, 'user2', 2, ['canine', 'forest'])
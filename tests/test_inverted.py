@@ -0,0 +1,126 @@
+from random import Random
+
+from fuzzly.local.bitmap import ArrayLimit, Bitmap
+from fuzzly.local.implications import TagImplications
+from fuzzly.local.inverted import PostTagIndex
+from fuzzly.models._shared import PostId
+
+
+def post(i: int) -> PostId :
+	return PostId(i)
+
+
+class TestBitmap :
+
+	def test_SetOperations_SparseAndDense_MatchPythonSets(self) :
+		# arrange
+		random = Random(0)
+		a = set(random.sample(range(200000), ArrayLimit * 3))
+		b = set(random.sample(range(200000), 100)) | set(range(65536, 65536 + ArrayLimit * 2))
+
+		# act
+		x, y = Bitmap(a), Bitmap(b)
+
+		# assert
+		assert list(x) == sorted(a)
+		assert len(x) == len(a)
+		assert list(x & y) == sorted(a & b)
+		assert list(x | y) == sorted(a | b)
+		assert list(x - y) == sorted(a - b)
+		assert list(y - x) == sorted(b - a)
+
+
+	def test_Discard_DenseChunk_ShrinksBackToArray(self) :
+		# arrange
+		bitmap = Bitmap(range(ArrayLimit + 10))
+
+		# act
+		for i in range(ArrayLimit + 10) :
+			bitmap.discard(i)
+
+		# assert
+		assert not bitmap
+		assert len(bitmap) == 0
+		assert 5 not in bitmap
+
+
+class TestPostTagIndex :
+
+	def test_Query_AndNot_ReturnsMatchingPosts(self) :
+		# arrange
+		index = PostTagIndex()
+		index.update_many({
+			post(1): ['wolf', 'forest'],
+			post(2): ['wolf', 'snow'],
+			post(3): ['fox', 'forest'],
+		})
+
+		# act + assert
+		assert index.query(['wolf']) == [post(1), post(2)]
+		assert index.query(['wolf', 'forest']) == [post(1)]
+		assert index.query(['forest', '-wolf']) == [post(3)]
+		assert index.query(['-forest']) == [post(2)]
+		assert index.query(['wolf', 'missing']) == []
+
+
+	def test_Update_ReplacesTagsAndRemoves(self) :
+		# arrange
+		index = PostTagIndex()
+		index.update(post(1), ['wolf'])
+
+		# act
+		index.update(post(1), ['fox'])
+		index.update(post(2), ['fox'])
+		index.remove(post(2))
+
+		# assert
+		assert index.query(['wolf']) == []
+		assert index.query(['fox']) == [post(1)]
+		assert index.count('fox') == 1
+		assert len(index) == 1
+
+
+	def test_Update_WithImplications_IndexesImpliedTags(self) :
+		# arrange
+		implications = TagImplications()
+		implications.load([('wolf', 'canine')])
+		index = PostTagIndex(implications)
+
+		# act
+		index.update(post(1), ['wolf'])
+
+		# assert
+		assert index.query(['canine']) == [post(1)]
+
+
+	def test_Update_PastMaxPosts_EvictsLeastRecentlyUpdated(self) :
+		# arrange
+		index = PostTagIndex(max_posts=2)
+		index.update(post(1), ['wolf'])
+		index.update(post(2), ['wolf'])
+		index.update(post(1), ['wolf', 'forest'])
+
+		# act
+		index.update(post(3), ['wolf'])
+
+		# assert
+		assert len(index) == 2
+		assert post(2) not in index
+		assert sorted(index.query(['wolf'])) == sorted([post(1), post(3)])
+		assert index.query(['forest']) == [post(1)]
+
+
+	def test_Remove_ThenUpdate_SlotReused(self) :
+		# arrange
+		index = PostTagIndex()
+		index.update(post(1), ['wolf'])
+		index.update(post(2), ['fox'])
+
+		# act
+		index.remove(post(1))
+		index.update(post(3), ['fox'])
+
+		# assert
+		assert len(index._post_ids) == 2
+		assert sorted(index.query(['fox'])) == sorted([post(2), post(3)])
+		assert index.query(['-wolf']) == index.query(['fox'])
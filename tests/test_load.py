@@ -0,0 +1,150 @@
+from asyncio import Lock, sleep
+
+import pytest
+from aiohttp import ClientSession
+
+from fuzzly import FuzzlyClient
+from fuzzly.constants import PostHost
+from fuzzly.models.post import Post, PostId
+from fuzzly.testing.dataset import Dataset
+from fuzzly.testing.faults import Faults
+from fuzzly.testing.load import Workloads, percentile, run_load
+from fuzzly.testing.services import StandInServices
+
+
+def test_Percentile_NearestRank() :
+	latencies = [float(i) for i in range(1, 101)]
+	assert percentile(latencies, 50) == 50
+	assert percentile(latencies, 99) == 99
+	assert percentile(latencies, 100) == 100
+	assert percentile([], 50) == 0
+
+
+def test_Dataset_SameSeed_SameData() :
+	a = Dataset.generate(users=10, posts=100, tags=20, seed=1)
+	b = Dataset.generate(users=10, posts=100, tags=20, seed=1)
+	assert a.posts == b.posts
+	assert a.post_tags == b.post_tags
+	assert a.votes == b.votes
+
+
+@pytest.mark.asyncio
+async def test_RunLoad_Requests_CountsErrors() :
+	# arrange
+	async def workload(i) :
+		await sleep(0)
+
+		if i % 4 == 0 :
+			raise ValueError()
+
+	# act
+	report = await run_load(workload, concurrency=4, duration=None, requests=20)
+
+	# assert
+	assert report.requests == 20
+	assert report.errors == 5
+	assert report.p50 <= report.p99 <= report.max
+
+
+@pytest.mark.asyncio
+async def test_StandInServices_FuzzlyClient_ServesDatasetAndInjectsFaults() :
+	# arrange
+	dataset = Dataset.generate(users=5, posts=20, tags=10)
+	client = FuzzlyClient()
+
+	async with StandInServices(dataset, { 'TagHost': Faults(error_rate=1, error_status=404) }) as services :
+		# act
+		post: Post = await client.post(PostId(3))
+
+		with pytest.raises(Exception) :
+			await client.post_tags(PostId(3))
+
+	# assert
+	assert post.post_id == PostId(3)
+	assert post.user.handle == dataset.users[dataset.posts[3]['user_id']]['handle']
+	assert services.requests['PostHost'] == 1
+	assert services.requests['TagHost'] == 1
+
+
+@pytest.mark.asyncio
+async def test_StandInServices_BulkPosts_SkipsMissingPosts() :
+	# arrange
+	dataset = Dataset.generate(users=5, posts=20, tags=10)
+
+	async with StandInServices(dataset) as services :
+		async with ClientSession() as session :
+			# act
+			async with session.post(PostHost + '/i1/posts', json={ 'post_ids': [PostId(3), PostId(1), PostId(1000)] }) as response :
+				posts = await response.json()
+
+	# assert
+	assert [post['post_id'] for post in posts] == [3, 1]
+	assert services.requests['PostHost'] == 1
+
+
+
+@pytest.fixture
+def installed(monkeypatch) :
+	# install replaces module level state, which is restored once the test completes
+	internal = pytest.importorskip('fuzzly.models.internal', exc_type=ImportError)
+	from kh_common.caching.key_value_store import KeyValueStore
+	monkeypatch.setattr(KeyValueStore, '_client', KeyValueStore._client)
+	monkeypatch.setattr(internal, 'DB', internal.DB)
+	monkeypatch.setattr(internal, 'tag_implications', internal.TagImplications())
+	monkeypatch.setattr(internal, 'post_hydrator', internal.PostHydrator())
+	monkeypatch.setattr(internal, '_follow_sets', internal.OrderedDict())
+	monkeypatch.setattr(internal, '_vote_maps', internal.OrderedDict())
+	monkeypatch.setattr(internal, '_block_trees', internal.OrderedDict())
+
+	for name in ['user_config', 'user', 'post_tags', 'post'] :
+		monkeypatch.setattr(getattr(internal._InternalClient, name).cache, '_local', internal.OrderedDict())
+
+	# each test runs in its own event loop, and the kvs locks are bound to the first loop that waits on them
+	for kvs in vars(internal).values() :
+		if isinstance(kvs, KeyValueStore) :
+			monkeypatch.setattr(kvs, '_cache', { })
+			monkeypatch.setattr(kvs, '_get_lock', Lock())
+			monkeypatch.setattr(kvs, '_get_many_lock', Lock())
+
+	return internal
+
+
+@pytest.mark.asyncio
+async def test_Install_InternalModels_ServedFromFakes(installed) :
+	# arrange
+	from kh_common.caching.key_value_store import KeyValueStore
+
+	from fuzzly.testing.fakes import StandInUser, install
+	dataset = Dataset.generate(users=5, posts=20, tags=10)
+	dataset.inheritance = [('tag1', 'tag2')]
+	client = installed._InternalClient()
+	iposts = [installed.InternalPost.parse_obj(dataset.posts[post_id]) for post_id in [1, 2]]
+
+	async with StandInServices(dataset) :
+		# act
+		kvs, db = install(dataset)
+		post = await iposts[0].post(client, StandInUser.viewer())
+		posts = await installed.InternalPosts(post_list=iposts).posts(client, StandInUser.viewer(1))
+
+	# assert
+	assert KeyValueStore._client is kvs
+	assert installed.DB is db
+	assert installed.tag_implications.implied('tag1') == { 'tag2' }
+	assert post.user.handle == dataset.users[iposts[0].user_id]['handle']
+	assert [post.post_id for post in posts] == [PostId(1), PostId(2)]
+	assert db.queries
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('workload', ['internal_post', 'hydrate_page', 'posts_many', 'user_posts'])
+async def test_RunLoad_InternalWorkloads_NoErrors(installed, workload) :
+	# arrange
+	dataset = Dataset.generate(users=5, posts=100, tags=20)
+
+	async with StandInServices(dataset) :
+		# act
+		report = await run_load(Workloads[workload](dataset), concurrency=4, duration=None, requests=20, name=workload)
+
+	# assert
+	assert report.requests == 20
+	assert report.errors == 0
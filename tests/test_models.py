@@ -1,8 +1,10 @@
+from datetime import datetime, timezone
 from typing import Any
 
 import pytest
 
-from fuzzly.models.post import PostId
+from fuzzly.models._shared import UserPortable, UserPrivacy
+from fuzzly.models.post import FetchPostsRequest, MediaType, Post, PostBatch, PostCursor, PostId, PostProjection, PostSize, PostSort, Privacy, Rating, Score
 
 
 @pytest.mark.parametrize(
@@ -25,3 +27,127 @@ def test_PostId_ValidValue(value: Any, expected: str) :
 def test_PostId_InvalidValue(value: Any) :
 	with pytest.raises(ValueError) :
 		assert PostId(value)
+
+
+@pytest.mark.parametrize(
+	'sort, key, post_id',
+	[
+		(PostSort.new, 1672531200000000, 'JPIlC520'),
+		(PostSort.top, -5, 'AAAAAAAA'),
+		(PostSort.controversial, 2**63-1, '________'),
+	]
+)
+def test_PostCursor_EncodeDecode(sort: PostSort, key: int, post_id: str) :
+	cursor: PostCursor = PostCursor.encode(sort, key, post_id)
+	assert PostCursor(str(cursor)).decode() == (sort, key, post_id)
+
+
+def test_PostCursor_FromPost_SortedByCreated() :
+	created: datetime = datetime(2023, 1, 1, tzinfo=timezone.utc)
+	post = type('Post', (), { 'post_id': PostId('JPIlC520'), 'created': created, 'score': None })
+	assert PostCursor.from_post(PostSort.new, post).decode() == (PostSort.new, 1672531200000000, 'JPIlC520')
+
+
+@pytest.mark.parametrize(
+	'value',
+	['', 'abcd', 'AAAAAAAAAAB7JPIlC52', '_wAAAAAAAAB7JPIlC520', 5]
+)
+def test_PostCursor_InvalidValue(value: Any) :
+	with pytest.raises((ValueError, NotImplementedError)) :
+		assert PostCursor(value)
+
+
+def test_FetchPostsRequest_ConvertsCursor() :
+	cursor: PostCursor = PostCursor.encode(PostSort.new, 123, 'JPIlC520')
+	request: FetchPostsRequest = FetchPostsRequest(sort='new', cursor=str(cursor))
+	assert type(request.cursor) == PostCursor
+	assert request.cursor.decode() == (PostSort.new, 123, 'JPIlC520')
+
+
+def _post_batch() -> PostBatch :
+	batch: PostBatch = PostBatch()
+	batch.add_user(1, UserPortable(name='one', handle='one', privacy=UserPrivacy.public, icon=None, verified=None, following=None))
+
+	for post_id in range(3) :
+		batch.append(
+			post_id=post_id,
+			title=f'post {post_id}',
+			description=None,
+			user_id=1,
+			score=Score(up=post_id, down=0, total=post_id, user_vote=1) if post_id else None,
+			rating=Rating.general,
+			parent=0 if post_id else None,
+			privacy=Privacy.public,
+			created=datetime(2023, 1, 1, tzinfo=timezone.utc),
+			updated=None,
+			filename='a.png',
+			media_type=MediaType(file_type='png', mime_type='image/png'),
+			size=PostSize(width=10, height=20) if post_id else None,
+			blocked=post_id == 2,
+		)
+
+	return batch
+
+
+def test_PostBatch_Access_MaterializesPosts() :
+	batch: PostBatch = _post_batch()
+	assert len(batch) == 3
+	assert batch[0] == Post(
+		post_id='AAAAAAAA',
+		title='post 0',
+		description=None,
+		user=batch.users[1],
+		score=None,
+		rating=Rating.general,
+		parent=None,
+		privacy=Privacy.public,
+		created=datetime(2023, 1, 1, tzinfo=timezone.utc),
+		updated=None,
+		filename='a.png',
+		media_type=MediaType(file_type='png', mime_type='image/png'),
+		size=None,
+		blocked=False,
+	)
+	assert batch[-1].score == Score(up=2, down=0, total=2, user_vote=1)
+	assert batch[-1].parent == PostId(0)
+	assert batch[-1].size == PostSize(width=10, height=20)
+	assert batch[-1].blocked
+	assert [post.title for post in batch[1:]] == ['post 1', 'post 2']
+
+
+def test_PostBatch_Posts_ShareUploaderAndMediaType() :
+	batch: PostBatch = _post_batch()
+	posts = batch.posts()
+	assert posts[0].user is posts[1].user is posts[2].user
+	assert posts[0].media_type is posts[2].media_type
+
+
+def test_PostBatch_Json_MatchesPostJson() :
+	batch: PostBatch = _post_batch()
+	assert batch.json() == '[' + ','.join(post.json() for post in batch.posts()) + ']'
+	assert batch.dict()[1]['score'] == { 'up': 1, 'down': 0, 'total': 1, 'user_vote': 1 }
+
+
+def test_PostProjection_Contains_IncludesParentsAndSubfields() :
+	projection: PostProjection = PostProjection(['post_id', 'user.handle', 'score'])
+	assert 'post_id' in projection
+	assert 'user' in projection
+	assert 'user.handle' in projection
+	assert 'user.following' not in projection
+	assert 'score.user_vote' in projection
+	assert 'blocked' not in projection
+
+
+@pytest.mark.parametrize(
+	'field',
+	['nope', 'title.length', 'user.nope'],
+)
+def test_PostProjection_UnknownField_Raises(field: str) :
+	with pytest.raises(ValueError) :
+		PostProjection([field])
+
+
+def test_PostBatch_Projection_OnlyRequestedFieldsSet() :
+	batch: PostBatch = _post_batch()
+	batch.projection = PostProjection(['post_id', 'user.handle', 'blocked'])
+	assert batch[2].dict(exclude_unset=True) == { 'post_id': 'AAAAAAAC', 'user': { 'handle': 'one' }, 'blocked': True }
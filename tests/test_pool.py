@@ -0,0 +1,164 @@
+from asyncio import gather, sleep
+
+import pytest
+from psycopg2 import OperationalError
+from psycopg2.extensions import POLL_OK
+
+from fuzzly.models import _pool
+from fuzzly.models._pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor :
+
+	def __init__(self, conn) :
+		self.conn = conn
+
+	def execute(self, sql, params=None) :
+		if sql == 'fail' :
+			self.conn.closed = 1
+			raise OperationalError('connection lost')
+
+		self.conn.queries.append(sql)
+
+	def fetchall(self) :
+		return [(1,)]
+
+	def close(self) :
+		pass
+
+
+class FakeConnection :
+
+	def __init__(self, *args, **kwargs) :
+		self.closed = 0
+		self.queries = []
+
+	def poll(self) :
+		return POLL_OK
+
+	def cursor(self) :
+		return FakeCursor(self)
+
+	def close(self) :
+		self.closed = 1
+
+
+@pytest.fixture(autouse=True)
+def fake_connect(monkeypatch) :
+	monkeypatch.setattr(_pool, 'dbConnect', FakeConnection)
+
+
+@pytest.mark.asyncio
+async def test_Execute_Concurrent_BoundedByMaxSize() :
+	# arrange
+	pool = ConnectionPool({ }, max_size=2)
+	in_use = []
+
+	async def query() :
+		conn = await pool.acquire()
+		in_use.append(pool.stats().in_use)
+		await sleep(0.01)
+		pool.release(conn)
+
+	# act
+	await gather(*[query() for _ in range(10)])
+
+	# assert
+	stats = pool.stats()
+	assert max(in_use) == 2
+	assert stats.size == 2
+	assert stats.idle == 2
+	assert stats.acquired == 10
+
+
+@pytest.mark.asyncio
+async def test_Acquire_PoolExhausted_RaisesPoolTimeout() :
+	# arrange
+	pool = ConnectionPool({ }, max_size=1, acquire_timeout=0.01)
+	conn = await pool.acquire()
+
+	# act
+	with pytest.raises(PoolTimeout) :
+		await pool.acquire()
+
+	# assert
+	pool.release(conn)
+	assert pool.stats().timeouts == 1
+	assert await pool.execute('select', fetch_all=True) == [(1,)]
+
+
+@pytest.mark.asyncio
+async def test_Execute_ConnectionError_DiscardsConnection() :
+	# arrange
+	pool = ConnectionPool({ }, min_size=1)
+	await pool.open()
+
+	# act
+	with pytest.raises(OperationalError) :
+		await pool.execute('fail')
+
+	# assert
+	stats = pool.stats()
+	assert stats.size == 0
+	assert stats.idle == 0
+
+
+@pytest.mark.asyncio
+async def test_Acquire_FirstUse_OpensMinSize() :
+	# arrange
+	pool = ConnectionPool({ }, min_size=3, max_size=5)
+
+	# act
+	pool.release(await pool.acquire())
+	await sleep(0)
+
+	# assert
+	stats = pool.stats()
+	assert stats.size == 3
+	assert stats.idle == 3
+
+
+@pytest.mark.asyncio
+async def test_Release_IdlePastTimeout_TrimmedToMinSize() :
+	# arrange
+	pool = ConnectionPool({ }, min_size=1, max_size=4, idle_timeout=0.01)
+	conns = [await pool.acquire() for _ in range(4)]
+
+	for conn in conns :
+		pool.release(conn)
+
+	# act
+	await sleep(0.02)
+	pool.release(await pool.acquire())
+
+	# assert
+	stats = pool.stats()
+	assert stats.size == 1
+	assert stats.idle == 1
+	assert sum(conn.closed for conn in conns) == 3
+
+
+@pytest.mark.asyncio
+async def test_Connect_WaitFails_ConnectionClosed(monkeypatch) :
+	# arrange
+	conns = []
+
+	class FailingConnection(FakeConnection) :
+
+		def __init__(self, *args, **kwargs) :
+			super().__init__()
+			conns.append(self)
+
+		def poll(self) :
+			raise OperationalError('connection refused')
+
+	monkeypatch.setattr(_pool, 'dbConnect', FailingConnection)
+	pool = ConnectionPool({ }, min_size=0)
+
+	# act
+	with pytest.raises(OperationalError) :
+		await pool.acquire()
+
+	# assert
+	assert conns[0].closed
+	assert pool.stats().size == 0
@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+
+from fuzzly.local.ranking import controversial, hot, rank, rank_page, wilson
+from fuzzly.models.post import PostId, PostSort
+
+
+def post(post_id: int, created: datetime = None) -> SimpleNamespace :
+	return SimpleNamespace(post_id=post_id, created=created)
+
+
+def score(up: int, down: int) -> SimpleNamespace :
+	return SimpleNamespace(up=up, down=down, total=up + down)
+
+
+@pytest.mark.parametrize(
+	'up, down, expected',
+	[
+		(0, 0, 0),
+		(1, 0, 0.2065),
+		(10, 0, 0.7225),
+		(50, 50, 0.4038),
+	]
+)
+def test_Wilson_KnownValues(up: int, down: int, expected: float) :
+	assert wilson([up], [down])[0] == pytest.approx(expected, abs=1e-4)
+
+
+def test_Hot_NewerPostsNeedFewerVotes() :
+	scores = hot([10, 100], [0, 0], [90000, 45000])
+	assert scores[0] == pytest.approx(scores[1])
+
+
+def test_Controversial_PrefersEvenSplits() :
+	scores = controversial([10, 10, 10], [10, 1, 0])
+	assert scores[0] > scores[1] > scores[2] == 0
+
+
+@pytest.mark.parametrize(
+	'sort, expected',
+	[
+		(PostSort.new, [3, 2, 1]),
+		(PostSort.old, [1, 2, 3]),
+		(PostSort.top, [2, 1, 3]),
+		(PostSort.best, [2, 1, 3]),
+		(PostSort.controversial, [3, 1, 2]),
+	]
+)
+def test_Rank_SortOrders(sort: PostSort, expected: List[int]) :
+	posts = [post(i, datetime(2023, 1, i, tzinfo=timezone.utc)) for i in range(1, 4)]
+	scores = {
+		PostId(1): score(5, 1),
+		PostId(2): score(20, 0),
+		PostId(3): score(6, 6),
+	}
+	assert [p.post_id for p in rank(posts, scores, sort)] == expected
+
+
+def test_RankPage_TiesBrokenByPostId() :
+	posts = [post(i) for i in range(10)]
+	assert [p.post_id for p in rank_page(posts, { }, PostSort.top, count=3, page=2)] == [6, 5, 4]
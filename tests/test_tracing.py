@@ -0,0 +1,135 @@
+import json
+from asyncio import ensure_future, gather, sleep
+
+import pytest
+
+from fuzzly.tracing import ChromeTraceSink, MemorySink, Span, Tracer, current_span
+
+
+@pytest.mark.asyncio
+async def test_Span_Nested_SharesTraceWithParent() :
+	# arrange
+	sink = MemorySink()
+	tracer = Tracer(sample_rate=1, sinks=[sink])
+
+	# act
+	with tracer.span('root') as root :
+		with tracer.span('child', { 'a': 1 }) as child :
+			child.set(b=2)
+
+	# assert
+	assert len(sink.traces) == 1
+	spans = sink.traces[0]
+	assert [span.name for span in spans] == ['root', 'child']
+	assert child.trace_id == root.trace_id
+	assert child.parent_id == root.span_id
+	assert child.attributes == { 'a': 1, 'b': 2 }
+	assert root.duration >= child.duration
+	assert current_span() is None
+
+
+@pytest.mark.asyncio
+async def test_Span_ConcurrentTasks_FollowContext() :
+	# arrange
+	sink = MemorySink()
+	tracer = Tracer(sample_rate=1, sinks=[sink])
+
+	@tracer.traced('work')
+	async def work() -> int :
+		await sleep(0.01)
+		return current_span().parent_id
+
+	# act
+	with tracer.span('root') as root :
+		parents = await gather(ensure_future(work()), work())
+
+	# assert
+	assert parents == [root.span_id, root.span_id]
+	spans = sink.traces[0]
+	assert [span.name for span in spans] == ['root', 'work', 'work']
+	assert spans[1].lane != spans[2].lane
+
+
+@pytest.mark.asyncio
+async def test_Span_NotSampled_NothingRecorded() :
+	# arrange
+	sink = MemorySink()
+	tracer = Tracer(sample_rate=0, sinks=[sink])
+
+	# act
+	with tracer.span('root') :
+		with tracer.span('child') :
+			assert current_span() is None
+
+	# assert
+	assert len(sink.traces) == 0
+
+
+@pytest.mark.asyncio
+async def test_Span_Forced_RecordedWhileDisabled() :
+	# arrange
+	sink = MemorySink()
+	tracer = Tracer(sample_rate=0, sinks=[sink])
+
+	# act
+	with tracer.span('root', force=True) :
+		with tracer.span('child') :
+			assert isinstance(current_span(), Span)
+
+	# assert
+	assert [span.name for span in sink.traces[0]] == ['root', 'child']
+
+
+@pytest.mark.asyncio
+async def test_Span_UnsampledTrace_ChildrenNotRecorded() :
+	# arrange
+	sink = MemorySink()
+	tracer = Tracer(sample_rate=0.000001, sinks=[sink])
+
+	# act
+	for _ in range(10) :
+		with tracer.span('root') :
+			# a forced child of an unsampled trace doesn't start a trace of its own
+			with tracer.span('child', force=True) :
+				pass
+
+	# assert
+	assert len(sink.traces) == 0
+
+
+@pytest.mark.asyncio
+async def test_Span_Raises_ErrorRecorded() :
+	# arrange
+	sink = MemorySink()
+	tracer = Tracer(sample_rate=1, sinks=[sink])
+
+	# act
+	with pytest.raises(ValueError) :
+		with tracer.span('root') :
+			raise ValueError()
+
+	# assert
+	assert sink.traces[0][0].error == 'ValueError'
+
+
+@pytest.mark.asyncio
+async def test_ChromeTraceSink_Flush_WritesEvents(tmp_path) :
+	# arrange
+	path = tmp_path / 'trace.json'
+	sink = ChromeTraceSink(str(path))
+	tracer = Tracer(sample_rate=1, sinks=[sink])
+
+	# act
+	with tracer.span('root') :
+		with tracer.span('child', { 'rows': 3 }) :
+			pass
+
+	sink.flush()
+
+	# assert
+	events = json.loads(path.read_text())['traceEvents']
+	assert [event['name'] for event in events] == ['process_name', 'root', 'child']
+	assert events[2]['ph'] == 'X'
+	assert events[2]['args'] == { 'rows': 3 }
+	assert events[1]['pid'] == events[2]['pid']
+	assert events[1]['dur'] >= events[2]['dur']
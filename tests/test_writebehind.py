@@ -0,0 +1,129 @@
+from asyncio import ensure_future, sleep
+
+import pytest
+
+from fuzzly.models._writebehind import WriteBehind
+
+
+class FakeKVS :
+
+	def __init__(self, fail: bool = False) :
+		self.data = { }
+		self.puts = 0
+		self.fail = fail
+
+	def put(self, key, data, TTL = 0) :
+		self.puts += 1
+
+		if self.fail :
+			raise ValueError()
+
+		self.data[key] = data
+
+
+@pytest.mark.asyncio
+async def test_Put_SameKey_Coalesced() :
+	# arrange
+	kvs = FakeKVS()
+	queue = WriteBehind(interval=0.01)
+
+	# act
+	for i in range(5) :
+		await queue.put(kvs, 'key', i)
+
+	await queue.drain()
+
+	# assert
+	assert kvs.data == { 'key': 4 }
+	assert kvs.puts == 1
+	assert queue.stats().coalesced == 4
+
+
+@pytest.mark.asyncio
+async def test_Put_ManyKeys_WrittenInBatches() :
+	# arrange
+	kvs = FakeKVS()
+	queue = WriteBehind(batch_size=10, interval=0.01)
+
+	# act
+	for i in range(25) :
+		queue.put_nowait(kvs, str(i), i)
+
+	await queue.drain()
+
+	# assert
+	assert len(kvs.data) == 25
+	assert queue.stats().flushes == 3
+	assert queue.stats().depth == 0
+
+
+@pytest.mark.asyncio
+async def test_PutNowait_QueueFull_Dropped() :
+	# arrange
+	kvs = FakeKVS()
+	queue = WriteBehind(interval=0.01, max_size=2)
+
+	# act
+	results = [queue.put_nowait(kvs, str(i), i) for i in range(3)]
+	await queue.drain()
+
+	# assert
+	assert results == [True, True, False]
+	assert queue.stats().dropped == 1
+	assert kvs.data == { '0': 0, '1': 1 }
+
+
+@pytest.mark.asyncio
+async def test_Put_QueueFull_WaitsForRoom() :
+	# arrange
+	kvs = FakeKVS()
+	queue = WriteBehind(batch_size=10, interval=0.01, max_size=2)
+	queue.put_nowait(kvs, '0', 0)
+	queue.put_nowait(kvs, '1', 1)
+
+	# act
+	waiting = ensure_future(queue.put(kvs, '2', 2))
+	await sleep(0)
+	blocked = not waiting.done()
+	await waiting
+	await queue.drain()
+
+	# assert
+	assert blocked
+	assert kvs.data == { '0': 0, '1': 1, '2': 2 }
+	assert queue.stats().dropped == 0
+
+
+@pytest.mark.asyncio
+async def test_Put_KVSFails_CountedNotRaised() :
+	# arrange
+	kvs = FakeKVS(fail=True)
+	queue = WriteBehind(interval=0.01)
+
+	# act
+	await queue.put(kvs, 'key', 1)
+	await queue.drain()
+
+	# assert
+	assert queue.stats().failed == 1
+	assert queue.stats().written == 0
+
+
+@pytest.mark.asyncio
+async def test_Put_IfAbsent_ExistingValueKept(monkeypatch) :
+	# arrange
+	fakes = pytest.importorskip('fuzzly.testing.fakes', exc_type=ImportError)
+	from kh_common.caching.key_value_store import KeyValueStore
+	monkeypatch.setattr(KeyValueStore, '_client', fakes.FakeAerospike())
+	kvs = KeyValueStore('kheina', 'test')
+	kvs.put('existing', 1)
+	queue = WriteBehind(interval=0.01)
+
+	# act
+	queue.put_nowait(kvs, 'existing', 2, if_absent=True)
+	queue.put_nowait(kvs, 'missing', 3, if_absent=True)
+	await queue.drain()
+
+	# assert
+	assert KeyValueStore._client.records[('kheina', 'test', 'existing')] == { 'data': 1 }
+	assert kvs.get('missing') == 3